@@ -0,0 +1,60 @@
+import numpy
+import threading
+
+
+class ActiveNotes(object):
+    """Multiset of the MIDI notes currently being played, with the number of times each note has been added by each
+    source (e.g. Push pads or a MIDI input port).
+
+    Notes are stored in arrays of 128 counters per source plus an aggregate array of counters for all sources and a
+    bitmap of the notes being played by any source, so adding, removing and querying notes and clearing all of them
+    don't depend on the number of notes being played.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.source_counts = {}  # source -> 128 counters
+        self.counts = numpy.zeros(128, dtype=numpy.int32)
+        self.bitmap = numpy.zeros(128, dtype=bool)
+
+    def add(self, midi_note, source):
+        if not 0 <= midi_note < 128:
+            return
+        with self.lock:
+            source_counts = self.source_counts.get(source, None)
+            if source_counts is None:
+                source_counts = numpy.zeros(128, dtype=numpy.int32)
+                self.source_counts[source] = source_counts
+            source_counts[midi_note] += 1
+            self.counts[midi_note] += 1
+            self.bitmap[midi_note] = True
+
+    def remove(self, midi_note, source):
+        # Removes all the occurrences of midi_note added by source
+        if not 0 <= midi_note < 128:
+            return
+        with self.lock:
+            source_counts = self.source_counts.get(source, None)
+            if source_counts is None or source_counts[midi_note] == 0:
+                return
+            self.counts[midi_note] -= source_counts[midi_note]
+            source_counts[midi_note] = 0
+            self.bitmap[midi_note] = self.counts[midi_note] > 0
+
+    def clear(self):
+        with self.lock:
+            for source_counts in self.source_counts.values():
+                source_counts[:] = 0
+            self.counts[:] = 0
+            self.bitmap[:] = False
+
+    def is_being_played(self, midi_note):
+        return 0 <= midi_note < 128 and bool(self.bitmap[midi_note])
+
+    def get_bitmap(self):
+        # Returns a copy of the bitmap of notes being played (for rendering without it changing in the meantime)
+        with self.lock:
+            return self.bitmap.copy()
+
+    def __len__(self):
+        return int(self.counts.sum())
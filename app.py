@@ -1,13 +1,12 @@
 import json
 import os
 import platform
+import threading
 import time
 import traceback
 
-import cairo
 import definitions
 import mido
-import numpy
 import push2_python
 
 from melodic_mode import MelodicMode
@@ -21,7 +20,16 @@ from midi_cc_mode import MIDICCMode
 from preset_selection_mode import PresetSelectionMode
 from ddrm_tone_selector_mode import DDRMToneSelectorMode
 
-from display_utils import show_notification
+from display_utils import show_notification, RecordingContext, set_render_quality, apply_render_quality, set_display_backend
+from frame_buffer import FrameBufferManager
+from led_shadow import LEDShadow
+from push_state import PushDeviceState
+from notification_overlay import NotificationOverlay
+from display_pipeline import DisplayPipeline
+from display_renderer import DisplayRendererProcess
+from frame_rate_governor import FrameRateGovernor
+from frame_scheduler import DeadlineScheduler
+from render_quality import RenderQualityController
 
 
 class PyshaApp(object):
@@ -30,6 +38,7 @@ class PyshaApp(object):
     midi_out = None
     available_midi_out_device_names = []
     midi_out_channel = 0  # 0-15
+    midi_out_effective_channel = None  # Cached channel to which messages are sent (see get_midi_out_channel)
     midi_out_tmp_device_idx = None  # This is to store device names while rotating encoders
 
     midi_in = None
@@ -42,8 +51,18 @@ class PyshaApp(object):
 
     # push
     push = None
+    leds = None
+    push_state = None
     use_push2_display = None
     target_frame_rate = None
+    display_backend = None
+    frame_buffers = None
+    display_pipeline = None
+    use_display_renderer_process = False
+    display_renderer_process = None
+    frame_rate_governor = None
+    control_loop_scheduler = None
+    render_quality_controller = None
 
     # frame rate measurements
     actual_frame_rate = 0
@@ -59,6 +78,8 @@ class PyshaApp(object):
     # notifications
     notification_text = None
     notification_time = 0
+    notification_lock = None
+    notification_overlay = None
 
     # fixing issue with 2 lumis and alternating channel pressure values
     last_cp_value_recevied = 0
@@ -74,13 +95,26 @@ class PyshaApp(object):
         self.set_midi_out_channel(settings.get('midi_out_default_channel', 0))
         self.target_frame_rate = settings.get('target_frame_rate', 60)
         self.use_push2_display = settings.get('use_push2_display', True)
+        self.frame_rate_governor = FrameRateGovernor(self, settings=settings)
+        self.render_quality_controller = RenderQualityController(settings=settings)
+        self.display_backend = set_display_backend(settings.get('display_backend', definitions.DISPLAY_BACKEND_CAIRO))
+        self.frame_buffers = FrameBufferManager()
+        self.use_display_renderer_process = settings.get('use_display_renderer_process', False)
+        if self.use_display_renderer_process and self.display_backend == definitions.DISPLAY_BACKEND_CAIRO:
+            self.display_renderer_process = DisplayRendererProcess(self.frame_buffers.width, self.frame_buffers.height)
+        self.notification_lock = threading.Lock()
+        self.notification_overlay = NotificationOverlay(self.frame_buffers.width, self.frame_buffers.height)
 
         self.init_midi_in(device_name=settings.get('default_midi_in_device_name', None))
         self.init_midi_out(device_name=settings.get('default_midi_out_device_name', None))
         self.init_notes_midi_in(device_name=settings.get('default_notes_midi_in_device_name', None))
         self.init_push()
+        self.leds = LEDShadow(self, messages_per_ms=settings.get('led_messages_per_ms', definitions.DEFAULT_LED_MESSAGES_PER_MS))
+        self.push_state = PushDeviceState(self)
 
         self.init_modes(settings)
+        self.display_pipeline = DisplayPipeline(self)
+        self.control_loop_scheduler = DeadlineScheduler()
 
     def init_modes(self, settings):
         self.main_controls_mode = MainControlsMode(self, settings=settings)
@@ -114,7 +148,7 @@ class PyshaApp(object):
                 self.active_modes = [mode for mode in self.active_modes if mode != self.settings_mode]
                 self.settings_mode.deactivate()
         else:
-            self.active_modes.append(self.settings_mode)
+            self.active_modes = self.active_modes + [self.settings_mode]
             self.settings_mode.activate()
 
     def toggle_ddrm_tone_selector_mode(self):
@@ -160,10 +194,10 @@ class PyshaApp(object):
                     self.previously_active_mode_for_xor_group[mode.xor_group] = mode  # Store last mode that was active for the group
                 else:
                     new_active_modes.append(mode)
-            self.active_modes = new_active_modes
 
             # Now add the mode to set to the active modes list and activate it
             new_active_modes.append(mode_to_set)
+            self.active_modes = new_active_modes
             mode_to_set.activate()
 
     def unset_mode_for_xor_group(self, mode_to_unset):
@@ -230,7 +264,12 @@ class PyshaApp(object):
             'default_notes_midi_in_device_name': self.notes_midi_in.name[:-4] if self.notes_midi_in is not None else None,
             'use_push2_display': self.use_push2_display,
             'target_frame_rate': self.target_frame_rate,
+            'use_display_renderer_process': self.use_display_renderer_process,
+            'display_backend': self.display_backend,
+            'led_messages_per_ms': self.leds.scheduler.messages_per_ms,
         }
+        settings.update(self.frame_rate_governor.get_settings_to_save())
+        settings.update(self.render_quality_controller.get_settings_to_save())
         for mode in self.get_all_modes():
             mode_settings = mode.get_settings_to_save()
             if mode_settings:
@@ -343,6 +382,26 @@ class PyshaApp(object):
             self.midi_out_channel = -1 if not wrap else 15
         elif self.midi_out_channel > 15:
             self.midi_out_channel = 15 if not wrap else -1
+        self.invalidate_midi_out_channel()
+
+    def get_midi_out_channel(self):
+        # Returns the (0-indexed) channel to which MIDI messages should be sent. This is the global midi out channel or,
+        # if set to -1, the channel of the currently selected track. It is computed once and cached until the midi out
+        # channel setting or the selected track change (see invalidate_midi_out_channel)
+        if self.midi_out_effective_channel is None:
+            midi_out_channel = self.midi_out_channel
+            if midi_out_channel == -1:
+                # Send the message to the midi channel of the currently selected track (or to track 1 if selected track has no midi channel information)
+                track_midi_channel = self.track_selection_mode.get_current_track_info()['midi_channel']
+                if track_midi_channel == -1:
+                    midi_out_channel = 0
+                else:
+                    midi_out_channel = track_midi_channel - 1 # msg.channel is 0-indexed
+            self.midi_out_effective_channel = midi_out_channel
+        return self.midi_out_effective_channel
+
+    def invalidate_midi_out_channel(self):
+        self.midi_out_effective_channel = None
 
     def set_midi_in_device_by_index(self, device_idx):
         if device_idx >= 0 and device_idx < len(self.available_midi_in_device_names):
@@ -364,16 +423,11 @@ class PyshaApp(object):
 
     def send_midi(self, msg, use_original_msg_channel=False):
         # Unless we specifically say we want to use the original msg mnidi channel, set it to global midi out channel or to the channel of the current track
+        # Messages should be created with channel=self.get_midi_out_channel() so that they don't need to be copied here
         if not use_original_msg_channel and hasattr(msg, 'channel'):
-            midi_out_channel = self.midi_out_channel    
-            if self.midi_out_channel == -1:
-                # Send the message to the midi channel of the currently selected track (or to track 1 if selected track has no midi channel information)
-                track_midi_channel = self.track_selection_mode.get_current_track_info()['midi_channel']
-                if track_midi_channel == -1:
-                    midi_out_channel = 0
-                else:
-                    midi_out_channel = track_midi_channel - 1 # msg.channel is 0-indexed
-            msg = msg.copy(channel=midi_out_channel)
+            midi_out_channel = self.get_midi_out_channel()
+            if msg.channel != midi_out_channel:
+                msg = msg.copy(channel=midi_out_channel)
         
         if self.midi_out is not None:
             self.midi_out.send(msg)
@@ -397,6 +451,8 @@ class PyshaApp(object):
                     self.last_cp_value_recevied_time = time.time()
                     
                 if not skip_message:
+                    self.frame_rate_governor.notify_activity()
+
                     # Forward message to the main MIDI out
                     self.send_midi(msg)
 
@@ -421,8 +477,25 @@ class PyshaApp(object):
                                 mode.init_lumi_midi_out()
 
     def add_display_notification(self, text):
-        self.notification_text = text
-        self.notification_time = time.time()
+        with self.notification_lock:
+            self.notification_text = text
+            self.notification_time = time.time()
+        self.frame_rate_governor.notify_activity()
+
+    def get_display_snapshot(self):
+        # Returns the state needed to render a frame so that the render stage works with a consistent view of it even if
+        # it changes in other threads while the frame is being rendered. Note that active_modes is never modified in place
+        # (a new list is assigned when modes change), so the list can be safely used for the whole frame. The state of
+        # each mode is not part of the snapshot: the functions that return the state of mode widgets (get_*_state) read
+        # each mutable field once into a local variable, so changes made by other threads never leave them half-read
+        with self.notification_lock:
+            return self.active_modes, self.notification_text, self.notification_time
+
+    def clear_display_notification(self, notification_time):
+        # Clears the current notification unless a new one was added in the meantime
+        with self.notification_lock:
+            if self.notification_time == notification_time:
+                self.notification_text = None
 
     def init_push(self):
         print('Configuring Push...')
@@ -443,28 +516,70 @@ class PyshaApp(object):
             mode.update_buttons()
 
     def update_push2_display(self):
+        # This is the render stage of the display pipeline (runs in its own thread)
         if self.use_push2_display:
-            # Prepare cairo canvas
-            w, h = push2_python.constants.DISPLAY_LINE_PIXELS, push2_python.constants.DISPLAY_N_LINES
-            surface = cairo.ImageSurface(cairo.FORMAT_RGB16_565, w, h)
-            ctx = cairo.Context(surface)
-
-            # Call all active modes to write to context
-            for mode in self.active_modes:
-                mode.update_display(ctx, w, h)
+            active_modes, notification_text, notification_time = self.get_display_snapshot()
+            w, h = self.frame_buffers.width, self.frame_buffers.height
 
-            # Show any notifications that should be shown
-            if self.notification_text is not None:
-                time_since_notification_started = time.time() - self.notification_time
-                if time_since_notification_started < definitions.NOTIFICATION_TIME:
-                    show_notification(ctx, self.notification_text, opacity=1 - time_since_notification_started/definitions.NOTIFICATION_TIME)
-                else:
-                    self.notification_text = None
+            notification_opacity = self.get_notification_opacity(notification_text, notification_time)
 
-            # Convert cairo data to numpy array and send to push
-            buf = surface.get_data()
-            frame = numpy.ndarray(shape=(h, w), dtype=numpy.uint16, buffer=buf).transpose()
-            self.push.display.display_frame(frame, input_format=push2_python.constants.FRAME_FORMAT_RGB565)
+            if self.display_renderer_process is not None:
+                # Record drawing operations and let the renderer process render them
+                ctx = RecordingContext()
+                self.draw_display_frame(ctx, w, h, active_modes)
+                if notification_opacity is not None:
+                    show_notification(ctx, notification_text, opacity=notification_opacity)
+                try:
+                    self.display_pipeline.submit_recorded_frame(ctx.ops, self.display_renderer_process)
+                except (EOFError, BrokenPipeError, OSError, TimeoutError):
+                    print('Display renderer process is not responding, rendering frames in the app process from now on')
+                    traceback.print_exc()
+                    self.display_renderer_process.stop(timeout=0.1)
+                    self.display_renderer_process = None
+                    self.display_pipeline.invalidate()
+            else:
+                # Get a cleared context from the preallocated frame buffers and render the frame
+                ctx = self.frame_buffers.begin_frame()
+                self.draw_display_frame(ctx, w, h, active_modes)
+                self.frame_buffers.end_frame()
+
+                # Composite notification (if any) directly on the rendered pixels
+                if notification_opacity is not None:
+                    self.notification_overlay.apply(self.frame_buffers.back.data[:, :w], notification_text, notification_opacity)
+
+                # Hand the frame to the transfer stage (frame buffer memory is already in the (w, h) layout expected by
+                # push2_python, so no new arrays are created)
+                self.display_pipeline.submit_frame()
+
+    def get_notification_opacity(self, notification_text, notification_time):
+        # Returns the opacity with which the current notification should be shown (or None if there's no notification
+        # to show). Notifications fade out during NOTIFICATION_TIME seconds
+        if notification_text is None:
+            return None
+        time_since_notification_started = time.time() - notification_time
+        if time_since_notification_started < definitions.NOTIFICATION_TIME:
+            return 1 - time_since_notification_started/definitions.NOTIFICATION_TIME
+        self.clear_display_notification(notification_time)
+        return None
+
+    def draw_display_frame(self, ctx, w, h, active_modes):
+        # Apply current render quality level (when recording, it is also applied in the renderer process on replay)
+        render_quality = self.render_quality_controller.level
+        set_render_quality(render_quality)
+        apply_render_quality(ctx, render_quality)
+
+        # Call all active modes to write to context
+        for mode in active_modes:
+            mode.update_display(ctx, w, h)
+
+    def measure_frame_rate(self):
+        now = time.perf_counter()
+        self.current_frame_rate_measurement += 1
+        if now - self.current_frame_rate_measurement_second > 1.0:
+            self.actual_frame_rate = self.current_frame_rate_measurement
+            self.current_frame_rate_measurement = 0
+            self.current_frame_rate_measurement_second = now
+            print('{0} fps'.format(self.actual_frame_rate))
 
     def check_for_delayed_actions(self):
         # If MIDI not configured, make sure we try sending messages so it gets configured
@@ -483,68 +598,51 @@ class PyshaApp(object):
             self.update_push2_buttons()
             self.buttons_need_update = False
 
+        # Send track mute/unmute messages to Pyramid that could not be sent yet because of pacing
+        self.pyramid_track_triggering_mode.send_pending_track_messages()
+
+        # Send pad and button colors that changed during this iteration (or in event handlers since the last one)
+        self.leds.flush()
+
     def run_loop(self):
         print('Pysha is runnnig...')
+        self.display_pipeline.start()  # Display frames are rendered and sent to Push2 in their own threads
         try:
             while True:
-                before_draw_time = time.time()
-
-                # Draw ui
-                self.update_push2_display()
-
-                # Frame rate measurement
-                now = time.time()
-                self.current_frame_rate_measurement += 1
-                if time.time() - self.current_frame_rate_measurement_second > 1.0:
-                    self.actual_frame_rate = self.current_frame_rate_measurement
-                    self.current_frame_rate_measurement = 0
-                    self.current_frame_rate_measurement_second = now
-                    print('{0} fps'.format(self.actual_frame_rate))
+                self.control_loop_scheduler.iteration_started()
 
                 # Check if any delayed actions need to be applied
                 self.check_for_delayed_actions()
 
-                after_draw_time = time.time()
-
-                # Calculate sleep time to aproximate the target frame rate
-                sleep_time = (1.0 / self.target_frame_rate) - (after_draw_time - before_draw_time)
+                # Wait until the deadline of the next iteration of the control loop
+                sleep_time = self.control_loop_scheduler.schedule_next(1.0 / definitions.CONTROL_LOOP_RATE)
                 if sleep_time > 0:
                     time.sleep(sleep_time)
 
         except KeyboardInterrupt:
             print('Exiting Pysha...')
+            self.display_pipeline.stop()
+            if self.display_renderer_process is not None:
+                self.display_renderer_process.stop()
             self.push.f_stop.set()
 
-    def on_midi_push_connection_established(self):
+    def on_midi_push_connection_established(self, full_restore=False):
         # Do initial configuration of Push
         print('Doing initial Push config...')
 
-        # Force configure MIDI out (in case it wasn't...)
-        app.push.configure_midi_out()
-
-        # Configure custom color palette
-        app.push.color_palette = {}
-        for count, color_name in enumerate(definitions.COLORS_NAMES):
-            app.push.set_color_palette_entry(count, [color_name, color_name], rgb=definitions.get_color_rgb_float(color_name), allow_overwrite=True)
-        app.push.reapply_color_palette()
-
-        # Initialize all buttons to black, initialize all pads to off
-        app.push.buttons.set_all_buttons_color(color=definitions.BLACK)
-        app.push.pads.set_all_pads_to_color(color=definitions.BLACK)
-
-        # Iterate over modes and (re-)activate them
-        for mode in self.active_modes:
-            mode.activate()
+        # Make sure next display frame is sent even if it is identical to the last one sent
+        self.display_pipeline.invalidate()
 
-        # Update buttons and pads (just in case something was missing!)
-        app.update_push2_buttons()
-        app.update_push2_pads()
+        # Re-send the color palette, pads configuration and LED colors that Push may have lost. With full_restore, all
+        # pads and buttons are initialized and active modes are re-activated
+        self.push_state.restore(full=full_restore)
 
 
 # Bind push action handlers with class methods
 @push2_python.on_encoder_rotated()
 def on_encoder_rotated(_, encoder_name, increment):
     try:
+        app.frame_rate_governor.notify_activity()
         for mode in app.active_modes[::-1]:
             action_performed = mode.on_encoder_rotated(encoder_name, increment)
             if action_performed:
@@ -557,6 +655,7 @@ def on_encoder_rotated(_, encoder_name, increment):
 @push2_python.on_pad_pressed()
 def on_pad_pressed(_, pad_n, pad_ij, velocity):
     try:
+        app.frame_rate_governor.notify_activity()
         for mode in app.active_modes[::-1]:
             action_performed = mode.on_pad_pressed(pad_n, pad_ij, velocity)
             if action_performed:
@@ -569,6 +668,7 @@ def on_pad_pressed(_, pad_n, pad_ij, velocity):
 @push2_python.on_pad_released()
 def on_pad_released(_, pad_n, pad_ij, velocity):
     try:
+        app.frame_rate_governor.notify_activity()
         for mode in app.active_modes[::-1]:
             action_performed = mode.on_pad_released(pad_n, pad_ij, velocity)
             if action_performed:
@@ -581,6 +681,7 @@ def on_pad_released(_, pad_n, pad_ij, velocity):
 @push2_python.on_pad_aftertouch()
 def on_pad_aftertouch(_, pad_n, pad_ij, velocity):
     try:
+        app.frame_rate_governor.notify_activity()
         for mode in app.active_modes[::-1]:
             action_performed = mode.on_pad_aftertouch(pad_n, pad_ij, velocity)
             if action_performed:
@@ -593,6 +694,7 @@ def on_pad_aftertouch(_, pad_n, pad_ij, velocity):
 @push2_python.on_button_pressed()
 def on_button_pressed(_, name):
     try:
+        app.frame_rate_governor.notify_activity()
         for mode in app.active_modes[::-1]:
             action_performed = mode.on_button_pressed(name)
             if action_performed:
@@ -605,6 +707,7 @@ def on_button_pressed(_, name):
 @push2_python.on_button_released()
 def on_button_released(_, name):
     try:
+        app.frame_rate_governor.notify_activity()
         for mode in app.active_modes[::-1]:
             action_performed = mode.on_button_released(name)
             if action_performed:
@@ -617,6 +720,7 @@ def on_button_released(_, name):
 @push2_python.on_touchstrip()
 def on_touchstrip(_, value):
     try:
+        app.frame_rate_governor.notify_activity()
         for mode in app.active_modes[::-1]:
             action_performed = mode.on_touchstrip(value)
             if action_performed:
@@ -629,6 +733,7 @@ def on_touchstrip(_, value):
 @push2_python.on_sustain_pedal()
 def on_sustain_pedal(_, sustain_on):
     try:
+        app.frame_rate_governor.notify_activity()
         for mode in app.active_modes[::-1]:
             action_performed = mode.on_sustain_pedal(sustain_on)
             if action_performed:
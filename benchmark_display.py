@@ -0,0 +1,69 @@
+"""Compares the time it takes to render a typical display frame with the cairo and numpy display backends.
+
+Usage: python benchmark_display.py [n_frames]
+
+Each backend is timed in its own process (the display backend can only be set before any surface is created). The
+frame is similar to a MIDI CC page: 8 section labels (one selected), 8 knobs whose values change on every frame, and
+a notification fading out on top. Tile caches are warmed before timing so that results show the steady state.
+"""
+
+import subprocess
+import sys
+import time
+
+N_FRAMES = 500
+N_WARMUP_FRAMES = 50
+
+
+def render_typical_frame(frame_buffers, notification_overlay, frame_n):
+    import definitions
+    from display_utils import show_text, show_title, show_value, draw_knob, KNOB_RADIUS
+
+    w, h = frame_buffers.width, frame_buffers.height
+    part_w = w // 8
+    ctx = frame_buffers.begin_frame()
+    for i in range(0, 8):
+        if i == 2:
+            show_text(ctx, i, 0, 'Section {0}'.format(i + 1), height=20, font_color=definitions.BLACK, background_color=definitions.ORANGE)
+        else:
+            show_text(ctx, i, 0, 'Section {0}'.format(i + 1), height=20, font_color=definitions.ORANGE, background_color=definitions.BLACK)
+        value = (frame_n + i * 16) % 128
+        show_title(ctx, part_w * i, h, 'CC {0}'.format(i + 20))
+        show_value(ctx, part_w * i, h, value)
+        draw_knob(ctx, part_w * i + KNOB_RADIUS + 3, 20 + 60 + KNOB_RADIUS + 5, definitions.ORANGE, value, 0, 127)
+    frame_buffers.end_frame()
+    notification_overlay.apply(frame_buffers.back.data[:, :w], 'Octave up', 1 - (frame_n % 100) / 100)
+
+
+def run_benchmark(backend, n_frames):
+    # Times the rendering of n_frames frames with the given backend and prints the results as a single line
+    import display_utils
+    if display_utils.set_display_backend(backend) != backend:
+        print('{0}: not available'.format(backend))
+        return
+
+    from frame_buffer import FrameBufferManager
+    from notification_overlay import NotificationOverlay
+    frame_buffers = FrameBufferManager()
+    notification_overlay = NotificationOverlay()
+
+    for frame_n in range(0, N_WARMUP_FRAMES):
+        render_typical_frame(frame_buffers, notification_overlay, frame_n)
+    times = []
+    for frame_n in range(0, n_frames):
+        start_time = time.perf_counter()
+        render_typical_frame(frame_buffers, notification_overlay, frame_n)
+        times.append(time.perf_counter() - start_time)
+    times.sort()
+    print('{0}: mean {1:.2f} ms, p50 {2:.2f} ms, p95 {3:.2f} ms ({4} frames)'.format(
+        backend, 1000 * sum(times) / len(times), 1000 * times[len(times) // 2], 1000 * times[int(len(times) * 0.95)], n_frames))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        run_benchmark(sys.argv[1], int(sys.argv[2]))
+    else:
+        import definitions
+        n_frames = int(sys.argv[1]) if len(sys.argv) > 1 else N_FRAMES
+        for backend in [definitions.DISPLAY_BACKEND_CAIRO, definitions.DISPLAY_BACKEND_NUMPY]:
+            subprocess.run([sys.executable, __file__, backend, str(n_frames)])
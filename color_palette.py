@@ -0,0 +1,100 @@
+import collections
+import definitions
+import threading
+
+
+PUSH2_COLOR_PALETTE_SIZE = 128
+
+
+class ColorPaletteAllocator(object):
+    """Maps the colors used for pads and buttons to entries of the Push2 color palette.
+
+    Push2 pads and buttons can only show colors from its 128 entries palette. Named colors (definitions.COLORS_NAMES)
+    are uploaded to the first entries of the palette when Push2 is connected, the rest of the entries are used for
+    custom RGB colors (see definitions.CUSTOM_COLOR_PREFIX). A custom color is only assigned an entry the first time it
+    is used, and new entries are uploaded in a single batch (followed by a single "reapply palette" message) the next
+    time LEDs are flushed, so the palette sysex traffic only happens the first time a color is used. When all entries
+    are used, the least recently used color not being shown by any pad or button is replaced. If there is no entry
+    that can be replaced, the closest named color is used instead.
+    """
+
+    def __init__(self, app, first_slot=len(definitions.COLORS_NAMES), n_slots=PUSH2_COLOR_PALETTE_SIZE):
+        self.app = app
+        self.fixed_colors = set(definitions.COLORS_NAMES)
+        self.first_slot = first_slot
+        self.n_slots = n_slots
+        self.lock = threading.Lock()
+        self.slots = collections.OrderedDict()  # color_name -> palette entry (least recently used colors first)
+        self.free_slots = list(range(first_slot, n_slots))
+        self.pending = {}  # color_name -> palette entry, entries that need to be uploaded to Push2
+        self.fallback_colors = {}
+
+    @property
+    def push(self):
+        return self.app.push
+
+    def reset(self):
+        # Call this when the Push2 palette has been reset (e.g. after reconnecting), all custom colors will need to be
+        # assigned entries again
+        with self.lock:
+            self.slots = collections.OrderedDict()
+            self.free_slots = list(range(self.first_slot, self.n_slots))
+            self.pending = {}
+
+    def invalidate(self):
+        # Marks all the entries assigned to custom colors as pending to be uploaded (e.g. after reconnecting)
+        with self.lock:
+            self.pending = dict(self.slots)
+
+    def get_fallback_color(self, color_name):
+        # Returns the named color closest to the given color
+        fallback_color = self.fallback_colors.get(color_name, None)
+        if fallback_color is None:
+            rgb = definitions.get_color_rgb(color_name)
+            fallback_color = min(definitions.COLORS_NAMES, key=lambda name: sum([(x - y) ** 2 for x, y in zip(rgb, definitions.get_color_rgb(name))]))
+            self.fallback_colors[color_name] = fallback_color
+        return fallback_color
+
+    def get_color(self, color_name, get_colors_in_use):
+        # Returns the color name to use for a pad or button so that it can be shown by Push2. get_colors_in_use is
+        # a function returning the colors currently used by pads and buttons, it is only called if a palette entry
+        # needs to be replaced
+        if color_name is None or color_name in self.fixed_colors:
+            return color_name
+        with self.lock:
+            if color_name in self.slots:
+                self.slots.move_to_end(color_name)
+                return color_name
+            if self.free_slots:
+                slot = self.free_slots.pop(0)
+            else:
+                colors_in_use = get_colors_in_use()
+                evicted_color = None
+                for candidate_color in self.slots:
+                    if candidate_color not in colors_in_use:
+                        evicted_color = candidate_color
+                        break
+                if evicted_color is None:
+                    return self.get_fallback_color(color_name)
+                slot = self.slots.pop(evicted_color)
+                self.pending.pop(evicted_color, None)
+            self.slots[color_name] = slot
+            self.pending[color_name] = slot
+            return color_name
+
+    def get_state(self, state, get_colors_in_use):
+        # Same as get_color but for a (color, animation, animation_start_color) LED state
+        color, animation, animation_start_color = state
+        return (self.get_color(color, get_colors_in_use), animation, self.get_color(animation_start_color, get_colors_in_use))
+
+    def upload_pending(self, reapply=True):
+        # Uploads palette entries for the colors that were assigned an entry since last upload. If reapply=False, the
+        # "reapply palette" message is not sent (caller will send it after uploading other entries)
+        with self.lock:
+            if not self.pending:
+                return
+            for color_name, slot in self.pending.items():
+                self.push.set_color_palette_entry(slot, [color_name, color_name], rgb=definitions.get_color_rgb_float(color_name), allow_overwrite=True)
+            if reapply:
+                self.push.reapply_color_palette()
+            self.pending = {}
@@ -7,7 +7,7 @@ import json
 import os
 
 from definitions import PyshaMode
-from display_utils import show_text
+from widgets import WidgetGroup, LabelWidget
 
 
 NAME_STRING_1 = 'String\n1'
@@ -585,6 +585,8 @@ tone_selector_values = {  # (MIDI CC for upper row, MIDI CC for lower row, MIDI
 
 class DDRMToneSelectorMode(PyshaMode):
 
+    active_frame_rate = 30  # Only static labels are shown, no need to render them at full frame rate
+
     upper_row_button_names = [
         push2_python.constants.BUTTON_UPPER_ROW_1,
         push2_python.constants.BUTTON_UPPER_ROW_2,
@@ -672,6 +674,33 @@ class DDRMToneSelectorMode(PyshaMode):
     lower_row_selected = ''
     inter_message_message_min_time_ms = 4  # ms wait time after each message to DDRM
     send_messages_double = False  # This is a workaround for a DDRM bug that will ignore single CC messages. We'll send 2 messages in a row for the same control with slightly different values
+    widgets = None
+
+    def initialize(self, settings=None):
+        self.create_widgets()
+
+    def create_widgets(self):
+        height = 80
+        label_kwargs = dict(font_size_percentage=0.2, center_vertically=True, center_horizontally=True, rectangle_padding=1)
+        self.widgets = WidgetGroup()
+        for i in range(0, 8):
+            self.widgets.add(LabelWidget(i, 0, height, bind=lambda i=i: self.get_tone_label_state(self.upper_row_names, self.upper_row_selected, i), **label_kwargs))
+        for i in range(0, 8):
+            self.widgets.add(LabelWidget(i, height, height, bind=lambda i=i: self.get_tone_label_state(self.lower_row_names, self.lower_row_selected, i), **label_kwargs))
+
+    def get_tone_label_state(self, row_names, row_selected, i):
+        try:
+            name = row_names[self.page_n * 8 + i]
+        except IndexError:
+            return None
+        if name == NAME_FUNKY_4:
+            return None
+        font_color = self.font_colors[self.colors[name]]
+        if name == row_selected:
+            background_color = self.colors[name]
+        else:
+            background_color = definitions.get_darker_color(self.colors[name], 1)
+        return (name.upper(), font_color, background_color)
 
     def should_be_enabled(self):
         return self.app.track_selection_mode.get_current_track_instrument_short_name() == "DDRM"
@@ -689,7 +718,7 @@ class DDRMToneSelectorMode(PyshaMode):
                 else:
                     values_to_send = [midi_val]
                 for val in values_to_send:
-                    msg = mido.Message('control_change', control=midi_cc, value=val)  # Should we subtract 1 from midi_cc because mido being 0-indexed?
+                    msg = mido.Message('control_change', control=midi_cc, value=val, channel=self.app.get_midi_out_channel())  # Should we subtract 1 from midi_cc because mido being 0-indexed?
                     self.app.send_midi(msg)
                     if self.inter_message_message_min_time_ms:
                         time.sleep(self.inter_message_message_min_time_ms*1.0/1000)
@@ -702,7 +731,7 @@ class DDRMToneSelectorMode(PyshaMode):
                 else:
                     values_to_send = [midi_val]
                 for val in values_to_send:
-                    msg = mido.Message('control_change', control=midi_cc, value=val)  # Should we subtract 1 from midi_cc because mido being 0-indexed?
+                    msg = mido.Message('control_change', control=midi_cc, value=val, channel=self.app.get_midi_out_channel())  # Should we subtract 1 from midi_cc because mido being 0-indexed?
                     self.app.send_midi(msg)
                     if self.inter_message_message_min_time_ms:
                         time.sleep(self.inter_message_message_min_time_ms*1.0/1000)
@@ -712,33 +741,33 @@ class DDRMToneSelectorMode(PyshaMode):
 
     def deactivate(self):
         for button_name in self.upper_row_button_names + self.lower_row_button_names + [push2_python.constants.BUTTON_PAGE_LEFT, push2_python.constants.BUTTON_PAGE_RIGHT]:
-            self.push.buttons.set_button_color(button_name, definitions.BLACK)
+            self.app.leds.set_button_color(button_name, definitions.BLACK)
 
     def update_buttons(self):
 
         for count, name in enumerate(self.upper_row_button_names):
             try:
                 tone_name = self.upper_row_names[count + self.page_n * 8]
-                self.push.buttons.set_button_color(name, self.colors[tone_name])
+                self.app.leds.set_button_color(name, self.colors[tone_name])
             except IndexError:
-                self.push.buttons.set_button_color(name, definitions.OFF_BTN_COLOR)
+                self.app.leds.set_button_color(name, definitions.OFF_BTN_COLOR)
 
         for count, name in enumerate(self.lower_row_button_names):
             try:
                 tone_name = self.lower_row_names[count + self.page_n * 8]
-                self.push.buttons.set_button_color(name, self.colors[tone_name])
+                self.app.leds.set_button_color(name, self.colors[tone_name])
             except IndexError:
-                self.push.buttons.set_button_color(name, definitions.OFF_BTN_COLOR)
+                self.app.leds.set_button_color(name, definitions.OFF_BTN_COLOR)
 
         show_prev, show_next = self.get_should_show_next_prev()
         if show_prev:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_PAGE_LEFT, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_PAGE_LEFT, definitions.WHITE)
         else:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_PAGE_LEFT, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_PAGE_LEFT, definitions.BLACK)
         if show_next:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_PAGE_RIGHT, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_PAGE_RIGHT, definitions.WHITE)
         else:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_PAGE_RIGHT, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_PAGE_RIGHT, definitions.BLACK)
 
     def update_display(self, ctx, w, h):
 
@@ -746,32 +775,8 @@ class DDRMToneSelectorMode(PyshaMode):
             # If settings mode is active, don't draw the upper parts of the screen because settings page will
             # "cover them"
 
-            start = self.page_n * 8
-
-            # Draw upper row
-            for i, name in enumerate(self.upper_row_names[start:][:8]):
-                font_color = self.font_colors[self.colors[name]]
-                if name == self.upper_row_selected:
-                    background_color = self.colors[name]
-                else:
-                    background_color = self.colors[name] + '_darker1'
-                height = 80
-                top_offset = 0
-                show_text(ctx, i, top_offset, name.upper(), height=height, font_color=font_color, background_color=background_color,
-                          font_size_percentage=0.2, center_vertically=True, center_horizontally=True, rectangle_padding=1)
-
-            # Draw lower row
-            for i, name in enumerate(self.lower_row_names[start:][:8]):
-                if name != NAME_FUNKY_4:
-                    font_color = self.font_colors[self.colors[name]]
-                    if name == self.lower_row_selected:
-                        background_color = self.colors[name]
-                    else:
-                        background_color = self.colors[name] + '_darker1'
-                    height = 80
-                    top_offset = 80
-                    show_text(ctx, i, top_offset, name.upper(), height=height,
-                              font_color=font_color, background_color=background_color, font_size_percentage=0.2, center_vertically=True, center_horizontally=True, rectangle_padding=1)
+            # Draw upper and lower rows of tone names (widgets are only re-rendered if their contents changed)
+            self.widgets.draw(ctx)
 
     def on_button_pressed(self, button_name):
         if button_name in self.upper_row_button_names:
@@ -1,5 +1,6 @@
 import push2_python
 import colorsys
+import threading
 
 VERSION = '0.25'
 
@@ -11,6 +12,32 @@ LAYOUT_SLICES = 'lslices'
 
 NOTIFICATION_TIME = 3
 
+CONTROL_LOOP_RATE = 100  # Rate (Hz) at which the main loop checks for delayed actions and pad/button updates
+
+DEFAULT_IDLE_FRAME_RATE = 10  # Display frame rate used when there's no activity (see FrameRateGovernor)
+DEFAULT_DISPLAY_OFF_FRAME_RATE = 2  # Rate at which render loop checks if display has been turned back on
+FRAME_RATE_IDLE_TIMEOUT = 2.0  # Time (seconds) without any activity after which display frame rate goes down to idle rate
+
+DEFAULT_LED_MESSAGES_PER_MS = 2.0  # Budget of LED color messages sent to Push2 (see LEDOutputScheduler)
+PAD_PRESSURE_LEDS_MAX_RATE = 15  # Maximum number of times per second the color of a pad is updated to show its pressure
+PYRAMID_MESSAGES_PER_MS = 0.5  # Track mute/unmute messages sent to Pyramid are paced so its DIN MIDI input is not flooded
+PYRAMID_MAX_BURST = 8
+N_PAD_PRESSURE_STEPS = 4  # Pressure is shown with the color of the pad (step 0) and 3 lighter versions of it
+PAD_PRESSURE_MAX_LIGHTEN = 0.75  # Amount of white mixed into the color of a pad in the highest pressure step
+
+DISPLAY_BACKEND_CAIRO = 'cairo'
+DISPLAY_BACKEND_NUMPY = 'numpy'  # Renders display frames without cairo (see numpy_backend.py). Opt-in via the 'display_backend' setting (or used if pycairo is missing), compare both backends with benchmark_display.py
+
+RENDER_QUALITY_FULL = 0
+RENDER_QUALITY_NO_ANTIALIAS = 1  # Antialiasing is disabled (text is still painted from pre-rendered tiles)
+RENDER_QUALITY_SIMPLE = 2  # Also knobs are replaced by bars and notifications don't fade out
+RENDER_QUALITY_LABELS_ONLY = 3  # Only labels and values are drawn (no knobs, curves...)
+RENDER_QUALITY_NAMES = ['Full', 'No AA', 'Simple', 'Labels']
+
+DISPLAY_RENDERER_TIMEOUT = 1.0  # If the display renderer process takes longer than this to render a frame (in seconds), rendering falls back to the app process
+ABOUT_PAGE_STATS_UPDATE_INTERVAL = 1.0  # Stats shown in the About page are updated once every this number of seconds
+DISPLAY_KEEP_ALIVE_TIME = 0.5  # Identical frames are not sent to Push2 display, but at least one is sent every DISPLAY_KEEP_ALIVE_TIME seconds so display does not go blank
+
 BLACK_RGB = [0, 0, 0]
 GRAY_DARK_RGB = [30, 30, 30]
 GRAY_LIGHT_RGB = [180, 180, 180]
@@ -43,11 +70,42 @@ LIME = 'lime'
 
 COLORS_NAMES = [ORANGE, YELLOW, TURQUOISE, LIME, RED, PINK, PURPLE, BLUE, CYAN, GREEN, BLACK, GRAY_DARK, GRAY_LIGHT, WHITE]
 
-def get_color_rgb(color_name):
+DARKER1_COLOR_MOD = 0.35  # < 1 means make colour darker, > 1 means make colour brighter
+DARKER2_COLOR_MOD = 0.05
+
+# Besides the named colors above, colors can be given with their RGB hex value (e.g. '#ff8000'), and also the darker
+# versions of these can be used (e.g. '#ff8000_darker1'). These are added to the Push2 color palette when first
+# used (see ColorPaletteAllocator)
+CUSTOM_COLOR_PREFIX = '#'
+
+def compute_color_rgb(color_name):
+    # Computes the RGB values of a color, use get_color_rgb instead which returns the values stored in the color table
+    if is_custom_color(color_name):
+        return get_custom_color_rgb(color_name)
     return globals().get('{0}_RGB'.format(color_name.upper()), [0, 0, 0])
 
-def get_color_rgb_float(color_name):
-    return [x/255 for x in get_color_rgb(color_name)]
+def get_darker_color_rgb(rgb, color_mod):
+    c = colorsys.rgb_to_hls(*[x/255 for x in rgb])
+    darker_color = colorsys.hls_to_rgb(c[0], max(0, min(1, color_mod * c[1])), c[2])
+    return list([c * 255 for c in darker_color])
+
+def is_custom_color(color_name):
+    return color_name.startswith(CUSTOM_COLOR_PREFIX)
+
+def rgb_to_custom_color_name(rgb):
+    return '{0}{1:02x}{2:02x}{3:02x}'.format(CUSTOM_COLOR_PREFIX, *[int(round(x)) for x in rgb])
+
+def get_custom_color_rgb(color_name):
+    hex_value, _, shade = color_name[len(CUSTOM_COLOR_PREFIX):].partition('_')
+    try:
+        rgb = [int(hex_value[i:i + 2], 16) for i in range(0, 6, 2)] if len(hex_value) == 6 else [0, 0, 0]
+    except ValueError:
+        rgb = [0, 0, 0]
+    if shade == 'darker1':
+        rgb = get_darker_color_rgb(rgb, DARKER1_COLOR_MOD)
+    elif shade == 'darker2':
+        rgb = get_darker_color_rgb(rgb, DARKER2_COLOR_MOD)
+    return rgb
 
 
 # Create darker1 and darker2 versions of each color in COLOR_NAMES, add new colors back to COLOR_NAMES
@@ -55,29 +113,92 @@ to_add_in_color_names = []
 for name in COLORS_NAMES:
 
     # Create darker 1
-    color_mod = 0.35  # < 1 means make colour darker, > 1 means make colour brighter
-    c = colorsys.rgb_to_hls(*get_color_rgb_float(name))
-    darker_color = colorsys.hls_to_rgb(c[0], max(0, min(1, color_mod * c[1])), c[2])
     new_color_name = f'{name}_darker1'
     globals()[new_color_name.upper()] = new_color_name
     if new_color_name not in COLORS_NAMES:
         to_add_in_color_names.append(new_color_name)
     new_color_rgb_name = f'{name}_darker1_rgb'
-    globals()[new_color_rgb_name.upper()] = list([c * 255 for c in darker_color])
+    globals()[new_color_rgb_name.upper()] = get_darker_color_rgb(compute_color_rgb(name), DARKER1_COLOR_MOD)
 
     # Create darker 2
-    color_mod = 0.05  # < 1 means make colour darker, > 1 means make colour brighter
-    c = colorsys.rgb_to_hls(*get_color_rgb_float(name))
-    darker_color = colorsys.hls_to_rgb(c[0], max(0, min(1, color_mod * c[1])), c[2])
     new_color_name = f'{name}_darker2'
     globals()[new_color_name.upper()] = new_color_name
     if new_color_name not in COLORS_NAMES:
         to_add_in_color_names.append(new_color_name)
     new_color_rgb_name = f'{name}_darker2_rgb'
-    globals()[new_color_rgb_name.upper()] = list([c * 255 for c in darker_color])
+    globals()[new_color_rgb_name.upper()] = get_darker_color_rgb(compute_color_rgb(name), DARKER2_COLOR_MOD)
 
 COLORS_NAMES += to_add_in_color_names  # Update list of color names with darkified versiond of existing colors
 
+
+# Color table. Every color gets an integer id the first time it is used (named colors and their darker versions get
+# the ids 0..len(COLORS_NAMES)-1) and its RGB, RGB float and RGB565 values and the ids of its darker versions are
+# stored in the table so these don't need to be computed again
+COLOR_IDS = {}  # color name -> color id
+COLOR_TABLE_NAMES = []  # color id -> color name
+COLOR_TABLE_RGB = []  # color id -> (R, G, B) (0-255)
+COLOR_TABLE_RGB_FLOAT = []  # color id -> (R, G, B) (0-1)
+COLOR_TABLE_RGB565 = []  # color id -> RGB565 value
+COLOR_TABLE_SHADES = []  # color id -> [color id, darker1 color id, darker2 color id] (None if not computed yet)
+color_table_lock = threading.Lock()
+
+def add_color_to_table(color_name, rgb):
+    with color_table_lock:
+        color_id = COLOR_IDS.get(color_name, None)
+        if color_id is None:
+            color_id = len(COLOR_TABLE_NAMES)
+            COLOR_TABLE_NAMES.append(color_name)
+            COLOR_TABLE_RGB.append(tuple(rgb))  # Tuples so callers can't modify the values stored in the table
+            COLOR_TABLE_RGB_FLOAT.append(tuple([x/255 for x in rgb]))
+            r, g, b = [int(x) for x in rgb]
+            COLOR_TABLE_RGB565.append(((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3))
+            COLOR_TABLE_SHADES.append([color_id, None, None])
+            COLOR_IDS[color_name] = color_id
+        return color_id
+
+def get_color_id(color_name):
+    color_id = COLOR_IDS.get(color_name, None)
+    if color_id is None:
+        color_id = add_color_to_table(color_name, compute_color_rgb(color_name))
+    return color_id
+
+def get_color_name(color_id):
+    return COLOR_TABLE_NAMES[color_id]
+
+def get_color_rgb(color_name):
+    return COLOR_TABLE_RGB[get_color_id(color_name)]
+
+def get_color_rgb_float(color_name):
+    return COLOR_TABLE_RGB_FLOAT[get_color_id(color_name)]
+
+def get_color_rgb565(color_name):
+    return COLOR_TABLE_RGB565[get_color_id(color_name)]
+
+def get_darker_color_id(color_id, level):
+    # Returns the id of the darker version of a color (level 1 or 2, level 0 returns the color itself)
+    shade_id = COLOR_TABLE_SHADES[color_id][level]
+    if shade_id is None:
+        color_name = COLOR_TABLE_NAMES[color_id]
+        shade_name = '{0}_darker{1}'.format(color_name, level)
+        if shade_name in COLOR_IDS or (is_custom_color(color_name) and '_' not in color_name):
+            shade_id = get_color_id(shade_name)
+        else:
+            shade_id = add_color_to_table(shade_name, get_darker_color_rgb(COLOR_TABLE_RGB[color_id], [1, DARKER1_COLOR_MOD, DARKER2_COLOR_MOD][level]))
+        COLOR_TABLE_SHADES[color_id][level] = shade_id
+    return shade_id
+
+def get_darker_color(color_name, level):
+    # Returns the name of the darker version of a color (e.g. get_darker_color(RED, 1) returns RED_DARKER1)
+    return COLOR_TABLE_NAMES[get_darker_color_id(get_color_id(color_name), level)]
+
+def get_lighter_color(color_name, amount):
+    # Returns the name of a (custom) color resulting from mixing a color with white, amount being the amount of white
+    # (0-1). Every RGB value is increased so the resulting color is never darker than the original one
+    return rgb_to_custom_color_name([x + (255 - x) * amount for x in get_color_rgb(color_name)])
+
+for name in COLORS_NAMES:
+    get_color_id(name)
+
 FONT_COLOR_DELAYED_ACTIONS = ORANGE
 FONT_COLOR_DISABLED = GRAY_LIGHT
 OFF_BTN_COLOR = GRAY_DARK
@@ -94,6 +215,8 @@ class PyshaMode(object):
 
     name = ''
     xor_group = None
+    active_frame_rate = None  # Display frame rates needed by the mode (None means use app defaults, see FrameRateGovernor)
+    idle_frame_rate = None
 
     def __init__(self, app, settings=None):
         self.app = app
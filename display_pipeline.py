@@ -0,0 +1,164 @@
+import definitions
+import push2_python
+import threading
+import time
+import traceback
+
+from frame_scheduler import DeadlineScheduler
+
+
+class DisplayPipeline(object):
+    """Renders display frames and sends them to Push2 in two separate threads so that slow USB transfers don't
+    delay rendering, and neither of them delays the main loop (which only does control work like updating pads
+    and buttons or running delayed actions).
+
+    - The render stage renders frames into the back buffer of the app frame buffers at the rate decided by the
+      app's FrameRateGovernor.
+    - The transfer stage sends the front buffer to Push2 whenever a new frame has been handed over.
+
+    Frame buffers are swapped (render stage hands a frame over to the transfer stage) only when the transfer stage
+    is idle. If a frame is ready but the previous one is still being sent, the new frame is dropped instead of being
+    queued (the next one will be more up to date anyway). Frames identical to the last one sent are skipped, but a
+    frame is sent at least every DISPLAY_KEEP_ALIVE_TIME seconds so Push2 display does not go blank.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.frame_pending = False  # True from the moment a frame is handed over until it has been sent
+        self.frame_to_send = None
+        self.last_sent_ops = None  # Only used when frames are rendered by a DisplayRendererProcess
+        self.black_frame_requested = False
+        self.render_thread = None
+        self.transfer_thread = None
+        self.render_scheduler = DeadlineScheduler()
+
+        # Stats
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.frames_dropped = 0
+        self.last_frame_sent_time = 0
+
+    @property
+    def frame_buffers(self):
+        return self.app.frame_buffers
+
+    def start(self):
+        self.stop_event.clear()
+        self.render_thread = threading.Thread(target=self.render_loop, daemon=True)
+        self.transfer_thread = threading.Thread(target=self.transfer_loop, daemon=True)
+        self.render_thread.start()
+        self.transfer_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.app.frame_rate_governor.wake_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        for thread in [self.render_thread, self.transfer_thread]:
+            if thread is not None:
+                thread.join(timeout=1.0)
+
+    def submit_frame(self):
+        # Called from the render stage once a frame has been rendered in the back buffer
+        now = time.time()
+        if self.frame_buffers.back_matches_front() and now - self.last_frame_sent_time < definitions.DISPLAY_KEEP_ALIVE_TIME:
+            self.frames_skipped += 1
+            return
+        with self.condition:
+            if not self.app.use_push2_display:
+                # Display was turned off while this frame was being rendered
+                return
+            if self.frame_pending:
+                # Transfer stage is still busy with the previous frame, drop this one
+                self.frames_dropped += 1
+                return
+            self.frame_buffers.swap()
+            self.frame_to_send = self.frame_buffers.front.frame
+            self.frame_pending = True
+            self.condition.notify_all()
+
+    def submit_recorded_frame(self, ops, renderer_process):
+        # Called from the render stage with the recorded drawing operations of a frame when using a renderer process.
+        # Frames are deduplicated by comparing drawing operations, so identical frames are not even rendered
+        now = time.time()
+        if ops == self.last_sent_ops and now - self.last_frame_sent_time < definitions.DISPLAY_KEEP_ALIVE_TIME:
+            self.frames_skipped += 1
+            return
+        with self.condition:
+            if self.frame_pending:
+                # Transfer stage is still busy with the previous frame, drop this one
+                self.frames_dropped += 1
+                return
+        frame = renderer_process.render(ops)  # Transfer stage is idle so no frame slot is being sent
+        with self.condition:
+            if not self.app.use_push2_display:
+                # Display was turned off while this frame was being rendered
+                return
+            self.frame_to_send = frame
+            self.frame_pending = True
+            self.last_sent_ops = ops
+            self.condition.notify_all()
+
+    def invalidate(self):
+        # Call this when the contents of the Push2 display might no longer match the last frame sent (e.g. display
+        # was turned off or Push2 reconnected) so the next frame is always sent
+        self.last_sent_ops = None
+        self.frame_buffers.invalidate()
+
+    def request_black_frame(self):
+        # Asks the transfer stage to send a black frame (used when display is turned off)
+        with self.condition:
+            self.black_frame_requested = True
+            self.condition.notify_all()
+
+    def render_loop(self):
+        self.render_scheduler.reset()
+        while not self.stop_event.is_set():
+            self.render_scheduler.iteration_started()
+            if self.app.use_push2_display:
+                before_render_time = time.perf_counter()
+                try:
+                    self.app.update_push2_display()
+                except Exception:
+                    traceback.print_exc()
+                render_time = time.perf_counter() - before_render_time
+                self.app.render_quality_controller.add_render_time(render_time, 1.0 / self.app.target_frame_rate)
+                self.app.measure_frame_rate()
+
+            # Wait until the deadline of the next frame at the rate decided by the governor (sleep is interrupted if
+            # there is some activity while idle, then deadlines start counting again from that moment)
+            frame_rate = self.app.frame_rate_governor.update_effective_frame_rate()
+            sleep_time = self.render_scheduler.schedule_next(1.0 / frame_rate)
+            if sleep_time > 0:
+                if self.app.frame_rate_governor.sleep(sleep_time):
+                    self.render_scheduler.reset()
+
+    def transfer_loop(self):
+        display = self.app.push.display
+        while not self.stop_event.is_set():
+            with self.condition:
+                while not self.frame_pending and not self.black_frame_requested and not self.stop_event.is_set():
+                    self.condition.wait()
+                send_black_frame = self.black_frame_requested
+                self.black_frame_requested = False
+            if self.stop_event.is_set():
+                break
+
+            try:
+                if send_black_frame:
+                    # Any pending frame is discarded as it was rendered before display was turned off
+                    display.send_to_display(display.prepare_frame(display.make_black_frame()))
+                    self.invalidate()
+                elif self.frame_pending and self.app.use_push2_display:
+                    # Display is checked again here as it could have been turned off (and the black frame sent) after
+                    # the frame was handed over
+                    display.display_frame(self.frame_to_send, input_format=push2_python.constants.FRAME_FORMAT_RGB565)
+                    self.frames_sent += 1
+                    self.last_frame_sent_time = time.time()
+            except Exception:
+                traceback.print_exc()
+
+            with self.condition:
+                self.frame_pending = False
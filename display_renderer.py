@@ -0,0 +1,104 @@
+import definitions
+import multiprocessing
+import numpy
+import traceback
+
+from multiprocessing import shared_memory
+
+try:
+    import cairo
+except ImportError:
+    cairo = None  # Renderer process can only be used with the cairo display backend
+
+
+def renderer_process_main(conn, shm_name, n_slots, width, height, stride):
+    """Main function of the renderer process. Waits for (slot, ops) messages, renders the recorded drawing
+    operations into the given slot of the shared memory frame ring and replies with the slot number.
+    """
+    from display_utils import replay_recorded_ops
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = numpy.ndarray(shape=(n_slots, height, stride // 2), dtype=numpy.uint16, buffer=shm.buf)
+    surfaces = [cairo.ImageSurface.create_for_data(slots[i], cairo.FORMAT_RGB16_565, width, height, stride) for i in range(n_slots)]
+    contexts = [cairo.Context(surface) for surface in surfaces]
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            slot, ops = msg
+            surface = surfaces[slot]
+            ctx = contexts[slot]
+            surface.flush()
+            slots[slot].fill(0)
+            surface.mark_dirty()
+            ctx.save()
+            try:
+                replay_recorded_ops(ctx, ops)
+            except Exception:
+                traceback.print_exc()
+            ctx.restore()
+            surface.flush()
+            conn.send(slot)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del contexts, surfaces, slots
+        shm.close()
+
+
+class DisplayRendererProcess(object):
+    """Renders display frames in a separate process so that cairo rendering does not compete for the GIL with MIDI
+    handling threads. The app records the drawing operations of a frame (see display_utils.RecordingContext), which
+    are sent to the renderer process. Rendered RGB565 frames are written in a ring of frame slots in shared memory
+    so that frames don't need to be copied back to the app process.
+    """
+
+    def __init__(self, width, height, n_slots=2):
+        self.width = width
+        self.height = height
+        self.n_slots = n_slots
+        self.next_slot = 0
+        stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_RGB16_565, width)
+        self.shm = shared_memory.SharedMemory(create=True, size=n_slots * height * stride)
+        self.slots = numpy.ndarray(shape=(n_slots, height, stride // 2), dtype=numpy.uint16, buffer=self.shm.buf)
+        self.frames = [self.slots[i][:, :width].transpose() for i in range(n_slots)]  # (w, h) views, no data is copied
+
+        # Use "spawn" so the renderer process does not inherit the threads of the app (push2_python, rtmidi...)
+        mp_context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(target=renderer_process_main, args=(child_conn, self.shm.name, n_slots, width, height, stride), daemon=True)
+        self.process.start()
+        print('Started display renderer process (pid {0})'.format(self.process.pid))
+
+    def render(self, ops, timeout=definitions.DISPLAY_RENDERER_TIMEOUT):
+        # Sends the recorded drawing operations to the renderer process, waits until the frame has been rendered and
+        # returns it as a (w, h) numpy view of the shared memory slot. Raises TimeoutError if the renderer process does
+        # not reply in "timeout" seconds
+        slot = self.next_slot
+        self.next_slot = (self.next_slot + 1) % self.n_slots
+        self.conn.send((slot, ops))
+        if not self.conn.poll(timeout):
+            raise TimeoutError('Display renderer process did not render frame in {0} seconds'.format(timeout))
+        rendered_slot = self.conn.recv()
+        return self.frames[rendered_slot]
+
+    def stop(self, timeout=1.0):
+        # Stops the renderer process (terminating it if it does not finish in "timeout" seconds) and releases the
+        # shared memory
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=timeout)
+        self.conn.close()
+        del self.frames, self.slots
+        self.shm.unlink()
+        try:
+            self.shm.close()
+        except BufferError:
+            # A rendered frame is still referenced (e.g. by the transfer stage), memory will be released with it
+            pass
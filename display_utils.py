@@ -1,55 +1,284 @@
-import cairo
+import collections
 import definitions
+import functools
+import math
 import push2_python
+import threading
 
+try:
+    import cairo
+except ImportError:
+    cairo = None  # Only the numpy display backend can be used
 
-def show_title(ctx, x, h, text, color=[1, 1, 1]):
-    text = str(text)
-    ctx.set_source_rgb(*color)
-    ctx.select_font_face("Arial", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-    font_size = h//12
-    ctx.set_font_size(font_size)
-    ctx.move_to(x + 3, 20)
-    ctx.show_text(text)
+from numpy_backend import NumpySurface, NumpyContext
 
 
-def show_value(ctx, x, h, text, color=[1, 1, 1]):
-    text = str(text)
-    ctx.set_source_rgb(*color)
-    ctx.select_font_face("Arial", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-    font_size = h//8
-    ctx.set_font_size(font_size)
-    ctx.move_to(x + 3, 45)
-    ctx.show_text(text)
+TEXT_CACHE_MAX_BYTES = 4 * 1024 * 1024
+KNOB_ATLAS_MAX_BYTES = 8 * 1024 * 1024
+KNOB_RADIUS = 27.5
+KNOB_CIRCLE_BREAK_DEGREES = 80
+KNOB_SPRITE_PADDING = 2
+KNOB_BAR_HEIGHT = 6
+NOTIFICATION_BG_OPACITY = 0.8
+NOTIFICATION_MARGIN_LEFT = 8
 
 
-def draw_text_at(ctx, x, y, text, font_size = 12, color=[1, 1, 1]):
-    text = str(text)
+class TileCache(object):
+    """LRU cache of pre-rendered tiles (cairo surfaces) used to avoid re-rendering display elements that are drawn
+    again and again (text, knobs...). Tiles are only rendered the first time they are needed and then painted from
+    the cache. Total memory used by cached tiles is kept under "max_bytes" by evicting least recently used tiles.
+    Tiles can be safely requested from different threads (e.g. to warm the cache in the background).
+    """
+
+    def __init__(self, max_bytes):
+        self.tiles = collections.OrderedDict()
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def contains(self, key):
+        return key in self.tiles
+
+    def get(self, key, render_func):
+        # Returns the tile stored for key, or renders it calling render_func and stores it. Tiles are tuples whose
+        # first element is the cairo surface
+        with self.lock:
+            tile = self.tiles.get(key, None)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+                self.hits += 1
+                return tile
+            self.misses += 1
+        tile = render_func()  # Render outside the lock so other threads don't wait for it
+        with self.lock:
+            if key not in self.tiles:
+                self.tiles[key] = tile
+                self.n_bytes += self.get_tile_bytes(tile)
+                while self.n_bytes > self.max_bytes and len(self.tiles) > 1:
+                    _, evicted_tile = self.tiles.popitem(last=False)
+                    self.n_bytes -= self.get_tile_bytes(evicted_tile)
+                    self.evictions += 1
+        return tile
+
+    def get_tile_bytes(self, tile):
+        surface = tile[0]
+        return surface.get_stride() * surface.get_height()
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+            self.n_bytes = 0
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'n_tiles': len(self.tiles),
+            'n_bytes': self.n_bytes,
+        }
+
+
+class RecordingContext(object):
+    """Stand-in for a cairo context which records drawing operations instead of executing them. Recorded operations
+    are a compact description of a frame which can be sent to another process and replayed there with
+    "replay_recorded_ops" on a real cairo context. Calls to cairo context methods are recorded as they are, while
+    calls to display helpers decorated with "recordable" are recorded as a single operation.
+    Note that methods which return values (e.g. text_extents) can't be used with a recording context.
+    """
+
+    def __init__(self):
+        self.ops = []
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.ops.append((name, args, None, False))
+        return record
+
+
+recordable_helpers = {}
+
+
+def recordable(func):
+    # Decorator for display helpers so that, when called with a RecordingContext, the call is recorded instead of executed
+    recordable_helpers[func.__name__] = func
+
+    @functools.wraps(func)
+    def wrapper(ctx, *args, **kwargs):
+        if isinstance(ctx, RecordingContext):
+            ctx.ops.append((func.__name__, args, kwargs, True))
+        else:
+            return func(ctx, *args, **kwargs)
+    return wrapper
+
+
+def replay_recorded_ops(ctx, ops):
+    for name, args, kwargs, is_helper in ops:
+        if is_helper:
+            recordable_helpers[name](ctx, *args, **kwargs)
+        else:
+            getattr(ctx, name)(*args)
+
+
+display_backend = definitions.DISPLAY_BACKEND_CAIRO if cairo is not None else definitions.DISPLAY_BACKEND_NUMPY
+
+
+def set_display_backend(backend):
+    # Sets the backend used to create display surfaces. This should be called at startup, before any surface is created
+    global display_backend
+    if backend == definitions.DISPLAY_BACKEND_CAIRO and cairo is None:
+        print('pycairo is not available, using numpy display backend')
+        backend = definitions.DISPLAY_BACKEND_NUMPY
+    display_backend = backend
+    return display_backend
+
+
+def create_surface(width, height):
+    # Returns a new RGB565 surface and its drawing context for the current display backend
+    if display_backend == definitions.DISPLAY_BACKEND_NUMPY:
+        surface = NumpySurface(width, height)
+        return surface, NumpyContext(surface)
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB16_565, width, height)
+    return surface, cairo.Context(surface)
+
+
+def create_surface_for_data(data, width, height):
+    # Returns an RGB565 surface (and its drawing context) for the current display backend using the memory of the
+    # given (height, stride/2) numpy uint16 array
+    if display_backend == definitions.DISPLAY_BACKEND_NUMPY:
+        surface = NumpySurface(width, height, data=data[:, :width])
+        return surface, NumpyContext(surface)
+    surface = cairo.ImageSurface.create_for_data(data, cairo.FORMAT_RGB16_565, width, height, data.strides[0])
+    return surface, cairo.Context(surface)
+
+
+def get_surface_stride(width):
+    if display_backend == definitions.DISPLAY_BACKEND_NUMPY:
+        return width * 2
+    return cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_RGB16_565, width)
+
+
+render_quality = definitions.RENDER_QUALITY_FULL
+
+
+def get_render_quality():
+    return render_quality
+
+
+def set_render_quality(quality):
+    global render_quality
+    render_quality = quality
+
+
+@recordable
+def apply_render_quality(ctx, quality):
+    # Sets the render quality level used by the display helpers and configures the context accordingly. This is
+    # recordable so that the level is also applied when frames are rendered in a renderer process
+    set_render_quality(quality)
+    if not isinstance(ctx, NumpyContext):
+        ctx.set_antialias(cairo.ANTIALIAS_DEFAULT if quality < definitions.RENDER_QUALITY_NO_ANTIALIAS else cairo.ANTIALIAS_NONE)
+
+
+def use_antialias():
+    return render_quality < definitions.RENDER_QUALITY_NO_ANTIALIAS
+
+
+text_cache = TileCache(max_bytes=TEXT_CACHE_MAX_BYTES)
+
+# Font face is created once and reused when rendering all text tiles
+font_face = cairo.ToyFontFace("Arial", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL) if cairo is not None else None
+
+# Context only used to measure text when rendering new tiles
+measure_ctx = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)) if cairo is not None else None
+
+
+def set_tile_font(ctx, antialias):
+    ctx.set_font_face(font_face)
+    if not antialias:
+        font_options = cairo.FontOptions()
+        font_options.set_antialias(cairo.ANTIALIAS_NONE)
+        ctx.set_font_options(font_options)
+        ctx.set_antialias(cairo.ANTIALIAS_NONE)
+
+
+def render_text_line_tile(text, font_size, color, antialias):
+    # Renders a single line of text and returns (surface, origin_x, origin_y), where origin is the position of the
+    # text reference point (the point that would be passed to ctx.move_to) inside the tile
+    measure_ctx.set_font_face(font_face)
+    measure_ctx.set_font_size(font_size)
+    (x_bearing, _, width, _, x_advance, _) = measure_ctx.text_extents(text)
+    (ascent, descent, _, _, _) = measure_ctx.font_extents()
+    origin_x = 1 - math.floor(min(0, x_bearing))
+    origin_y = 1 + math.ceil(ascent)
+    tile_w = max(1, origin_x + math.ceil(max(x_advance, x_bearing + width)) + 1)
+    tile_h = max(1, origin_y + math.ceil(descent) + 1)
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, tile_w, tile_h)
+    ctx = cairo.Context(surface)
     ctx.set_source_rgb(*color)
-    ctx.select_font_face("Arial", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+    set_tile_font(ctx, antialias)
     ctx.set_font_size(font_size)
-    ctx.move_to(x, y)
+    ctx.move_to(origin_x, origin_y)
     ctx.show_text(text)
+    surface.flush()
+    return (surface, origin_x, origin_y)
 
 
-def show_text(ctx, x_part, pixels_from_top, text, height=20, font_color=definitions.WHITE, background_color=None, margin_left=4, margin_top=4, font_size_percentage=0.8, center_vertically=True, center_horizontally=False, rectangle_padding=0):
-    assert 0 <= x_part < 8
-    assert type(x_part) == int
+def set_source_color(ctx, color_name):
+    # Sets a color of the color table as the source of the context (the numpy backend uses its precomputed RGB565 value)
+    if isinstance(ctx, NumpyContext):
+        ctx.set_source_color(color_name)
+    else:
+        ctx.set_source_rgb(*definitions.get_color_rgb_float(color_name))
 
-    display_w = push2_python.constants.DISPLAY_LINE_PIXELS
-    display_h = push2_python.constants.DISPLAY_N_LINES
-    part_w = display_w // 8
-    x1 = part_w * x_part
-    y1 = pixels_from_top
 
+def paint_tile(ctx, surface, x, y):
     ctx.save()
+    ctx.set_source_surface(surface, round(x), round(y))
+    ctx.paint()
+    ctx.restore()
+
+
+def paint_text_line(ctx, x, y, text, font_size, color):
+    # Paints a single line of text with its reference point at (x, y) using the text tile cache
+    if isinstance(ctx, NumpyContext):
+        # Numpy backend draws text from its own glyph atlas, no need for tiles
+        ctx.set_source_rgb(*color)
+        ctx.set_font_size(font_size)
+        ctx.move_to(x, y)
+        ctx.show_text(text)
+        return
+    color = tuple(color)
+    antialias = use_antialias()
+    surface, origin_x, origin_y = text_cache.get(('line', text, font_size, color, antialias), lambda: render_text_line_tile(text, font_size, color, antialias))
+    paint_tile(ctx, surface, x - origin_x, y - origin_y)
+
+
+@recordable
+def show_title(ctx, x, h, text, color=[1, 1, 1]):
+    paint_text_line(ctx, x + 3, 20, str(text), h//12, color)
+
+
+@recordable
+def show_value(ctx, x, h, text, color=[1, 1, 1]):
+    paint_text_line(ctx, x + 3, 45, str(text), h//8, color)
+
+
+@recordable
+def draw_text_at(ctx, x, y, text, font_size = 12, color=[1, 1, 1]):
+    paint_text_line(ctx, x, y, str(text), font_size, color)
 
+
+def render_text_box(ctx, x1, y1, part_w, text, height, font_color, background_color, margin_left, margin_top, font_size_percentage, center_vertically, center_horizontally, rectangle_padding):
     if background_color is not None:
-        ctx.set_source_rgb(*definitions.get_color_rgb_float(background_color))
+        set_source_color(ctx, background_color)
         ctx.rectangle(x1 + rectangle_padding, y1 + rectangle_padding, part_w - rectangle_padding * 2, height - rectangle_padding * 2)
         ctx.fill()
-    ctx.set_source_rgb(*definitions.get_color_rgb_float(font_color))
-    ctx.select_font_face("Arial", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+    set_source_color(ctx, font_color)
+    ctx.set_font_face(font_face)
     font_size = round(int(height * font_size_percentage))
     text_lines = text.split('\n')
     n_lines = len(text_lines)
@@ -64,26 +293,143 @@ def show_text(ctx, x_part, pixels_from_top, text, height=20, font_color=definiti
             ctx.move_to(x1 + margin_left, y1 + font_size * (i + 1) + margin_top - 2)
         ctx.show_text(line)
 
-    ctx.restore()
 
+def render_text_box_tile(antialias, *text_box_args):
+    # Renders a text box (see "show_text") in a tile with the size of the box
+    part_w = text_box_args[0]
+    height = text_box_args[2]
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, part_w, max(1, height))
+    ctx = cairo.Context(surface)
+    set_tile_font(ctx, antialias)
+    render_text_box(ctx, 0, 0, *text_box_args)
+    surface.flush()
+    return (surface, )
+
+
+@recordable
+def show_text(ctx, x_part, pixels_from_top, text, height=20, font_color=definitions.WHITE, background_color=None, margin_left=4, margin_top=4, font_size_percentage=0.8, center_vertically=True, center_horizontally=False, rectangle_padding=0):
+    assert 0 <= x_part < 8
+    assert type(x_part) == int
+
+    display_w = push2_python.constants.DISPLAY_LINE_PIXELS
+    part_w = display_w // 8
+    x1 = part_w * x_part
+    y1 = pixels_from_top
+
+    # Text box is rendered once and then painted from the text tile cache
+    text_box_args = (part_w, text, height, font_color, background_color, margin_left, margin_top, font_size_percentage, center_vertically, center_horizontally, rectangle_padding)
+    if isinstance(ctx, NumpyContext):
+        render_text_box(ctx, x1, y1, *text_box_args)
+        return
+    antialias = use_antialias()
+    surface, = text_cache.get(('box', antialias) + text_box_args, lambda: render_text_box_tile(antialias, *text_box_args))
+    paint_tile(ctx, surface, x1, y1)
+
+def draw_knob_arcs(ctx, xc, yc, color, value, vmin, vmax):
+    start_rad = (90 + KNOB_CIRCLE_BREAK_DEGREES // 2) * (math.pi / 180)
+    end_rad = (90 - KNOB_CIRCLE_BREAK_DEGREES // 2) * (math.pi / 180)
+    total_degrees = 360 - KNOB_CIRCLE_BREAK_DEGREES
+    value_rad = start_rad + total_degrees * ((value - vmin)/(vmax - vmin)) * (math.pi / 180)
+
+    # Inner circle
+    ctx.arc(xc, yc, KNOB_RADIUS, start_rad, end_rad)
+    set_source_color(ctx, definitions.GRAY_LIGHT)
+    ctx.set_line_width(1)
+    ctx.stroke()
+
+    # Outer circle
+    ctx.arc(xc, yc, KNOB_RADIUS, start_rad, value_rad)
+    set_source_color(ctx, color)
+    ctx.set_line_width(3)
+    ctx.stroke()
+
+
+def render_knob_sprite(color, value, vmin, vmax):
+    # Renders a knob with its center at (origin, origin) of the sprite and returns (surface, origin, origin)
+    origin = KNOB_RADIUS + KNOB_SPRITE_PADDING
+    size = math.ceil(2 * origin)
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, size, size)
+    ctx = cairo.Context(surface)
+    draw_knob_arcs(ctx, origin, origin, color, value, vmin, vmax)
+    surface.flush()
+    return (surface, origin, origin)
+
+
+class KnobSpriteAtlas(object):
+    """Lazily generated sprites of MIDI CC knobs for every (color, value) pair, so that drawing a knob is a
+    blit instead of computing and stroking arcs. Sprites are stored in a memory-bounded LRU tile cache. All the
+    sprites for a given color and range of values can be rendered in the background using "warm".
+    """
+
+    def __init__(self, max_bytes=KNOB_ATLAS_MAX_BYTES):
+        self.cache = TileCache(max_bytes=max_bytes)
+        self.warmed = set()
+
+    def get_sprite(self, color, value, vmin, vmax):
+        return self.cache.get((color, value, vmin, vmax), lambda: render_knob_sprite(color, value, vmin, vmax))
+
+    def warm(self, color, vmin, vmax):
+        # Start rendering all sprites for color and range in a background thread (only once per color and range)
+        if (color, vmin, vmax) in self.warmed:
+            return
+        self.warmed.add((color, vmin, vmax))
+        threading.Thread(target=self.render_sprites, args=(color, vmin, vmax), daemon=True).start()
+
+    def render_sprites(self, color, vmin, vmax):
+        for value in range(vmin, vmax + 1):
+            self.get_sprite(color, value, vmin, vmax)
+
+
+knob_sprite_atlas = KnobSpriteAtlas()
+
+
+@recordable
+def draw_knob(ctx, xc, yc, color, value, vmin, vmax):
+    # Paints a knob centered at (xc, yc) from the knob sprite atlas (or a simple bar in low render quality levels)
+    if render_quality >= definitions.RENDER_QUALITY_LABELS_ONLY:
+        return
+    if render_quality >= definitions.RENDER_QUALITY_SIMPLE:
+        draw_knob_bar(ctx, xc, yc, color, value, vmin, vmax)
+        return
+    if isinstance(ctx, NumpyContext):
+        # Numpy backend strokes arcs fast enough, no need for sprites
+        draw_knob_arcs(ctx, xc, yc, color, value, vmin, vmax)
+        return
+    sprite, origin_x, origin_y = knob_sprite_atlas.get_sprite(color, value, vmin, vmax)
+    paint_tile(ctx, sprite, xc - origin_x, yc - origin_y)
+
+
+def draw_knob_bar(ctx, xc, yc, color, value, vmin, vmax):
+    x = round(xc - KNOB_RADIUS)
+    y = round(yc - KNOB_BAR_HEIGHT / 2)
+    bar_w = round(2 * KNOB_RADIUS)
+    set_source_color(ctx, definitions.GRAY_DARK)
+    ctx.rectangle(x, y, bar_w, KNOB_BAR_HEIGHT)
+    ctx.fill()
+    set_source_color(ctx, color)
+    ctx.rectangle(x, y, round(bar_w * (value - vmin) / (vmax - vmin)), KNOB_BAR_HEIGHT)
+    ctx.fill()
+
+
+@recordable
 def show_notification(ctx, text, opacity=1.0):
+    if render_quality >= definitions.RENDER_QUALITY_SIMPLE:
+        opacity = 1.0  # Don't fade out notifications so identical frames are not re-sent while notification is shown
+
     ctx.save()
 
     # Background
     display_w = push2_python.constants.DISPLAY_LINE_PIXELS
     display_h = push2_python.constants.DISPLAY_N_LINES
-    initial_bg_opacity = 0.8
-    ctx.set_source_rgba(0.0, 0.0, 0.0, initial_bg_opacity * opacity)
+    ctx.set_source_rgba(0.0, 0.0, 0.0, NOTIFICATION_BG_OPACITY * opacity)
     ctx.rectangle(0, 0, display_w, display_h)
     ctx.fill()
 
     # Text
-    initial_text_opacity = 1.0
-    ctx.set_source_rgba(1.0, 1.0, 1.0, initial_text_opacity * opacity)
+    ctx.set_source_rgba(1.0, 1.0, 1.0, opacity)
     font_size = display_h // 4
     ctx.set_font_size(font_size)
-    margin_left = 8
-    ctx.move_to(margin_left, 2.2 * font_size)
+    ctx.move_to(NOTIFICATION_MARGIN_LEFT, 2.2 * font_size)
     ctx.show_text(text)
 
     ctx.restore()
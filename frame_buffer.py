@@ -0,0 +1,67 @@
+import numpy
+import push2_python
+
+from display_utils import create_surface_for_data, get_surface_stride
+
+
+class FrameBuffer(object):
+    """An RGB565 surface (of the current display backend) whose pixel memory is owned by a numpy array. The
+    surface, its context and a (width x height) view of the pixels (the layout push2_python expects) are created
+    once and reused.
+    """
+
+    def __init__(self, width, height):
+        stride = get_surface_stride(width)
+        self.data = numpy.zeros(shape=(height, stride // 2), dtype=numpy.uint16)
+        self.surface, self.ctx = create_surface_for_data(self.data, width, height)
+        self.frame = self.data[:, :width].transpose()  # This is a view, no data is copied
+
+    def clear(self):
+        self.surface.flush()
+        self.data.fill(0)
+        self.surface.mark_dirty()
+
+
+class FrameBufferManager(object):
+    """Manages a pair of preallocated frame buffers (front and back) so that no surfaces, contexts or
+    arrays need to be allocated when rendering a new frame. Modes draw into the back buffer, and once the
+    frame has been sent to Push2 buffers are swapped so the last frame sent is always available in front.
+    """
+
+    def __init__(self, width=push2_python.constants.DISPLAY_LINE_PIXELS, height=push2_python.constants.DISPLAY_N_LINES):
+        self.width = width
+        self.height = height
+        self.front = FrameBuffer(width, height)
+        self.back = FrameBuffer(width, height)
+        self.diff = numpy.zeros(shape=self.back.data.shape, dtype=bool)  # Preallocated output for frame comparisons
+        self.front_is_valid = False  # Front buffer only holds what Push2 is showing after a frame has been sent
+
+    def begin_frame(self):
+        # Clears the back buffer and returns its context ready to be drawn. Context state is saved here and
+        # restored in end_frame so nothing set by the modes leaks into the next frame
+        self.back.clear()
+        self.back.ctx.save()
+        self.back.ctx.new_path()
+        return self.back.ctx
+
+    def end_frame(self):
+        # Returns the rendered frame as a (width x height) uint16 RGB565 numpy view of the back buffer
+        self.back.ctx.restore()
+        self.back.surface.flush()
+        return self.back.frame
+
+    def back_matches_front(self):
+        # Returns True if the frame rendered in the back buffer is identical to the last frame sent (front buffer)
+        if not self.front_is_valid:
+            return False
+        numpy.not_equal(self.back.data, self.front.data, out=self.diff)
+        return not self.diff.any()
+
+    def invalidate(self):
+        # Call this when the contents of the Push2 display might no longer match the front buffer (e.g. display
+        # was turned off or Push2 reconnected) so the next frame is always sent
+        self.front_is_valid = False
+
+    def swap(self):
+        self.front, self.back = self.back, self.front
+        self.front_is_valid = True
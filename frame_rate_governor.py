@@ -0,0 +1,77 @@
+import definitions
+import threading
+import time
+
+
+class FrameRateGovernor(object):
+    """Decides the rate at which display frames are rendered so that CPU is not wasted rendering identical frames
+    when nobody is interacting with Push2 (CPU which is better spent handling MIDI).
+
+    - While there is user activity (encoders, pads, buttons, incoming MIDI...) or a notification is being shown,
+      frames are rendered at the "active" rate (target_frame_rate setting by default).
+    - When there has been no activity for FRAME_RATE_IDLE_TIMEOUT seconds, frames are rendered at the "idle" rate.
+    - When the display is turned off, the render loop only wakes up at the "display off" rate to check if it has
+      been turned back on.
+
+    Modes can ask for different active/idle frame rates using their "active_frame_rate" and "idle_frame_rate"
+    attributes, and these can also be overridden in settings.json using the "mode_frame_rates" setting, e.g.
+    {"mode_frame_rates": {"MIDICCMode": [30, 5]}}. If several active modes ask for a frame rate, the highest one is
+    used. If none of them does, the app defaults are used.
+    """
+
+    def __init__(self, app, settings=None):
+        if settings is None:
+            settings = {}
+        self.app = app
+        self.idle_frame_rate = settings.get('idle_frame_rate', definitions.DEFAULT_IDLE_FRAME_RATE)
+        self.display_off_frame_rate = settings.get('display_off_frame_rate', definitions.DEFAULT_DISPLAY_OFF_FRAME_RATE)
+        self.mode_frame_rates = settings.get('mode_frame_rates', {})
+        self.last_activity_time = time.time()
+        self.is_idle = False
+        self.effective_frame_rate = app.target_frame_rate
+        self.wake_event = threading.Event()
+
+    def get_settings_to_save(self):
+        return {
+            'idle_frame_rate': self.idle_frame_rate,
+            'display_off_frame_rate': self.display_off_frame_rate,
+            'mode_frame_rates': self.mode_frame_rates,
+        }
+
+    def notify_activity(self):
+        # Called whenever something happens that is likely to change what is shown in the display. If render loop
+        # is sleeping at the idle rate, wake it up so the display reacts immediately
+        self.last_activity_time = time.time()
+        if self.is_idle:
+            self.is_idle = False
+            self.wake_event.set()
+
+    def get_mode_frame_rate(self, mode, idle):
+        # Returns the frame rate asked by the given mode (or None if mode does not ask for any specific frame rate)
+        active_frame_rate, idle_frame_rate = self.mode_frame_rates.get(mode.__class__.__name__, (mode.active_frame_rate, mode.idle_frame_rate))
+        return idle_frame_rate if idle else active_frame_rate
+
+    def update_effective_frame_rate(self):
+        # Computes the rate at which the next frame should be rendered. This is called once per frame by the render
+        # stage of the display pipeline
+        if not self.app.use_push2_display:
+            self.is_idle = True
+            self.effective_frame_rate = self.display_off_frame_rate
+            return self.effective_frame_rate
+
+        self.is_idle = self.app.notification_text is None and \
+            time.time() - self.last_activity_time > definitions.FRAME_RATE_IDLE_TIMEOUT
+        frame_rates = [self.get_mode_frame_rate(mode, self.is_idle) for mode in self.app.active_modes]
+        frame_rates = [frame_rate for frame_rate in frame_rates if frame_rate is not None]
+        if frame_rates:
+            self.effective_frame_rate = max(frame_rates)
+        else:
+            self.effective_frame_rate = self.idle_frame_rate if self.is_idle else self.app.target_frame_rate
+        return self.effective_frame_rate
+
+    def sleep(self, seconds):
+        # Sleeps the given time unless woken up by some activity (or by the display pipeline being stopped). Returns
+        # True if woken up before the time had passed
+        woken_up = self.wake_event.wait(seconds)
+        self.wake_event.clear()
+        return woken_up
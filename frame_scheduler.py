@@ -0,0 +1,92 @@
+import numpy
+import time
+
+
+class LatenessHistogram(object):
+    """Fixed-size histogram of frame lateness values (time between the deadline of a frame and the moment it actually
+    started). Memory usage does not grow with the number of frames recorded, and percentiles can be queried at any
+    time (e.g. to be shown in the display).
+    """
+
+    def __init__(self, max_lateness=0.1, n_bins=200):
+        self.bin_width = max_lateness / n_bins
+        self.counts = numpy.zeros(n_bins + 1, dtype=numpy.int64)  # Last bin counts any lateness >= max_lateness
+        self.max_value = 0.0
+        self.n_values = 0
+
+    def record(self, lateness):
+        if lateness < 0:
+            lateness = 0.0
+        bin_idx = min(int(lateness / self.bin_width), len(self.counts) - 1)
+        self.counts[bin_idx] += 1
+        self.n_values += 1
+        if lateness > self.max_value:
+            self.max_value = lateness
+
+    def reset(self):
+        self.counts.fill(0)
+        self.max_value = 0.0
+        self.n_values = 0
+
+    def get_percentile(self, percentile):
+        # Returns the lateness (in seconds) below which the given percentage of recorded values fall. Values are
+        # approximated to the upper edge of the histogram bin (and to the max value for the overflow bin)
+        if self.n_values == 0:
+            return 0.0
+        cumulative_counts = numpy.cumsum(self.counts)
+        bin_idx = int(numpy.searchsorted(cumulative_counts, self.n_values * percentile / 100.0))
+        if bin_idx >= len(self.counts) - 1:
+            return self.max_value
+        return min((bin_idx + 1) * self.bin_width, self.max_value)
+
+    def get_stats(self):
+        return {
+            'n': self.n_values,
+            'p50': self.get_percentile(50),
+            'p95': self.get_percentile(95),
+            'p99': self.get_percentile(99),
+            'max': self.max_value,
+        }
+
+
+class DeadlineScheduler(object):
+    """Schedules the iterations of a loop using absolute deadlines measured with a monotonic clock, so that the loop
+    rate does not drift (sleep inaccuracies don't accumulate) and is not affected by wall clock changes.
+
+    If an iteration starts late but less than one period after its deadline, the next iteration is scheduled at its
+    normal deadline so the loop catches up. If it is late by one period or more, the deadlines that were missed are
+    skipped (and counted) instead of running a burst of iterations to catch up.
+    Lateness of every iteration is recorded in a LatenessHistogram.
+    """
+
+    def __init__(self):
+        self.next_deadline = None
+        self.missed_deadlines = 0
+        self.lateness = LatenessHistogram()
+
+    def reset(self):
+        # Start counting deadlines from now (e.g. after the loop was woken up before its deadline)
+        self.next_deadline = time.perf_counter()
+
+    def iteration_started(self):
+        # Call this at the start of every iteration of the loop
+        if self.next_deadline is not None:
+            self.lateness.record(time.perf_counter() - self.next_deadline)
+
+    def schedule_next(self, period):
+        # Call this at the end of every iteration of the loop. Returns the time to wait until the deadline of the next
+        # iteration (0 if it should start right away)
+        now = time.perf_counter()
+        if self.next_deadline is None:
+            self.next_deadline = now
+        self.next_deadline += period
+        if now - self.next_deadline >= period:
+            n_missed = int((now - self.next_deadline) // period)
+            self.next_deadline += n_missed * period
+            self.missed_deadlines += n_missed
+        return max(0.0, self.next_deadline - now)
+
+    def get_stats(self):
+        stats = self.lateness.get_stats()
+        stats['missed'] = self.missed_deadlines
+        return stats
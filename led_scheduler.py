@@ -0,0 +1,18 @@
+from output_scheduler import PacedOutputScheduler
+
+
+LED_PRIORITY_PAD_FEEDBACK = 0  # Color of pads being pressed
+LED_PRIORITY_NOTES = 1  # Pads illuminated because of notes being played (or any other pad color)
+LED_PRIORITY_DECORATIVE = 2  # Button colors
+LED_PRIORITY_PRESSURE = 3  # Pad colors showing pad pressure (see MelodicMode.set_pad_pressure)
+N_LED_PRIORITIES = 4
+
+
+class LEDOutputScheduler(PacedOutputScheduler):
+    """Schedules the LED color messages sent to Push2 so that bursts of LED updates (e.g. switching tracks while
+    playing) don't delay the feedback of the pads being played, which shares the same USB MIDI link. Keys are the
+    LEDs and priorities are the LED_PRIORITY_* constants (see PacedOutputScheduler).
+    """
+
+    def __init__(self, send_func, messages_per_ms=2.0, max_burst=32):
+        super().__init__(send_func, n_priorities=N_LED_PRIORITIES, messages_per_ms=messages_per_ms, max_burst=max_burst)
@@ -0,0 +1,154 @@
+import definitions
+import threading
+
+from color_palette import ColorPaletteAllocator
+from led_scheduler import LEDOutputScheduler, LED_PRIORITY_PAD_FEEDBACK, LED_PRIORITY_NOTES, LED_PRIORITY_DECORATIVE
+
+
+class LEDShadow(object):
+    """Shadow copy of the colors of Push2 pads and buttons. Modes set pad and button colors through the shadow
+    (with the same methods they'd use with push2_python) and that only updates the shadow state. Then, "flush" is
+    called once per iteration of the control loop and sends to Push2 only the pads and buttons whose color (or
+    animation) is different from the one last sent. Repeated calls that set the same colors (e.g. when re-activating
+    modes or switching tracks) generate no MIDI traffic at all. Changed pads and buttons are sent through an
+    LEDOutputScheduler which sends them by priority within a bandwidth budget.
+
+    Colors which are not in the Push2 color palette yet (custom RGB colors) are assigned a palette entry by a
+    ColorPaletteAllocator when flushing, and new palette entries are uploaded before sending the LED updates.
+
+    Animated colors in Push2 blink/pulse between the last static color and the animated one, that is why modes set
+    a static color right before setting an animated one. The shadow remembers that static color and sends it before
+    the animated color when flushing.
+    """
+
+    def __init__(self, app, messages_per_ms=2.0):
+        self.app = app
+        self.lock = threading.Lock()
+        self.buttons = {}  # button_name -> (color, animation, animation_start_color)
+        self.sent_buttons = {}
+        self.dirty_buttons = {}  # Buttons set since last flush -> priority (only these need to be compared with sent state)
+        self.pads = {}  # pad_ij -> (color, animation, animation_start_color)
+        self.sent_pads = {}
+        self.dirty_pads = {}
+        self.scheduler = LEDOutputScheduler(self.send_state, messages_per_ms=messages_per_ms)
+        self.palette = ColorPaletteAllocator(app)
+
+    @property
+    def push(self):
+        return self.app.push
+
+    def get_new_state(self, current_state, color, animation):
+        if animation is None:
+            return (color, None, None)
+        # Animated color starts from the static color that was set before (if any)
+        animation_start_color = current_state[0] if current_state is not None and current_state[1] is None else None
+        return (color, animation, animation_start_color)
+
+    def set_button_color(self, button_name, color, animation=None, priority=LED_PRIORITY_DECORATIVE):
+        with self.lock:
+            self.buttons[button_name] = self.get_new_state(self.buttons.get(button_name, None), color, animation)
+            self.dirty_buttons[button_name] = min(priority, self.dirty_buttons.get(button_name, priority))
+
+    def set_all_buttons_color(self, color, animation=None, priority=LED_PRIORITY_DECORATIVE):
+        for button_name in self.push.buttons.available_names:
+            self.set_button_color(button_name, color, animation=animation, priority=priority)
+
+    def set_pad_color(self, pad_ij, color, animation=None, priority=LED_PRIORITY_NOTES):
+        pad_ij = tuple(pad_ij)
+        with self.lock:
+            self.pads[pad_ij] = self.get_new_state(self.pads.get(pad_ij, None), color, animation)
+            self.dirty_pads[pad_ij] = min(priority, self.dirty_pads.get(pad_ij, priority))
+
+    def set_pads_color(self, color_matrix, animation=None, priority=LED_PRIORITY_NOTES):
+        for i, row_colors in enumerate(color_matrix):
+            for j, color in enumerate(row_colors):
+                self.set_pad_color((i, j), color, animation=animation, priority=priority)
+
+    def set_all_pads_to_color(self, color, animation=None, priority=LED_PRIORITY_NOTES):
+        self.set_pads_color([[color] * 8 for _ in range(0, 8)], animation=animation, priority=priority)
+
+    def mark_pad_feedback(self, pad_ij):
+        # Gives the highest priority to the pending update of the given pad (used for the pad being pressed)
+        pad_ij = tuple(pad_ij)
+        with self.lock:
+            if pad_ij in self.dirty_pads:
+                self.dirty_pads[pad_ij] = LED_PRIORITY_PAD_FEEDBACK
+
+    def invalidate(self, full=True):
+        # Call this when the state of the Push2 LEDs is unknown (e.g. after reconnecting) so the next flush sends the
+        # colors of all pads and buttons. If full=False, only LEDs last sent as off (or never sent) are assumed to be
+        # off, as they are both if Push2 restarted or not. The rest are sent again even if they should now be off,
+        # because they might have been set to off while disconnected and Push2 might still show the old color
+        with self.lock:
+            if full:
+                self.sent_buttons = {}
+                self.sent_pads = {}
+            else:
+                off_state = (definitions.BLACK, None, None)
+                self.sent_buttons = {button_name: off_state for button_name in self.buttons
+                                     if self.sent_buttons.get(button_name, off_state) == off_state}
+                self.sent_pads = {pad_ij: off_state for pad_ij in self.pads
+                                  if self.sent_pads.get(pad_ij, off_state) == off_state}
+            for button_name in self.buttons:
+                self.dirty_buttons.setdefault(button_name, LED_PRIORITY_DECORATIVE)
+            for pad_ij in self.pads:
+                self.dirty_pads.setdefault(pad_ij, LED_PRIORITY_NOTES)
+
+    def get_colors_in_use(self):
+        # Returns the colors of the pads and buttons (both the ones set and the ones last sent), must be called with
+        # the lock acquired
+        colors = set()
+        for states in (self.buttons, self.sent_buttons, self.pads, self.sent_pads):
+            for color, _, animation_start_color in states.values():
+                colors.add(color)
+                colors.add(animation_start_color)
+        return colors
+
+    def flush(self, ignore_budget=False):
+        # Queues the pads and buttons that changed since last flush and sends as many queued updates as the LED
+        # output budget allows (or all of them if ignore_budget=True). Returns the number of messages sent
+        if not self.push.midi_is_configured():
+            return 0
+        with self.lock:
+            for button_name, priority in self.dirty_buttons.items():
+                if self.sent_buttons.get(button_name, None) != self.buttons[button_name]:
+                    state = self.buttons[button_name]
+                    palette_state = self.palette.get_state(state, self.get_colors_in_use)
+                    self.scheduler.enqueue(('button', button_name), (state, palette_state), priority)
+                else:
+                    self.scheduler.discard(('button', button_name))
+            self.dirty_buttons.clear()
+            for pad_ij, priority in self.dirty_pads.items():
+                if self.sent_pads.get(pad_ij, None) != self.pads[pad_ij]:
+                    state = self.pads[pad_ij]
+                    palette_state = self.palette.get_state(state, self.get_colors_in_use)
+                    self.scheduler.enqueue(('pad', pad_ij), (state, palette_state), priority)
+                else:
+                    self.scheduler.discard(('pad', pad_ij))
+            self.dirty_pads.clear()
+            self.palette.upload_pending()
+            return self.scheduler.run(ignore_budget=ignore_budget)
+
+    def send_state(self, key, states):
+        # Sends the state of a pad or button to Push2 and returns the number of MIDI messages sent. "states" is a
+        # (state, palette_state) tuple where palette_state is the state actually sent (with colors that can be shown
+        # by Push2, see ColorPaletteAllocator.get_state). The state set by the modes is the one stored as sent so
+        # that it compares equal in the next flushes even if a fallback color had to be used
+        kind, name = key
+        state, palette_state = states
+        if kind == 'button':
+            set_color_func = self.push.buttons.set_button_color
+            self.sent_buttons[name] = state
+        else:
+            set_color_func = self.push.pads.set_pad_color
+            self.sent_pads[name] = state
+        color, animation, animation_start_color = palette_state
+        if animation is None:
+            set_color_func(name, color)
+            return 1
+        if animation_start_color is not None:
+            set_color_func(name, animation_start_color)
+            set_color_func(name, color, animation=animation)
+            return 2
+        set_color_func(name, color, animation=animation)
+        return 1
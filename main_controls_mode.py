@@ -20,53 +20,53 @@ class MainControlsMode(definitions.PyshaMode):
         self.update_buttons()
 
     def deactivate(self):
-        self.push.buttons.set_button_color(MELODIC_RHYTHMIC_TOGGLE_BUTTON, definitions.BLACK)
-        self.push.buttons.set_button_color(TOGGLE_DISPLAY_BUTTON, definitions.BLACK)
-        self.push.buttons.set_button_color(SETTINGS_BUTTON, definitions.BLACK)
-        self.push.buttons.set_button_color(PYRAMID_TRACK_TRIGGERING_BUTTON, definitions.BLACK)
-        self.push.buttons.set_button_color(PRESET_SELECTION_MODE_BUTTON, definitions.BLACK)
-        self.push.buttons.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.BLACK)
+        self.app.leds.set_button_color(MELODIC_RHYTHMIC_TOGGLE_BUTTON, definitions.BLACK)
+        self.app.leds.set_button_color(TOGGLE_DISPLAY_BUTTON, definitions.BLACK)
+        self.app.leds.set_button_color(SETTINGS_BUTTON, definitions.BLACK)
+        self.app.leds.set_button_color(PYRAMID_TRACK_TRIGGERING_BUTTON, definitions.BLACK)
+        self.app.leds.set_button_color(PRESET_SELECTION_MODE_BUTTON, definitions.BLACK)
+        self.app.leds.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.BLACK)
 
     def update_buttons(self):
         # Note button, to toggle melodic/rhythmic mode
-        self.push.buttons.set_button_color(MELODIC_RHYTHMIC_TOGGLE_BUTTON, definitions.WHITE)
+        self.app.leds.set_button_color(MELODIC_RHYTHMIC_TOGGLE_BUTTON, definitions.WHITE)
 
         # Mute button, to toggle display on/off
         if self.app.use_push2_display:
-            self.push.buttons.set_button_color(TOGGLE_DISPLAY_BUTTON, definitions.WHITE)
+            self.app.leds.set_button_color(TOGGLE_DISPLAY_BUTTON, definitions.WHITE)
         else:
-            self.push.buttons.set_button_color(TOGGLE_DISPLAY_BUTTON, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(TOGGLE_DISPLAY_BUTTON, definitions.OFF_BTN_COLOR)
 
         # Settings button, to toggle settings mode
         if self.app.is_mode_active(self.app.settings_mode):
-            self.push.buttons.set_button_color(SETTINGS_BUTTON, definitions.BLACK)
-            self.push.buttons.set_button_color(SETTINGS_BUTTON, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
+            self.app.leds.set_button_color(SETTINGS_BUTTON, definitions.BLACK)
+            self.app.leds.set_button_color(SETTINGS_BUTTON, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
         else:
-            self.push.buttons.set_button_color(SETTINGS_BUTTON, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(SETTINGS_BUTTON, definitions.OFF_BTN_COLOR)
 
         # Pyramid track triggering mode
         if self.app.is_mode_active(self.app.pyramid_track_triggering_mode):
-            self.push.buttons.set_button_color(PYRAMID_TRACK_TRIGGERING_BUTTON, definitions.BLACK)
-            self.push.buttons.set_button_color(PYRAMID_TRACK_TRIGGERING_BUTTON, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
+            self.app.leds.set_button_color(PYRAMID_TRACK_TRIGGERING_BUTTON, definitions.BLACK)
+            self.app.leds.set_button_color(PYRAMID_TRACK_TRIGGERING_BUTTON, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
         else:
-            self.push.buttons.set_button_color(PYRAMID_TRACK_TRIGGERING_BUTTON, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(PYRAMID_TRACK_TRIGGERING_BUTTON, definitions.OFF_BTN_COLOR)
 
         # Preset selection mode
         if self.app.is_mode_active(self.app.preset_selection_mode):
-            self.push.buttons.set_button_color(PRESET_SELECTION_MODE_BUTTON, definitions.BLACK)
-            self.push.buttons.set_button_color(PRESET_SELECTION_MODE_BUTTON, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
+            self.app.leds.set_button_color(PRESET_SELECTION_MODE_BUTTON, definitions.BLACK)
+            self.app.leds.set_button_color(PRESET_SELECTION_MODE_BUTTON, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
         else:
-            self.push.buttons.set_button_color(PRESET_SELECTION_MODE_BUTTON, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(PRESET_SELECTION_MODE_BUTTON, definitions.OFF_BTN_COLOR)
 
         # DDRM tone selector mode
         if self.app.ddrm_tone_selector_mode.should_be_enabled():
             if self.app.is_mode_active(self.app.ddrm_tone_selector_mode):
-                self.push.buttons.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.BLACK)
-                self.push.buttons.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
+                self.app.leds.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.BLACK)
+                self.app.leds.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
             else:
-                self.push.buttons.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.OFF_BTN_COLOR)
+                self.app.leds.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.OFF_BTN_COLOR)
         else:
-            self.push.buttons.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.BLACK)
+            self.app.leds.set_button_color(DDRM_TONE_SELECTION_MODE_BUTTON, definitions.BLACK)
 
     def on_button_pressed(self, button_name):
         if button_name == MELODIC_RHYTHMIC_TOGGLE_BUTTON:
@@ -81,7 +81,8 @@ class MainControlsMode(definitions.PyshaMode):
         elif button_name == TOGGLE_DISPLAY_BUTTON:
             self.app.use_push2_display = not self.app.use_push2_display
             if not self.app.use_push2_display:
-                self.push.display.send_to_display(self.push.display.prepare_frame(self.push.display.make_black_frame()))
+                self.app.display_pipeline.request_black_frame()
+            self.app.display_pipeline.invalidate()
             self.app.buttons_need_update = True
             return True
         elif button_name == PYRAMID_TRACK_TRIGGERING_BUTTON:
@@ -1,16 +1,23 @@
 import definitions
 import mido
+import numpy
 import push2_python.constants
+import pad_layouts
 import time
 
+from active_notes import ActiveNotes
+from led_scheduler import LED_PRIORITY_PRESSURE
+
 
 class MelodicMode(definitions.PyshaMode):
 
     xor_group = 'pads'
 
-    notes_being_played = []
+    notes_being_played = None  # ActiveNotes object created in initialize (so every mode instance has its own)
     root_midi_note = 0  # default redefined in initialize
-    scale_pattern = [True, False, True, False, True, True, False, True, False, True, False, True]
+    scale_name = pad_layouts.DEFAULT_SCALE  # default redefined in initialize
+    in_key = False  # If True, only notes of the scale are laid out in the pads (default redefined in initialize)
+    row_interval = pad_layouts.DEFAULT_ROW_INTERVAL  # default redefined in initialize
     fixed_velocity_mode = False
     use_poly_at = False  # default redefined in initialize
     channel_at_range_start = 401  # default redefined in initialize
@@ -22,10 +29,16 @@ class MelodicMode(definitions.PyshaMode):
     latest_velocity_value = (0, 0)
     last_time_at_params_edited = None
     modulation_wheel_mode = False
+    pressure_leds = True  # default redefined in initialize
+    pad_pressure_steps = None  # pad_ij -> (pressure step shown in pad, time it was set)
+    pending_pad_pressure_steps = None  # pad_ij -> pressure step to show once the rate limit allows it
 
     lumi_midi_out = None
     last_time_tried_initialize_lumi = 0
 
+    layout_tables = None  # (note_map, valid_notes_mask, pad_class_map, note_to_pads) computed for layout_tables_key
+    layout_tables_key = None
+
     def init_lumi_midi_out(self):
         print('Configuring LUMI notes MIDI out...')
         self.last_time_tried_initialize_lumi = time.time()
@@ -53,9 +66,16 @@ class MelodicMode(definitions.PyshaMode):
             self.lumi_midi_out.send(msg)
    
     def initialize(self, settings=None):
+        self.notes_being_played = ActiveNotes()
+        self.pad_pressure_steps = {}
+        self.pending_pad_pressure_steps = {}
         if settings is not None:
             self.use_poly_at = settings.get('use_poly_at', True)
+            self.pressure_leds = settings.get('pressure_leds', True)
             self.set_root_midi_note(settings.get('root_midi_note', 64))
+            self.set_scale(settings.get('scale', pad_layouts.DEFAULT_SCALE))
+            self.in_key = settings.get('in_key', False)
+            self.set_row_interval(settings.get('row_interval', pad_layouts.DEFAULT_ROW_INTERVAL))
             self.channel_at_range_start = settings.get('channel_at_range_start', 401)
             self.channel_at_range_end = settings.get('channel_at_range_end', 800)
             self.poly_at_max_range = settings.get('poly_at_max_range', 40)
@@ -65,7 +85,11 @@ class MelodicMode(definitions.PyshaMode):
     def get_settings_to_save(self):
         return {
             'use_poly_at': self.use_poly_at,
+            'pressure_leds': self.pressure_leds,
             'root_midi_note': self.root_midi_note,
+            'scale': self.scale_name,
+            'in_key': self.in_key,
+            'row_interval': self.row_interval,
             'channel_at_range_start': self.channel_at_range_start,
             'channel_at_range_end': self.channel_at_range_end,
             'poly_at_max_range': self.poly_at_max_range,
@@ -113,32 +137,67 @@ class MelodicMode(definitions.PyshaMode):
         return [int(127 * pow_curve[i]) if i < self.poly_at_max_range else 127 for i in range(0, 128)]
 
     def add_note_being_played(self, midi_note, source):
-        self.notes_being_played.append({'note': midi_note, 'source': source})
+        self.notes_being_played.add(midi_note, source)
 
     def remove_note_being_played(self, midi_note, source):
-        self.notes_being_played = [note for note in self.notes_being_played if note['note'] != midi_note or note['source'] != source]
+        self.notes_being_played.remove(midi_note, source)
 
     def remove_all_notes_being_played(self):
-        self.notes_being_played = []
+        self.notes_being_played.clear()
 
     def pad_ij_to_midi_note(self, pad_ij):
-        return self.root_midi_note + ((7 - pad_ij[0]) * 5 + pad_ij[1])
+        # Returns the MIDI note of a pad according to the current layout (or None if pad has no valid MIDI note)
+        note_map, valid_notes_mask, _, _ = self.get_layout_tables()
+        i, j = pad_ij
+        if not valid_notes_mask[i][j]:
+            return None
+        return int(note_map[i][j])
 
     def is_midi_note_root_octave(self, midi_note):
-        relative_midi_note = (midi_note - self.root_midi_note) % 12
-        return relative_midi_note == 0
+        return pad_layouts.get_midi_note_class(midi_note, self.root_midi_note, self.scale_name) == pad_layouts.PAD_CLASS_ROOT
 
     def is_black_key_midi_note(self, midi_note):
-        relative_midi_note = (midi_note - self.root_midi_note) % 12
-        return not self.scale_pattern[relative_midi_note]
+        return pad_layouts.get_midi_note_class(midi_note, self.root_midi_note, self.scale_name) == pad_layouts.PAD_CLASS_OUT_OF_SCALE
 
     def is_midi_note_being_played(self, midi_note):
-        for note in self.notes_being_played:
-            if note['note'] == midi_note:
-                return True
-        return False
+        return self.notes_being_played.is_being_played(midi_note)
+
+    def get_notes_being_played_bitmap(self):
+        # Returns a 128-element boolean array which is True for the MIDI notes being played
+        return self.notes_being_played.get_bitmap()
+
+    def get_layout_key(self):
+        # Returns the parameters the pads layout depends on (layout tables are only re-computed when these change)
+        return (self.root_midi_note, self.scale_name, self.in_key, self.row_interval)
+
+    def get_pad_class(self, pad_ij, midi_note):
+        # Returns the class of a pad, which is used as index in the list returned by get_pad_class_colors
+        return pad_layouts.get_midi_note_class(midi_note, self.root_midi_note, self.scale_name)
+
+    def get_pad_class_colors(self):
+        # Returns the color of each pad class
+        try:
+            root_color = self.app.track_selection_mode.get_current_track_color()
+        except AttributeError:
+            root_color = definitions.YELLOW
+        return [definitions.WHITE, definitions.BLACK, root_color]
+
+    def compile_layout_tables(self):
+        # Scale layout tables are compiled once per root note, scale and layout and shared (see pad_layouts.py)
+        return pad_layouts.get_scale_layout_tables(*self.get_layout_key())
+
+    def get_layout_tables(self):
+        # Returns (note_map, valid_notes_mask, pad_class_map, note_to_pads) tables of the current layout (see
+        # pad_layouts.compile_layout_tables). Tables are only swapped when the layout changes
+        layout_key = self.get_layout_key()
+        if self.layout_tables is None or layout_key != self.layout_tables_key:
+            self.layout_tables = self.compile_layout_tables()
+            self.layout_tables_key = layout_key
+        return self.layout_tables
 
     def note_number_to_name(self, note_number):
+        if note_number is None:
+            return '-'
         semis = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
         note_number = int(round(note_number))
         return semis[note_number % 12] + str(note_number//12 - 2)
@@ -150,41 +209,68 @@ class MelodicMode(definitions.PyshaMode):
         elif self.root_midi_note > 127:
             self.root_midi_note = 127
 
+    def set_scale(self, scale_name):
+        if scale_name in pad_layouts.SCALES:
+            self.scale_name = scale_name
+
+    def rotate_scale(self, increment=1):
+        scale_idx = pad_layouts.SCALE_NAMES.index(self.scale_name)
+        self.scale_name = pad_layouts.SCALE_NAMES[(scale_idx + increment) % len(pad_layouts.SCALE_NAMES)]
+
+    def set_row_interval(self, row_interval):
+        if row_interval in pad_layouts.ROW_INTERVALS:
+            self.row_interval = row_interval
+
+    def rotate_row_interval(self, increment=1):
+        row_interval_idx = pad_layouts.ROW_INTERVAL_NAMES.index(self.row_interval)
+        self.row_interval = pad_layouts.ROW_INTERVAL_NAMES[(row_interval_idx + increment) % len(pad_layouts.ROW_INTERVAL_NAMES)]
+
     def activate(self):
 
         # Configure polyAT and AT
         if self.use_poly_at:
-            self.push.pads.set_polyphonic_aftertouch()
+            self.app.push_state.set_polyphonic_aftertouch()
         else:
-            self.push.pads.set_channel_aftertouch()
-        self.push.pads.set_channel_aftertouch_range(range_start=self.channel_at_range_start, range_end=self.channel_at_range_end)
-        self.push.pads.set_velocity_curve(velocities=self.get_poly_at_curve())
+            self.app.push_state.set_channel_aftertouch()
+        self.app.push_state.set_channel_aftertouch_range(range_start=self.channel_at_range_start, range_end=self.channel_at_range_end)
+        self.app.push_state.set_velocity_curve(velocities=self.get_poly_at_curve())
 
         self.set_lumi_pressure_mode()
 
         # Configure touchstrip behaviour
         if self.modulation_wheel_mode:
-            self.push.touchstrip.set_modulation_wheel_mode()
+            self.app.push_state.set_touchstrip_modulation_wheel_mode()
         else:
-            self.push.touchstrip.set_pitch_bend_mode()
+            self.app.push_state.set_touchstrip_pitch_bend_mode()
 
         # Update buttons and pads
         self.update_buttons()
         self.update_pads()
 
     def deactivate(self):
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_OCTAVE_DOWN, definitions.BLACK)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_OCTAVE_UP, definitions.BLACK)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_ACCENT, definitions.BLACK)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_SHIFT, definitions.BLACK)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_OCTAVE_DOWN, definitions.BLACK)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_OCTAVE_UP, definitions.BLACK)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_ACCENT, definitions.BLACK)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_SHIFT, definitions.BLACK)
+
+        # Notes being played are stored per mode, forget them so notes released while another mode is active don't
+        # stay lit when coming back to this mode
+        self.remove_all_notes_being_played()
 
     def check_for_delayed_actions(self):
         if self.last_time_at_params_edited is not None and time.time() - self.last_time_at_params_edited > definitions.DELAYED_ACTIONS_APPLY_TIME:
             # Update channel and poly AT parameters
-            self.push.pads.set_channel_aftertouch_range(range_start=self.channel_at_range_start, range_end=self.channel_at_range_end)
-            self.push.pads.set_velocity_curve(velocities=self.get_poly_at_curve())
+            self.app.push_state.set_channel_aftertouch_range(range_start=self.channel_at_range_start, range_end=self.channel_at_range_end)
+            self.app.push_state.set_velocity_curve(velocities=self.get_poly_at_curve())
             self.last_time_at_params_edited = None
 
+        # Show pressure steps that were not shown because of the rate limit
+        if self.pending_pad_pressure_steps:
+            min_time = time.time() - 1.0 / definitions.PAD_PRESSURE_LEDS_MAX_RATE
+            for pad_ij, step in list(self.pending_pad_pressure_steps.items()):
+                if self.pad_pressure_steps.get(pad_ij, (0, 0))[1] <= min_time:
+                    self.show_pad_pressure_step(pad_ij, step)
+
     def on_midi_in(self, msg, source=None):
         # Update the list of notes being currently played so push2 pads can be updated accordingly
         if msg.type == "note_on":
@@ -194,25 +280,27 @@ class MelodicMode(definitions.PyshaMode):
                 self.add_note_being_played(msg.note, source)
         elif msg.type == "note_off":
             self.remove_note_being_played(msg.note, source)
-        self.app.pads_need_update = True
+        else:
+            return
+        self.update_pads_for_notes([msg.note])
 
     def update_octave_buttons(self):
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_OCTAVE_DOWN, definitions.WHITE)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_OCTAVE_UP, definitions.WHITE)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_OCTAVE_DOWN, definitions.WHITE)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_OCTAVE_UP, definitions.WHITE)
 
     def update_accent_button(self):
         if self.fixed_velocity_mode:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_ACCENT, definitions.BLACK)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_ACCENT, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_ACCENT, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_ACCENT, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
         else:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_ACCENT, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_ACCENT, definitions.OFF_BTN_COLOR)
 
     def update_modulation_wheel_mode_button(self):
         if self.modulation_wheel_mode:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_SHIFT, definitions.BLACK)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_SHIFT, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_SHIFT, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_SHIFT, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
         else:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_SHIFT, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_SHIFT, definitions.OFF_BTN_COLOR)
 
     def update_buttons(self):
         self.update_octave_buttons()
@@ -220,26 +308,68 @@ class MelodicMode(definitions.PyshaMode):
         self.update_accent_button()
 
     def update_pads(self):
-        color_matrix = []
-        for i in range(0, 8):
-            row_colors = []
-            for j in range(0, 8):
-                corresponding_midi_note = self.pad_ij_to_midi_note([i, j])
-                cell_color = definitions.WHITE
-                if self.is_black_key_midi_note(corresponding_midi_note):
-                    cell_color = definitions.BLACK
-                if self.is_midi_note_root_octave(corresponding_midi_note):
-                    try:
-                        cell_color = self.app.track_selection_mode.get_current_track_color()
-                    except AttributeError:
-                        cell_color = definitions.YELLOW
-                if self.is_midi_note_being_played(corresponding_midi_note):
-                    cell_color = definitions.NOTE_ON_COLOR
-
-                row_colors.append(cell_color)
-            color_matrix.append(row_colors)
-
-        self.push.pads.set_pads_color(color_matrix)
+        # Pad colors are computed from the precomputed layout tables: base color comes from the class of each pad and
+        # pads whose note is being played are shown with NOTE_ON_COLOR
+        note_map, valid_notes_mask, pad_class_map, _ = self.get_layout_tables()
+        color_matrix = numpy.array(self.get_pad_class_colors(), dtype=object)[pad_class_map]
+        color_matrix[valid_notes_mask & self.get_notes_being_played_bitmap()[note_map]] = definitions.NOTE_ON_COLOR
+        self.app.leds.set_pads_color(color_matrix.tolist())
+        self.pad_pressure_steps.clear()  # Pressure no longer shown in pads
+
+    def update_pads_for_notes(self, midi_notes):
+        # Only updates the color of the pads that play the given MIDI notes (e.g. after notes start or stop being
+        # played). If the layout changed since pads were last updated, all pads are updated instead
+        if self.layout_tables is None or self.get_layout_key() != self.layout_tables_key:
+            self.update_pads()
+            return
+        _, _, pad_class_map, note_to_pads = self.layout_tables
+        pad_class_colors = self.get_pad_class_colors()
+        for midi_note in midi_notes:
+            if not 0 <= midi_note < 128:
+                continue
+            pads = note_to_pads[midi_note]
+            if not pads:
+                continue
+            is_being_played = self.is_midi_note_being_played(midi_note)
+            for pad_ij in pads:
+                color = definitions.NOTE_ON_COLOR if is_being_played else pad_class_colors[pad_class_map[pad_ij]]
+                self.app.leds.set_pad_color(pad_ij, color)
+                self.pad_pressure_steps.pop(pad_ij, None)  # Pressure no longer shown in the pad
+
+    def get_pad_color(self, pad_ij):
+        # Returns the color of the pad according to the layout and the notes being played
+        note_map, valid_notes_mask, pad_class_map, _ = self.get_layout_tables()
+        pad_ij = tuple(pad_ij)
+        if valid_notes_mask[pad_ij] and self.is_midi_note_being_played(int(note_map[pad_ij])):
+            return definitions.NOTE_ON_COLOR
+        return self.get_pad_class_colors()[pad_class_map[pad_ij]]
+
+    def set_pad_pressure(self, pad_ij, value):
+        # Shows the pressure of a pad (polyphonic aftertouch value) with lighter versions of the pad color, so pads get
+        # brighter the harder they are pressed. To not compete with other LED updates, pad color is only updated when
+        # the pressure step changes, at most PAD_PRESSURE_LEDS_MAX_RATE times per second, and with the lowest LED priority
+        pad_ij = tuple(pad_ij)
+        step = min(value * definitions.N_PAD_PRESSURE_STEPS // 128, definitions.N_PAD_PRESSURE_STEPS - 1)
+        shown_step, last_time = self.pad_pressure_steps.get(pad_ij, (0, 0))
+        if step == shown_step:
+            self.pending_pad_pressure_steps.pop(pad_ij, None)
+        elif time.time() - last_time < 1.0 / definitions.PAD_PRESSURE_LEDS_MAX_RATE:
+            self.pending_pad_pressure_steps[pad_ij] = step  # Will be shown in check_for_delayed_actions
+        else:
+            self.show_pad_pressure_step(pad_ij, step)
+
+    def show_pad_pressure_step(self, pad_ij, step):
+        self.pending_pad_pressure_steps.pop(pad_ij, None)
+        self.pad_pressure_steps[pad_ij] = (step, time.time())
+        color = self.get_pad_color(pad_ij)
+        if step > 0:
+            color = definitions.get_lighter_color(color, definitions.PAD_PRESSURE_MAX_LIGHTEN * step / (definitions.N_PAD_PRESSURE_STEPS - 1))
+        self.app.leds.set_pad_color(pad_ij, color, priority=LED_PRIORITY_PRESSURE)
+
+    def clear_pad_pressure(self, pad_ij):
+        pad_ij = tuple(pad_ij)
+        self.pad_pressure_steps.pop(pad_ij, None)
+        self.pending_pad_pressure_steps.pop(pad_ij, None)
 
     def on_pad_pressed(self, pad_n, pad_ij, velocity):
         midi_note = self.pad_ij_to_midi_note(pad_ij)
@@ -252,9 +382,11 @@ class MelodicMode(definitions.PyshaMode):
                 # light the currently presed pad). However, if "notes_midi_in" input is not configured, we do want to liht the pad as we won't have
                 # notes info comming from any other source
                 self.add_note_being_played(midi_note, 'push')
-            msg = mido.Message('note_on', note=midi_note, velocity=velocity if not self.fixed_velocity_mode else 127)
+            msg = mido.Message('note_on', note=midi_note, velocity=velocity if not self.fixed_velocity_mode else 127, channel=self.app.get_midi_out_channel())
             self.app.send_midi(msg)
-            self.update_pads()  # Directly calling update pads method because we want user to feel feedback as quick as possible
+            self.update_pads_for_notes([midi_note])  # Directly updating pads because we want user to feel feedback as quick as possible
+            self.app.leds.mark_pad_feedback(pad_ij)
+            self.app.leds.flush()
             return True
 
     def on_pad_released(self, pad_n, pad_ij, velocity):
@@ -263,9 +395,12 @@ class MelodicMode(definitions.PyshaMode):
             if self.app.track_selection_mode.get_current_track_info().get('illuminate_local_notes', True) or self.app.notes_midi_in is None:
                 # see comment in "on_pad_pressed" above
                 self.remove_note_being_played(midi_note, 'push')
-            msg = mido.Message('note_off', note=midi_note, velocity=velocity)
+            self.clear_pad_pressure(pad_ij)
+            msg = mido.Message('note_off', note=midi_note, velocity=velocity, channel=self.app.get_midi_out_channel())
             self.app.send_midi(msg)
-            self.update_pads()  # Directly calling update pads method because we want user to feel feedback as quick as possible
+            self.update_pads_for_notes([midi_note])  # Directly updating pads because we want user to feel feedback as quick as possible
+            self.app.leds.mark_pad_feedback(pad_ij)
+            self.app.leds.flush()
             return True
 
     def on_pad_aftertouch(self, pad_n, pad_ij, velocity):
@@ -273,25 +408,28 @@ class MelodicMode(definitions.PyshaMode):
             # polyAT mode
             self.latest_poly_at_value = (time.time(), velocity)
             midi_note = self.pad_ij_to_midi_note(pad_ij)
-            if midi_note is not None:
-                msg = mido.Message('polytouch', note=midi_note, value=velocity)
+            if midi_note is None:
+                return True
+            msg = mido.Message('polytouch', note=midi_note, value=velocity, channel=self.app.get_midi_out_channel())
+            if self.pressure_leds:
+                self.set_pad_pressure(pad_ij, velocity)
         else:
             # channel AT mode
             self.latest_channel_at_value = (time.time(), velocity)
-            msg = mido.Message('aftertouch', value=velocity)
+            msg = mido.Message('aftertouch', value=velocity, channel=self.app.get_midi_out_channel())
         self.app.send_midi(msg)
         return True
 
     def on_touchstrip(self, value):
         if self.modulation_wheel_mode:
-            msg = mido.Message('control_change', control=1, value=value)
+            msg = mido.Message('control_change', control=1, value=value, channel=self.app.get_midi_out_channel())
         else:
-            msg = mido.Message('pitchwheel', pitch=value)
+            msg = mido.Message('pitchwheel', pitch=value, channel=self.app.get_midi_out_channel())
         self.app.send_midi(msg)
         return True
 
     def on_sustain_pedal(self, sustain_on):
-        msg = mido.Message('control_change', control=64, value=127 if sustain_on else 0)
+        msg = mido.Message('control_change', control=64, value=127 if sustain_on else 0, channel=self.app.get_midi_out_channel())
         self.app.send_midi(msg)
         return True
 
@@ -324,9 +462,9 @@ class MelodicMode(definitions.PyshaMode):
         elif button_name == push2_python.constants.BUTTON_SHIFT:
             self.modulation_wheel_mode = not self.modulation_wheel_mode
             if self.modulation_wheel_mode:
-                self.push.touchstrip.set_modulation_wheel_mode()
+                self.app.push_state.set_touchstrip_modulation_wheel_mode()
             else:
-                self.push.touchstrip.set_pitch_bend_mode()
+                self.app.push_state.set_touchstrip_pitch_bend_mode()
             self.app.buttons_need_update = True
             self.app.add_display_notification("Touchstrip mode: {0}".format('Modulation wheel' if self.modulation_wheel_mode else 'Pitch bend'))
             return True
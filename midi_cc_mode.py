@@ -2,12 +2,12 @@ import definitions
 import mido
 import push2_python
 import time
-import math
 import json
 import os
 
 from definitions import PyshaMode, OFF_BTN_COLOR
-from display_utils import show_text
+from display_utils import show_text, draw_knob, knob_sprite_atlas, KNOB_RADIUS
+from widgets import WidgetGroup, LabelWidget, KnobWidget
 
 
 class MIDICCControl(object):
@@ -22,14 +22,16 @@ class MIDICCControl(object):
     vmax = 127
     get_color_func = None
     send_midi_func = None
+    get_channel_func = None
     value_labels_map = {}
 
-    def __init__(self, cc_number, name, section_name, get_color_func, send_midi_func):
+    def __init__(self, cc_number, name, section_name, get_color_func, send_midi_func, get_channel_func):
         self.cc_number = cc_number
         self.name = name
         self.section = section_name
         self.get_color_func = get_color_func
         self.send_midi_func = send_midi_func
+        self.get_channel_func = get_channel_func
 
     def draw(self, ctx, x_part):
         margin_top = 25
@@ -43,44 +45,13 @@ class MIDICCControl(object):
         color = self.get_color_func()
         show_text(ctx, x_part, margin_top + name_height, self.value_labels_map.get(str(self.value), str(self.value)), height=val_height, font_color=color)
 
-        # Knob
-        ctx.save()
-
-        circle_break_degrees = 80
-        height = 55
-        radius = height/2
-
+        # Knob (blitted from the knob sprite atlas)
         display_w = push2_python.constants.DISPLAY_LINE_PIXELS
         x = (display_w // 8) * x_part
-        y = margin_top + name_height + val_height + radius + 5
-        
-        start_rad = (90 + circle_break_degrees // 2) * (math.pi / 180)
-        end_rad = (90 - circle_break_degrees // 2) * (math.pi / 180)
-        xc = x + radius + 3
+        y = margin_top + name_height + val_height + KNOB_RADIUS + 5
+        xc = x + KNOB_RADIUS + 3
         yc = y
-
-        def get_rad_for_value(value):
-            total_degrees = 360 - circle_break_degrees
-            return start_rad + total_degrees * ((value - self.vmin)/(self.vmax - self.vmin)) * (math.pi / 180)
-
-        # This is needed to prevent showing line from previous position
-        ctx.set_source_rgb(0, 0, 0)
-        ctx.move_to(xc, yc)
-        ctx.stroke()
-
-        # Inner circle
-        ctx.arc(xc, yc, radius, start_rad, end_rad)
-        ctx.set_source_rgb(*definitions.get_color_rgb_float(definitions.GRAY_LIGHT))
-        ctx.set_line_width(1)
-        ctx.stroke()
-
-        # Outer circle
-        ctx.arc(xc, yc, radius, start_rad, get_rad_for_value(self.value))
-        ctx.set_source_rgb(* definitions.get_color_rgb_float(color))
-        ctx.set_line_width(3)
-        ctx.stroke()
-
-        ctx.restore()
+        draw_knob(ctx, xc, yc, color, self.value, self.vmin, self.vmax)
     
     def update_value(self, increment): 
         if self.value + increment > self.vmax:
@@ -90,8 +61,9 @@ class MIDICCControl(object):
         else:
             self.value += increment
 
-        # Send cc message, subtract 1 to number because MIDO works from 0 - 127
-        msg = mido.Message('control_change', control=self.cc_number, value=self.value)
+        # Send cc message, subtract 1 to number because MIDO works from 0 - 127. Message is created with the right
+        # channel so send_midi does not need to copy it
+        msg = mido.Message('control_change', channel=self.get_channel_func(), control=self.cc_number, value=self.value)
         self.send_midi_func(msg)
 
 
@@ -110,6 +82,8 @@ class MIDICCMode(PyshaMode):
     instrument_midi_control_ccs = {}
     active_midi_control_ccs = []
     current_selected_section_and_page = {}
+    midi_cc_sections_per_instrument = {}
+    widgets = None
 
     def initialize(self, settings=None):
         for instrument_short_name in self.get_all_distinct_instrument_short_names_helper():
@@ -124,7 +98,7 @@ class MIDICCMode(PyshaMode):
                 for section in midi_cc:
                     section_name = section['section']
                     for name, cc_number in section['controls']:
-                        control = MIDICCControl(cc_number, name, section_name, self.get_current_track_color_helper, self.app.send_midi)
+                        control = MIDICCControl(cc_number, name, section_name, self.get_current_track_color_helper, self.app.send_midi, self.app.get_midi_out_channel)
                         if section.get('control_value_label_maps', {}).get(name, False):
                             control.value_labels_map = section['control_value_label_maps'][name]
                         self.instrument_midi_control_ccs[instrument_short_name].append(control)
@@ -135,7 +109,7 @@ class MIDICCMode(PyshaMode):
                 for i in range(0, 128):
                     section_s = (i // 16) * 16
                     section_e = section_s + 15
-                    control = MIDICCControl(i, 'CC {0}'.format(i), '{0} to {1}'.format(section_s, section_e), self.get_current_track_color_helper, self.app.send_midi)
+                    control = MIDICCControl(i, 'CC {0}'.format(i), '{0} to {1}'.format(section_s, section_e), self.get_current_track_color_helper, self.app.send_midi, self.app.get_midi_out_channel)
                     self.instrument_midi_control_ccs[instrument_short_name].append(control)
                 print('Loaded default MIDI cc mappings for instrument {0}'.format(instrument_short_name))
       
@@ -143,6 +117,36 @@ class MIDICCMode(PyshaMode):
         for instrument_short_name in self.instrument_midi_control_ccs:
             self.current_selected_section_and_page[instrument_short_name] = (self.instrument_midi_control_ccs[instrument_short_name][0].section, 0)
 
+        self.create_widgets()
+
+    def create_widgets(self):
+        self.widgets = WidgetGroup()
+        for i in range(0, 8):
+            self.widgets.add(LabelWidget(i, 0, 20, bind=lambda i=i: self.get_section_label_state(i)))
+        for i in range(0, 8):
+            self.widgets.add(KnobWidget(i, 20, 120, bind=lambda i=i: self.get_control_knob_state(i)))
+
+    def get_section_label_state(self, i):
+        section_names = self.get_current_track_midi_cc_sections()
+        if i >= min(len(section_names), 8):
+            return None
+        section_name = section_names[i]
+        selected_section, _ = self.get_currently_selected_midi_cc_section_and_page()
+        current_track_color = self.get_current_track_color_helper()
+        if selected_section == section_name:
+            return (section_name, definitions.BLACK, current_track_color)
+        else:
+            return (section_name, current_track_color, definitions.BLACK)
+
+    def get_control_knob_state(self, i):
+        # active_midi_control_ccs is replaced (not modified) when the page changes, read it once so that the list that is
+        # checked is the same list that is indexed
+        active_midi_control_ccs = self.active_midi_control_ccs
+        if i >= min(len(active_midi_control_ccs), 8):
+            return None
+        control = active_midi_control_ccs[i]
+        return (control, control.value, self.get_current_track_color_helper())
+
     def get_all_distinct_instrument_short_names_helper(self):
         return self.app.track_selection_mode.get_all_distinct_instrument_short_names()
 
@@ -153,12 +157,16 @@ class MIDICCMode(PyshaMode):
         return self.app.track_selection_mode.get_current_track_instrument_short_name()
 
     def get_current_track_midi_cc_sections(self):
-        section_names = []
-        for control in self.instrument_midi_control_ccs.get(self.get_current_track_instrument_short_name_helper(), []):
-            section_name = control.section
-            if section_name not in section_names:
-                section_names.append(section_name)
-        return section_names
+        instrument_short_name = self.get_current_track_instrument_short_name_helper()
+        if instrument_short_name not in self.midi_cc_sections_per_instrument:
+            # Controls of an instrument don't change after initialization, so section names are only computed once
+            section_names = []
+            for control in self.instrument_midi_control_ccs.get(instrument_short_name, []):
+                section_name = control.section
+                if section_name not in section_names:
+                    section_names.append(section_name)
+            self.midi_cc_sections_per_instrument[instrument_short_name] = section_names
+        return self.midi_cc_sections_per_instrument[instrument_short_name]
 
     def get_currently_selected_midi_cc_section_and_page(self):
         return self.current_selected_section_and_page[self.get_current_track_instrument_short_name_helper()]
@@ -184,6 +192,7 @@ class MIDICCMode(PyshaMode):
             result[1] = new_page
         self.current_selected_section_and_page[self.get_current_track_instrument_short_name_helper()] = result
         self.active_midi_control_ccs = self.get_midi_cc_controls_for_current_track_section_and_page()
+        self.warm_knob_sprites()
         self.app.buttons_need_update = True
 
     def get_should_show_midi_cc_next_prev_pages_for_section(self):
@@ -199,32 +208,39 @@ class MIDICCMode(PyshaMode):
 
     def new_track_selected(self):
         self.active_midi_control_ccs = self.get_midi_cc_controls_for_current_track_section_and_page()
+        self.warm_knob_sprites()
+
+    def warm_knob_sprites(self):
+        # Pre-render knob sprites for the controls being shown in the background so that turning encoders only costs a blit
+        color = self.get_current_track_color_helper()
+        for control in self.active_midi_control_ccs:
+            knob_sprite_atlas.warm(color, control.vmin, control.vmax)
 
     def activate(self):
         self.update_buttons()
 
     def deactivate(self):
         for button_name in self.midi_cc_button_names + [push2_python.constants.BUTTON_PAGE_LEFT, push2_python.constants.BUTTON_PAGE_RIGHT]:
-            self.push.buttons.set_button_color(button_name, definitions.BLACK)
+            self.app.leds.set_button_color(button_name, definitions.BLACK)
 
     def update_buttons(self):
 
         n_midi_cc_sections = len(self.get_current_track_midi_cc_sections())
         for count, name in enumerate(self.midi_cc_button_names):
             if count < n_midi_cc_sections:
-                self.push.buttons.set_button_color(name, definitions.WHITE)
+                self.app.leds.set_button_color(name, definitions.WHITE)
             else:
-                self.push.buttons.set_button_color(name, definitions.BLACK)
+                self.app.leds.set_button_color(name, definitions.BLACK)
 
         show_prev, show_next = self.get_should_show_midi_cc_next_prev_pages_for_section()
         if show_prev:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_PAGE_LEFT, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_PAGE_LEFT, definitions.WHITE)
         else:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_PAGE_LEFT, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_PAGE_LEFT, definitions.BLACK)
         if show_next:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_PAGE_RIGHT, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_PAGE_RIGHT, definitions.WHITE)
         else:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_PAGE_RIGHT, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_PAGE_RIGHT, definitions.BLACK)
 
     def update_display(self, ctx, w, h):
 
@@ -232,37 +248,9 @@ class MIDICCMode(PyshaMode):
             # If settings mode is active, don't draw the upper parts of the screen because settings page will
             # "cover them"
 
-            # Draw MIDI CCs section names
-            section_names = self.get_current_track_midi_cc_sections()[0:8]
-            if section_names:
-                height = 20
-                for i, section_name in enumerate(section_names):
-                    show_text(ctx, i, 0, section_name, background_color=definitions.RED)
-                    
-                    is_selected = False
-                    selected_section, _ = self.get_currently_selected_midi_cc_section_and_page()
-                    if selected_section == section_name:
-                        is_selected = True
-
-                    current_track_color = self.get_current_track_color_helper()
-                    if is_selected:
-                        background_color = current_track_color
-                        font_color = definitions.BLACK
-                    else:
-                        background_color = definitions.BLACK
-                        font_color = current_track_color
-                    show_text(ctx, i, 0, section_name, height=height,
-                            font_color=font_color, background_color=background_color)
-
-            # Draw MIDI CC controls
-            if self.active_midi_control_ccs:
-                for i in range(0, min(len(self.active_midi_control_ccs), 8)):
-                    try:
-                        self.active_midi_control_ccs[i].draw(ctx, i)
-                    except IndexError:
-                        continue
- 
-    
+            # Draw MIDI CCs section names and MIDI CC controls (widgets are only re-rendered if their contents changed)
+            self.widgets.draw(ctx)
+
     def on_button_pressed(self, button_name):
         if  button_name in self.midi_cc_button_names:
             current_track_sections = self.get_current_track_midi_cc_sections()
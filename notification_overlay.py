@@ -0,0 +1,114 @@
+import collections
+import definitions
+import numpy
+import push2_python
+import threading
+
+import display_utils
+import numpy_backend
+
+from display_utils import NOTIFICATION_BG_OPACITY, NOTIFICATION_MARGIN_LEFT
+
+
+NOTIFICATION_OVERLAY_QUEUE_SIZE = 4
+
+
+class NotificationOverlay(object):
+    """Composites notifications on top of rendered frames (same look as "display_utils.show_notification") without
+    drawing them again on every frame.
+
+    The text of a notification is rasterized only once into a coverage mask (alpha value of the text for every pixel
+    of its bounding box). Then, for every frame, the darkened background and the text are alpha-blended directly on
+    the RGB565 pixels of the frame buffer with a few vectorized numpy operations using the current opacity.
+    The masks of the latest NOTIFICATION_OVERLAY_QUEUE_SIZE notifications are kept, so notifications that rapidly
+    replace each other (e.g. going up and down octaves) don't need to be rasterized again.
+    """
+
+    def __init__(self, width=push2_python.constants.DISPLAY_LINE_PIXELS, height=push2_python.constants.DISPLAY_N_LINES):
+        self.width = width
+        self.height = height
+        self.overlays = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+        # RGB565 channels of the text color (taken from the color table)
+        text_rgb565 = definitions.get_color_rgb565(definitions.WHITE)
+        self.text_red, self.text_green, self.text_blue = text_rgb565 >> 11, (text_rgb565 >> 5) & 0x3F, text_rgb565 & 0x1F
+
+        # Preallocated arrays used when blending the background
+        self.red = numpy.zeros((height, width), dtype=numpy.uint32)
+        self.green = numpy.zeros((height, width), dtype=numpy.uint32)
+        self.blue = numpy.zeros((height, width), dtype=numpy.uint32)
+
+    def get_overlay(self, text):
+        # Returns (x, y, coverage) for the text of the notification, coverage being a float32 array with the alpha of
+        # the text in every pixel of its bounding box and (x, y) the position of the bounding box in the display
+        with self.lock:
+            overlay = self.overlays.get(text, None)
+            if overlay is not None:
+                self.overlays.move_to_end(text)
+                return overlay
+        overlay = self.render_overlay(text)
+        with self.lock:
+            self.overlays[text] = overlay
+            while len(self.overlays) > NOTIFICATION_OVERLAY_QUEUE_SIZE:
+                self.overlays.popitem(last=False)
+        return overlay
+
+    def render_overlay(self, text):
+        font_size = self.height // 4
+        x, y = NOTIFICATION_MARGIN_LEFT, 2.2 * font_size
+        if display_utils.display_backend == definitions.DISPLAY_BACKEND_NUMPY:
+            scale = numpy_backend.get_glyph_scale(font_size)
+            coverage = numpy_backend.get_text_mask(text, scale).astype(numpy.float32)
+            return (x, int(round(y)) - numpy_backend.GLYPH_ASCENT * scale, coverage)
+
+        cairo = display_utils.cairo
+        surface = cairo.ImageSurface(cairo.FORMAT_A8, self.width, self.height)
+        ctx = cairo.Context(surface)
+        ctx.set_font_size(font_size)
+        ctx.move_to(x, y)
+        ctx.show_text(text)
+        surface.flush()
+        alpha = numpy.ndarray(shape=(self.height, surface.get_stride()), dtype=numpy.uint8, buffer=surface.get_data())[:, :self.width]
+        rows = numpy.flatnonzero(alpha.any(axis=1))
+        columns = numpy.flatnonzero(alpha.any(axis=0))
+        if len(rows) == 0:
+            return (0, 0, numpy.zeros((0, 0), dtype=numpy.float32))
+        coverage = alpha[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1].astype(numpy.float32) / 255
+        return (int(columns[0]), int(rows[0]), coverage)
+
+    def apply(self, data, text, opacity):
+        # Composites the notification on "data", a (height, width) numpy uint16 RGB565 view of the frame
+        if display_utils.get_render_quality() >= definitions.RENDER_QUALITY_SIMPLE:
+            opacity = 1.0  # Don't fade out notifications so identical frames are not re-sent while notification is shown
+
+        # Darken background: every channel is multiplied by the same factor (8 bit fixed point integer arithmetic)
+        factor = int(round((1 - NOTIFICATION_BG_OPACITY * opacity) * 256))
+        numpy.right_shift(data, 11, out=self.red, casting='unsafe')
+        numpy.right_shift(data, 5, out=self.green, casting='unsafe')
+        numpy.bitwise_and(self.green, 0x3F, out=self.green)
+        numpy.bitwise_and(data, 0x1F, out=self.blue, casting='unsafe')
+        for channel in (self.red, self.green, self.blue):
+            channel *= factor
+            channel >>= 8
+        self.red <<= 11
+        self.green <<= 5
+        self.red |= self.green
+        self.red |= self.blue
+        data[:] = self.red
+
+        # Blend text over the text bounding box
+        x, y, coverage = self.get_overlay(text)
+        region_h = max(0, min(coverage.shape[0], self.height - y))
+        region_w = max(0, min(coverage.shape[1], self.width - x))
+        if region_h == 0 or region_w == 0:
+            return
+        region = data[y:y + region_h, x:x + region_w]
+        alpha = coverage[:region_h, :region_w] * opacity
+        red = (region >> 11).astype(numpy.float32)
+        green = ((region >> 5) & 0x3F).astype(numpy.float32)
+        blue = (region & 0x1F).astype(numpy.float32)
+        red += (self.text_red - red) * alpha
+        green += (self.text_green - green) * alpha
+        blue += (self.text_blue - blue) * alpha
+        region[:] = (red.astype(numpy.uint16) << 11) | (green.astype(numpy.uint16) << 5) | blue.astype(numpy.uint16)
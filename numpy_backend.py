@@ -0,0 +1,355 @@
+import definitions
+import functools
+import math
+import numpy
+
+
+# 5x8 bitmap font for ASCII characters 32 to 126. Each glyph is given as 5 columns (left to right), each column being
+# a byte whose least significant bit is the top row. Rows 0-6 are above the baseline and row 7 is for descenders.
+FONT_5X8_FIRST_CHAR = 32
+FONT_5X8 = [
+    (0x00, 0x00, 0x00, 0x00, 0x00), (0x00, 0x00, 0x5F, 0x00, 0x00), (0x00, 0x07, 0x00, 0x07, 0x00), (0x14, 0x7F, 0x14, 0x7F, 0x14),  #  !"#
+    (0x24, 0x2A, 0x7F, 0x2A, 0x12), (0x23, 0x13, 0x08, 0x64, 0x62), (0x36, 0x49, 0x56, 0x20, 0x50), (0x00, 0x08, 0x07, 0x03, 0x00),  # $%&'
+    (0x00, 0x1C, 0x22, 0x41, 0x00), (0x00, 0x41, 0x22, 0x1C, 0x00), (0x2A, 0x1C, 0x7F, 0x1C, 0x2A), (0x08, 0x08, 0x3E, 0x08, 0x08),  # ()*+
+    (0x00, 0x80, 0x70, 0x30, 0x00), (0x08, 0x08, 0x08, 0x08, 0x08), (0x00, 0x00, 0x60, 0x60, 0x00), (0x20, 0x10, 0x08, 0x04, 0x02),  # ,-./
+    (0x3E, 0x51, 0x49, 0x45, 0x3E), (0x00, 0x42, 0x7F, 0x40, 0x00), (0x72, 0x49, 0x49, 0x49, 0x46), (0x21, 0x41, 0x49, 0x4D, 0x33),  # 0123
+    (0x18, 0x14, 0x12, 0x7F, 0x10), (0x27, 0x45, 0x45, 0x45, 0x39), (0x3C, 0x4A, 0x49, 0x49, 0x31), (0x41, 0x21, 0x11, 0x09, 0x07),  # 4567
+    (0x36, 0x49, 0x49, 0x49, 0x36), (0x46, 0x49, 0x49, 0x29, 0x1E), (0x00, 0x00, 0x14, 0x00, 0x00), (0x00, 0x40, 0x34, 0x00, 0x00),  # 89:;
+    (0x00, 0x08, 0x14, 0x22, 0x41), (0x14, 0x14, 0x14, 0x14, 0x14), (0x00, 0x41, 0x22, 0x14, 0x08), (0x02, 0x01, 0x59, 0x09, 0x06),  # <=>?
+    (0x3E, 0x41, 0x5D, 0x59, 0x4E), (0x7C, 0x12, 0x11, 0x12, 0x7C), (0x7F, 0x49, 0x49, 0x49, 0x36), (0x3E, 0x41, 0x41, 0x41, 0x22),  # @ABC
+    (0x7F, 0x41, 0x41, 0x41, 0x3E), (0x7F, 0x49, 0x49, 0x49, 0x41), (0x7F, 0x09, 0x09, 0x09, 0x01), (0x3E, 0x41, 0x41, 0x51, 0x73),  # DEFG
+    (0x7F, 0x08, 0x08, 0x08, 0x7F), (0x00, 0x41, 0x7F, 0x41, 0x00), (0x20, 0x40, 0x41, 0x3F, 0x01), (0x7F, 0x08, 0x14, 0x22, 0x41),  # HIJK
+    (0x7F, 0x40, 0x40, 0x40, 0x40), (0x7F, 0x02, 0x1C, 0x02, 0x7F), (0x7F, 0x04, 0x08, 0x10, 0x7F), (0x3E, 0x41, 0x41, 0x41, 0x3E),  # LMNO
+    (0x7F, 0x09, 0x09, 0x09, 0x06), (0x3E, 0x41, 0x51, 0x21, 0x5E), (0x7F, 0x09, 0x19, 0x29, 0x46), (0x26, 0x49, 0x49, 0x49, 0x32),  # PQRS
+    (0x03, 0x01, 0x7F, 0x01, 0x03), (0x3F, 0x40, 0x40, 0x40, 0x3F), (0x1F, 0x20, 0x40, 0x20, 0x1F), (0x3F, 0x40, 0x38, 0x40, 0x3F),  # TUVW
+    (0x63, 0x14, 0x08, 0x14, 0x63), (0x03, 0x04, 0x78, 0x04, 0x03), (0x61, 0x59, 0x49, 0x4D, 0x43), (0x00, 0x7F, 0x41, 0x41, 0x41),  # XYZ[
+    (0x02, 0x04, 0x08, 0x10, 0x20), (0x00, 0x41, 0x41, 0x41, 0x7F), (0x04, 0x02, 0x01, 0x02, 0x04), (0x40, 0x40, 0x40, 0x40, 0x40),  # \]^_
+    (0x00, 0x03, 0x07, 0x08, 0x00), (0x20, 0x54, 0x54, 0x78, 0x40), (0x7F, 0x28, 0x44, 0x44, 0x38), (0x38, 0x44, 0x44, 0x44, 0x28),  # `abc
+    (0x38, 0x44, 0x44, 0x28, 0x7F), (0x38, 0x54, 0x54, 0x54, 0x18), (0x00, 0x08, 0x7E, 0x09, 0x02), (0x18, 0xA4, 0xA4, 0x9C, 0x78),  # defg
+    (0x7F, 0x08, 0x04, 0x04, 0x78), (0x00, 0x44, 0x7D, 0x40, 0x00), (0x20, 0x40, 0x40, 0x3D, 0x00), (0x7F, 0x10, 0x28, 0x44, 0x00),  # hijk
+    (0x00, 0x41, 0x7F, 0x40, 0x00), (0x7C, 0x04, 0x78, 0x04, 0x78), (0x7C, 0x08, 0x04, 0x04, 0x78), (0x38, 0x44, 0x44, 0x44, 0x38),  # lmno
+    (0xFC, 0x18, 0x24, 0x24, 0x18), (0x18, 0x24, 0x24, 0x18, 0xFC), (0x7C, 0x08, 0x04, 0x04, 0x08), (0x48, 0x54, 0x54, 0x54, 0x24),  # pqrs
+    (0x04, 0x04, 0x3F, 0x44, 0x24), (0x3C, 0x40, 0x40, 0x20, 0x7C), (0x1C, 0x20, 0x40, 0x20, 0x1C), (0x3C, 0x40, 0x30, 0x40, 0x3C),  # tuvw
+    (0x44, 0x28, 0x10, 0x28, 0x44), (0x4C, 0x90, 0x90, 0x90, 0x7C), (0x44, 0x64, 0x54, 0x4C, 0x44), (0x00, 0x08, 0x36, 0x41, 0x00),  # xyz{
+    (0x00, 0x00, 0x77, 0x00, 0x00), (0x00, 0x41, 0x36, 0x08, 0x00), (0x02, 0x01, 0x02, 0x04, 0x02),  # |}~
+]
+GLYPH_W = 5
+GLYPH_H = 8
+GLYPH_ASCENT = 7
+GLYPH_ADVANCE = GLYPH_W + 1
+
+# Glyph atlas with all the glyphs pre-rasterized as boolean masks of shape (GLYPH_H, GLYPH_W)
+glyph_atlas = numpy.array([[[(column >> row) & 1 for column in glyph] for row in range(GLYPH_H)] for glyph in FONT_5X8], dtype=bool)
+
+
+def get_glyph_scale(font_size):
+    # Glyphs are scaled by an integer factor so their cap height approximates the one of Arial at the given font size
+    return max(1, round(0.72 * font_size / GLYPH_ASCENT))
+
+
+@functools.lru_cache(maxsize=512)
+def get_text_mask(text, scale):
+    # Returns a boolean mask with the rasterized text line (top row is the top of the glyphs)
+    indices = [ord(char) - FONT_5X8_FIRST_CHAR for char in text]
+    indices = [idx if 0 <= idx < len(FONT_5X8) else ord('?') - FONT_5X8_FIRST_CHAR for idx in indices]
+    mask = numpy.zeros((GLYPH_H, max(1, len(indices) * GLYPH_ADVANCE - 1)), dtype=bool)
+    for count, idx in enumerate(indices):
+        mask[:, count * GLYPH_ADVANCE:count * GLYPH_ADVANCE + GLYPH_W] = glyph_atlas[idx]
+    if scale > 1:
+        mask = mask.repeat(scale, axis=0).repeat(scale, axis=1)
+    return mask
+
+
+@functools.lru_cache(maxsize=64)
+def get_arc_grid(radius, line_width):
+    # Returns (dy, dx, on_ring) grids for a square area centered on an arc center. on_ring is True for pixels whose
+    # center lies within the stroke of a circle of the given radius and line width
+    half_size = int(math.ceil(radius + line_width / 2))
+    coords = numpy.arange(-half_size, half_size + 1) + 0.5
+    dx, dy = numpy.meshgrid(coords, coords)
+    distance = numpy.sqrt(dx ** 2 + dy ** 2)
+    on_ring = numpy.abs(distance - radius) <= max(0.5, line_width / 2)
+    angle = numpy.arctan2(dy, dx) % (2 * math.pi)
+    return half_size, angle, on_ring
+
+
+def rgb_to_rgb565(r, g, b):
+    return (int(r * 255) >> 3) << 11 | (int(g * 255) >> 2) << 5 | (int(b * 255) >> 3)
+
+
+class NumpySurface(object):
+    """RGB565 image stored in a (height, width) numpy uint16 array. Counterpart of a cairo.ImageSurface with
+    FORMAT_RGB16_565 for the numpy display backend.
+    """
+
+    def __init__(self, width, height, data=None):
+        self.data = data if data is not None else numpy.zeros((height, width), dtype=numpy.uint16)
+        self.width = width
+        self.height = height
+
+    def get_width(self):
+        return self.width
+
+    def get_height(self):
+        return self.height
+
+    def get_stride(self):
+        return self.data.strides[0]
+
+    def flush(self):
+        pass
+
+    def mark_dirty(self):
+        pass
+
+
+class NumpyContext(object):
+    """Drawing context of the numpy display backend. Implements the subset of the cairo.Context API used by Pysha
+    (solid and translucent rectangle fills, polygon fills, arc strokes, surface blits, rectangular clipping and
+    bitmap text) by operating directly on the RGB565 pixels of a NumpySurface with vectorized numpy operations.
+    Drawing is not antialiased.
+    """
+
+    def __init__(self, surface):
+        self.surface = surface
+        self.data = surface.data
+        self.state = {
+            'source': (0.0, 0.0, 0.0, 1.0),
+            'source_rgb565': 0,  # RGB565 value of the source color (computed when the source is set, not on every fill)
+            'source_surface': None,
+            'line_width': 2.0,
+            'font_size': 10.0,
+            'translation': (0, 0),
+            'clip': (0, 0, surface.width, surface.height),
+        }
+        self.state_stack = []
+        self.path = []  # List of ('rect', x, y, w, h), ('poly', points) and ('arc', xc, yc, r, angle1, angle2) in device coordinates
+        self.current_point = None
+
+    # Context state
+
+    def save(self):
+        self.state_stack.append(dict(self.state))
+
+    def restore(self):
+        self.state = self.state_stack.pop()
+
+    def translate(self, tx, ty):
+        x, y = self.state['translation']
+        self.state['translation'] = (x + tx, y + ty)
+
+    def to_device(self, x, y):
+        tx, ty = self.state['translation']
+        return x + tx, y + ty
+
+    def set_source_rgb(self, r, g, b):
+        self.set_source_rgba(r, g, b, 1.0)
+
+    def set_source_rgba(self, r, g, b, a=1.0):
+        self.state['source'] = (r, g, b, a)
+        self.state['source_rgb565'] = rgb_to_rgb565(r, g, b)
+        self.state['source_surface'] = None
+
+    def set_source_color(self, color_name):
+        # Not part of the cairo API. Sets a color of the color table as source, using its precomputed RGB565 value
+        r, g, b = definitions.get_color_rgb_float(color_name)
+        self.state['source'] = (r, g, b, 1.0)
+        self.state['source_rgb565'] = definitions.get_color_rgb565(color_name)
+        self.state['source_surface'] = None
+
+    def set_source_surface(self, surface, x=0, y=0):
+        self.state['source_surface'] = (surface, ) + self.to_device(x, y)
+
+    def set_line_width(self, width):
+        self.state['line_width'] = width
+
+    def set_font_size(self, size):
+        self.state['font_size'] = size
+
+    def set_font_face(self, font_face):
+        pass
+
+    def select_font_face(self, *args):
+        pass
+
+    def set_font_options(self, font_options):
+        pass
+
+    def set_antialias(self, antialias):
+        pass
+
+    # Paths
+
+    def new_path(self):
+        self.path = []
+        self.current_point = None
+
+    def rectangle(self, x, y, w, h):
+        self.path.append(('rect', ) + self.to_device(x, y) + (w, h))
+        self.current_point = None
+
+    def move_to(self, x, y):
+        self.current_point = self.to_device(x, y)
+        self.path.append(('poly', [self.current_point]))
+
+    def line_to(self, x, y):
+        if self.current_point is None:
+            self.move_to(x, y)
+            return
+        self.current_point = self.to_device(x, y)
+        self.path[-1][1].append(self.current_point)
+
+    def arc(self, xc, yc, radius, angle1, angle2):
+        while angle2 < angle1:
+            angle2 += 2 * math.pi
+        self.path.append(('arc', ) + self.to_device(xc, yc) + (radius, angle1, angle2))
+        self.current_point = None
+
+    def clip(self):
+        # Only rectangular clipping is supported
+        x0, y0, x1, y1 = self.state['clip']
+        for element in self.path:
+            if element[0] == 'rect':
+                _, x, y, w, h = element
+                x0, y0, x1, y1 = max(x0, round(x)), max(y0, round(y)), min(x1, round(x + w)), min(y1, round(y + h))
+        self.state['clip'] = (x0, y0, max(x0, x1), max(y0, y1))
+        self.new_path()
+
+    # Drawing
+
+    def clip_box(self, x0, y0, x1, y1):
+        cx0, cy0, cx1, cy1 = self.state['clip']
+        x0, y0, x1, y1 = max(cx0, int(x0)), max(cy0, int(y0)), min(cx1, int(x1)), min(cy1, int(y1))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1
+
+    def fill_region(self, x0, y0, x1, y1, mask=None):
+        # Fills the pixels of the given box (optionally only those where mask is True) with the current source
+        box = self.clip_box(x0, y0, x1, y1)
+        if box is None:
+            return
+        bx0, by0, bx1, by1 = box
+        if mask is not None:
+            mask = mask[by0 - y0:by1 - y0, bx0 - x0:bx1 - x0]
+        region = self.data[by0:by1, bx0:bx1]
+
+        source_surface = self.state['source_surface']
+        if source_surface is not None:
+            surface, sx, sy = source_surface
+            sx, sy = int(round(sx)), int(round(sy))
+            box = (max(bx0, sx), max(by0, sy), min(bx1, sx + surface.width), min(by1, sy + surface.height))
+            if box[2] <= box[0] or box[3] <= box[1]:
+                return
+            region = self.data[box[1]:box[3], box[0]:box[2]]
+            source = surface.data[box[1] - sy:box[3] - sy, box[0] - sx:box[2] - sx]
+            if mask is not None:
+                mask = mask[box[1] - by0:box[3] - by0, box[0] - bx0:box[2] - bx0]
+                region[mask] = source[mask]
+            else:
+                region[:] = source
+            return
+
+        r, g, b, a = self.state['source']
+        if a >= 1.0:
+            if mask is not None:
+                region[mask] = self.state['source_rgb565']
+            else:
+                region.fill(self.state['source_rgb565'])
+        elif a > 0.0:
+            # Alpha blending of RGB565 pixels, each channel is blended separately
+            pixels = region[mask] if mask is not None else region
+            red = (pixels >> 11).astype(numpy.float32)
+            green = ((pixels >> 5) & 0x3F).astype(numpy.float32)
+            blue = (pixels & 0x1F).astype(numpy.float32)
+            red = red * (1 - a) + (r * 31) * a
+            green = green * (1 - a) + (g * 63) * a
+            blue = blue * (1 - a) + (b * 31) * a
+            blended = (red.astype(numpy.uint16) << 11) | (green.astype(numpy.uint16) << 5) | blue.astype(numpy.uint16)
+            if mask is not None:
+                region[mask] = blended
+            else:
+                region[:] = blended
+
+    def paint(self):
+        x0, y0, x1, y1 = self.state['clip']
+        self.fill_region(x0, y0, x1, y1)
+
+    def fill(self):
+        for element in self.path:
+            if element[0] == 'rect':
+                _, x, y, w, h = element
+                self.fill_region(round(x), round(y), round(x + w), round(y + h))
+            elif element[0] == 'poly':
+                self.fill_polygon(element[1])
+        self.new_path()
+
+    def fill_polygon(self, points):
+        # Even-odd rule polygon fill, evaluated at pixel centers for all pixels of the polygon bounding box at once
+        if len(points) < 3:
+            return
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        x0, y0, x1, y1 = int(math.floor(min(xs))), int(math.floor(min(ys))), int(math.ceil(max(xs))), int(math.ceil(max(ys)))
+        if self.clip_box(x0, y0, x1, y1) is None:
+            return
+        px, py = numpy.meshgrid(numpy.arange(x0, x1) + 0.5, numpy.arange(y0, y1) + 0.5)
+        inside = numpy.zeros(px.shape, dtype=bool)
+        for (ax, ay), (bx, by) in zip(points, points[1:] + points[:1]):
+            if ay == by:
+                continue
+            crosses = (ay > py) != (by > py)
+            crossing_x = ax + (py - ay) * (bx - ax) / (by - ay)
+            inside ^= crosses & (px < crossing_x)
+        self.fill_region(x0, y0, x1, y1, mask=inside)
+
+    def stroke(self):
+        line_width = self.state['line_width']
+        for element in self.path:
+            if element[0] == 'arc':
+                _, xc, yc, radius, angle1, angle2 = element
+                half_size, angle, on_ring = get_arc_grid(radius, line_width)
+                if angle2 - angle1 < 2 * math.pi:
+                    on_ring = on_ring & (((angle - angle1) % (2 * math.pi)) <= (angle2 - angle1))
+                x0, y0 = int(math.floor(xc)) - half_size, int(math.floor(yc)) - half_size
+                self.fill_region(x0, y0, x0 + on_ring.shape[1], y0 + on_ring.shape[0], mask=on_ring)
+            elif element[0] == 'poly':
+                for (ax, ay), (bx, by) in zip(element[1], element[1][1:]):
+                    self.stroke_segment(ax, ay, bx, by, line_width)
+        self.new_path()
+
+    def stroke_segment(self, ax, ay, bx, by, line_width):
+        half_width = max(0.5, line_width / 2)
+        x0, y0 = int(math.floor(min(ax, bx) - half_width)), int(math.floor(min(ay, by) - half_width))
+        x1, y1 = int(math.ceil(max(ax, bx) + half_width)), int(math.ceil(max(ay, by) + half_width))
+        if self.clip_box(x0, y0, x1, y1) is None:
+            return
+        px, py = numpy.meshgrid(numpy.arange(x0, x1) + 0.5, numpy.arange(y0, y1) + 0.5)
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+        t = numpy.clip(((px - ax) * dx + (py - ay) * dy) / length_sq, 0, 1) if length_sq > 0 else 0
+        distance_sq = (px - ax - t * dx) ** 2 + (py - ay - t * dy) ** 2
+        self.fill_region(x0, y0, x1, y1, mask=distance_sq <= half_width ** 2)
+
+    # Text
+
+    def text_extents(self, text):
+        # Returns (x_bearing, y_bearing, width, height, x_advance, y_advance) like cairo
+        scale = get_glyph_scale(self.state['font_size'])
+        width = max(0, len(text) * GLYPH_ADVANCE - 1) * scale
+        return (0, -GLYPH_ASCENT * scale, width, GLYPH_ASCENT * scale, len(text) * GLYPH_ADVANCE * scale, 0)
+
+    def font_extents(self):
+        # Returns (ascent, descent, height, max_x_advance, max_y_advance) like cairo
+        scale = get_glyph_scale(self.state['font_size'])
+        return (GLYPH_ASCENT * scale, (GLYPH_H - GLYPH_ASCENT) * scale, GLYPH_H * scale, GLYPH_ADVANCE * scale, 0)
+
+    def show_text(self, text):
+        if self.current_point is None or not text:
+            return
+        scale = get_glyph_scale(self.state['font_size'])
+        mask = get_text_mask(text, scale)
+        x, y = self.current_point
+        x0, y0 = int(round(x)), int(round(y)) - GLYPH_ASCENT * scale
+        self.fill_region(x0, y0, x0 + mask.shape[1], y0 + mask.shape[0], mask=mask)
+        self.current_point = (x + len(text) * GLYPH_ADVANCE * scale, y)
@@ -0,0 +1,82 @@
+import collections
+import threading
+import time
+
+
+class PacedOutputScheduler(object):
+    """Paces the messages sent to a MIDI output so that bursts of updates don't flood it or delay more important
+    messages sharing the same link.
+
+    Updates are queued with a key, a state and a priority (0 being the highest, up to "n_priorities" - 1) and sent
+    highest priority first, never exceeding a budget of "messages_per_ms" messages per millisecond (token bucket
+    allowing short bursts of up to "max_burst" messages). Updates that don't fit in the budget stay queued until the
+    next time the scheduler runs. Only the latest state of every key is kept in the queues, so if a key changes again
+    before its previous update is sent, the previous update is dropped (and counted).
+    """
+
+    def __init__(self, send_func, n_priorities=1, messages_per_ms=2.0, max_burst=32):
+        self.send_func = send_func  # Called as send_func(key, state), must return the number of messages sent
+        self.messages_per_ms = messages_per_ms
+        self.max_burst = max_burst
+        self.queues = [collections.OrderedDict() for _ in range(0, n_priorities)]
+        self.queued_priority = {}  # key -> priority of the queue in which the key is
+        self.tokens = max_burst
+        self.last_refill_time = time.perf_counter()
+        self.lock = threading.RLock()
+
+        # Stats
+        self.n_sent = 0
+        self.n_dropped = 0
+        self.n_deferred = 0  # Number of times queued updates had to wait because budget was exhausted
+
+    def enqueue(self, key, state, priority):
+        with self.lock:
+            current_priority = self.queued_priority.get(key, None)
+            if current_priority is not None:
+                del self.queues[current_priority][key]
+                self.n_dropped += 1
+                priority = min(priority, current_priority)
+            self.queues[priority][key] = state
+            self.queued_priority[key] = priority
+
+    def discard(self, key):
+        # Removes any queued update for key (e.g. because it was set back to the state already sent)
+        with self.lock:
+            priority = self.queued_priority.pop(key, None)
+            if priority is not None:
+                del self.queues[priority][key]
+                self.n_dropped += 1
+
+    def get_queue_depth(self, priority=None):
+        if priority is not None:
+            return len(self.queues[priority])
+        return len(self.queued_priority)
+
+    def run(self, ignore_budget=False):
+        # Sends as many queued updates as the budget allows (or all of them if ignore_budget=True), highest priority
+        # first. Returns the number of messages sent
+        with self.lock:
+            now = time.perf_counter()
+            self.tokens = min(self.max_burst, self.tokens + (now - self.last_refill_time) * 1000 * self.messages_per_ms)
+            self.last_refill_time = now
+            n_sent = 0
+            for queue in self.queues:
+                while queue and (self.tokens >= 1 or ignore_budget):
+                    key, state = queue.popitem(last=False)
+                    del self.queued_priority[key]
+                    n_messages = self.send_func(key, state)
+                    self.tokens = max(0, self.tokens - n_messages)
+                    n_sent += n_messages
+            self.n_sent += n_sent
+            if self.queued_priority:
+                self.n_deferred += 1
+            return n_sent
+
+    def get_stats(self):
+        return {
+            'queue_depth': self.get_queue_depth(),
+            'queue_depth_per_priority': [len(queue) for queue in self.queues],
+            'sent': self.n_sent,
+            'dropped': self.n_dropped,
+            'deferred': self.n_deferred,
+        }
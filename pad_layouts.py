@@ -0,0 +1,85 @@
+import functools
+import numpy
+
+
+# Scales (intervals in semitones from the root note)
+SCALES = {
+    'Major': [0, 2, 4, 5, 7, 9, 11],
+    'Minor': [0, 2, 3, 5, 7, 8, 10],
+    'Dorian': [0, 2, 3, 5, 7, 9, 10],
+    'Phrygian': [0, 1, 3, 5, 7, 8, 10],
+    'Lydian': [0, 2, 4, 6, 7, 9, 11],
+    'Mixolydian': [0, 2, 4, 5, 7, 9, 10],
+    'Locrian': [0, 1, 3, 5, 6, 8, 10],
+    'Harm. minor': [0, 2, 3, 5, 7, 8, 11],
+    'Mel. minor': [0, 2, 3, 5, 7, 9, 11],
+    'Major pent.': [0, 2, 4, 7, 9],
+    'Minor pent.': [0, 3, 5, 7, 10],
+    'Blues': [0, 3, 5, 6, 7, 10],
+    'Whole tone': [0, 2, 4, 6, 8, 10],
+    'Chromatic': list(range(0, 12)),
+}
+SCALE_NAMES = list(SCALES.keys())
+DEFAULT_SCALE = 'Major'
+
+# Interval between consecutive rows of pads as (semitones in chromatic layouts, scale degrees in in-key layouts)
+ROW_INTERVALS = {
+    'fourths': (5, 3),
+    'thirds': (4, 2),
+    'sequential': (8, 8),  # Every row continues where the row below ends
+}
+ROW_INTERVAL_NAMES = list(ROW_INTERVALS.keys())
+DEFAULT_ROW_INTERVAL = 'fourths'
+
+# Pad classes (used to choose pad colors)
+PAD_CLASS_IN_SCALE = 0
+PAD_CLASS_OUT_OF_SCALE = 1
+PAD_CLASS_ROOT = 2
+
+
+def get_pad_midi_note(pad_ij, root_midi_note, scale_name, in_key, row_interval):
+    # Returns the MIDI note of a pad in a layout. Pad (7, 0) (bottom left) plays the root note. In chromatic layouts
+    # every pad of a row is one semitone higher than the previous one. In in-key layouts, only notes of the scale are
+    # used and every pad of a row is one scale degree higher than the previous one
+    row = 7 - pad_ij[0]
+    row_semitones, row_degrees = ROW_INTERVALS[row_interval]
+    if not in_key:
+        return root_midi_note + row * row_semitones + pad_ij[1]
+    intervals = SCALES[scale_name]
+    degree = row * row_degrees + pad_ij[1]
+    return root_midi_note + 12 * (degree // len(intervals)) + intervals[degree % len(intervals)]
+
+
+def get_midi_note_class(midi_note, root_midi_note, scale_name):
+    relative_midi_note = (midi_note - root_midi_note) % 12
+    if relative_midi_note == 0:
+        return PAD_CLASS_ROOT
+    if relative_midi_note in SCALES[scale_name]:
+        return PAD_CLASS_IN_SCALE
+    return PAD_CLASS_OUT_OF_SCALE
+
+
+def compile_layout_tables(pad_ij_to_midi_note, get_pad_class):
+    # Computes the tables of a pad layout from the functions that return the MIDI note and class of every pad.
+    # Returns (note_map, valid_notes_mask, pad_class_map, note_to_pads). The first three are 8x8 arrays with the MIDI
+    # note of each pad (clipped to 0-127), whether that note is a valid MIDI note, and the class of each pad.
+    # note_to_pads is a reverse index with the list of (i, j) pads that play each of the 128 MIDI notes
+    note_map = numpy.array([[pad_ij_to_midi_note((i, j)) for j in range(0, 8)] for i in range(0, 8)], dtype=int)
+    valid_notes_mask = (note_map >= 0) & (note_map < 128)
+    pad_class_map = numpy.array([[get_pad_class((i, j), note_map[i][j]) for j in range(0, 8)] for i in range(0, 8)], dtype=int)
+    note_to_pads = [[] for _ in range(0, 128)]
+    for i, j in zip(*numpy.nonzero(valid_notes_mask)):
+        note_to_pads[note_map[i][j]].append((int(i), int(j)))
+    note_map = numpy.clip(note_map, 0, 127)
+    for table in (note_map, valid_notes_mask, pad_class_map):
+        table.flags.writeable = False  # Tables can be shared by several modes
+    return (note_map, valid_notes_mask, pad_class_map, note_to_pads)
+
+
+@functools.lru_cache(maxsize=512)
+def get_scale_layout_tables(root_midi_note, scale_name, in_key, row_interval):
+    # Tables of scale layouts are compiled the first time they are used and then reused, so changing the root note,
+    # scale or layout does not require computing the notes and classes of the pads again
+    return compile_layout_tables(
+        lambda pad_ij: get_pad_midi_note(pad_ij, root_midi_note, scale_name, in_key, row_interval),
+        lambda pad_ij, midi_note: get_midi_note_class(midi_note, root_midi_note, scale_name))
@@ -1,11 +1,13 @@
 import definitions
 import mido
+import numpy
 import push2_python
 import time
 import os
 import json
 
 from display_utils import show_notification
+from led_scheduler import LED_PRIORITY_PAD_FEEDBACK
 
 
 class PresetSelectionMode(definitions.PyshaMode):
@@ -14,6 +16,7 @@ class PresetSelectionMode(definitions.PyshaMode):
     
     favourtie_presets = {}
     favourtie_presets_filename = 'favourite_presets.json'
+    favourite_presets_index = {}  # instrument_short_name -> bank_number -> 128 bool array (True for favourite presets)
     pad_pressing_states = {}
     pad_quick_press_time = 0.400
     current_page = 0
@@ -21,6 +24,29 @@ class PresetSelectionMode(definitions.PyshaMode):
     def initialize(self, settings=None):
         if os.path.exists(self.favourtie_presets_filename):
             self.favourtie_presets = json.load(open(self.favourtie_presets_filename))
+        self.build_favourite_presets_index()
+
+    def build_favourite_presets_index(self):
+        # Favourite presets are stored in the JSON file as lists of (preset_number, bank_number), but an index with a
+        # 128 presets bitmap per bank is kept so favourites of a whole page can be checked at once
+        self.favourite_presets_index = {}
+        for instrument_short_name, favourite_presets in self.favourtie_presets.items():
+            for preset_number, bank_number in favourite_presets:
+                self.set_favourite_preset_in_index(instrument_short_name, preset_number, bank_number, True)
+
+    def set_favourite_preset_in_index(self, instrument_short_name, preset_number, bank_number, is_favourite):
+        banks = self.favourite_presets_index.setdefault(instrument_short_name, {})
+        if bank_number not in banks:
+            banks[bank_number] = numpy.zeros(128, dtype=bool)
+        banks[bank_number][preset_number] = is_favourite
+
+    def get_favourites_mask(self, bank_number, first_preset_number=0, n_presets=128):
+        # Returns a bool array which is True for the presets that are in favourites (for the current instrument)
+        instrument_short_name = self.app.track_selection_mode.get_current_track_instrument_short_name()
+        bank = self.favourite_presets_index.get(instrument_short_name, {}).get(bank_number, None)
+        if bank is None:
+            return numpy.zeros(n_presets, dtype=bool)
+        return bank[first_preset_number:first_preset_number + n_presets]
 
     def activate(self):
         self.current_page = 0
@@ -37,6 +63,7 @@ class PresetSelectionMode(definitions.PyshaMode):
         if instrument_short_name not in self.favourtie_presets:
             self.favourtie_presets[instrument_short_name] = []
         self.favourtie_presets[instrument_short_name].append((preset_number, bank_number))
+        self.set_favourite_preset_in_index(instrument_short_name, preset_number, bank_number, True)
         json.dump(self.favourtie_presets, open(self.favourtie_presets_filename, 'w'))  # Save to file
 
     def remove_favourite_preset(self, preset_number, bank_number):
@@ -45,16 +72,11 @@ class PresetSelectionMode(definitions.PyshaMode):
             self.favourtie_presets[instrument_short_name] = \
                 [(fp_preset_number, fp_bank_number) for fp_preset_number, fp_bank_number in self.favourtie_presets[instrument_short_name] 
                 if preset_number != fp_preset_number or bank_number != fp_bank_number]
+            self.set_favourite_preset_in_index(instrument_short_name, preset_number, bank_number, False)
             json.dump(self.favourtie_presets, open(self.favourtie_presets_filename, 'w'))  # Save to file
 
     def preset_num_in_favourites(self, preset_number, bank_number):
-        instrument_short_name = self.app.track_selection_mode.get_current_track_instrument_short_name() 
-        if instrument_short_name not in self.favourtie_presets:
-            return False
-        for fp_preset_number, fp_bank_number in self.favourtie_presets[instrument_short_name]:
-            if preset_number == fp_preset_number and bank_number == fp_bank_number:
-                return True
-        return False
+        return bool(self.get_favourites_mask(bank_number, preset_number, 1)[0])
 
     def get_current_page(self):
         # Returns the current page of presets being displayed in the pad grid
@@ -111,13 +133,13 @@ class PresetSelectionMode(definitions.PyshaMode):
         return (preset_num, bank_num)
 
     def send_select_new_preset(self, preset_num):
-        msg = mido.Message('program_change', program=preset_num)  # Should this be 1-indexed?
+        msg = mido.Message('program_change', program=preset_num, channel=self.app.get_midi_out_channel())  # Should this be 1-indexed?
         self.app.send_midi(msg)
 
     def send_select_new_bank(self, bank_num):
         # If synth only has 1 bank, don't send bank change messages
         if self.get_num_banks() > 1:
-            msg = mido.Message('control_change', control=0, value=bank_num)  # Should this be 1-indexed?
+            msg = mido.Message('control_change', control=0, value=bank_num, channel=self.app.get_midi_out_channel())  # Should this be 1-indexed?
             self.app.send_midi(msg)
 
     def notify_status_in_display(self):
@@ -137,39 +159,34 @@ class PresetSelectionMode(definitions.PyshaMode):
         self.notify_status_in_display()
 
     def deactivate(self):
-        self.app.push.pads.set_all_pads_to_color(color=definitions.BLACK)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_LEFT, definitions.BLACK)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_RIGHT, definitions.BLACK)
+        self.app.leds.set_all_pads_to_color(color=definitions.BLACK)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_LEFT, definitions.BLACK)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_RIGHT, definitions.BLACK)
 
     def update_buttons(self):
         show_prev, show_next = self.has_prev_next_pages()
         if show_prev:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_LEFT, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_LEFT, definitions.WHITE)
         else:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_LEFT, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_LEFT, definitions.BLACK)
         if show_next:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_RIGHT, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_RIGHT, definitions.WHITE)
         else:
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_RIGHT, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_RIGHT, definitions.BLACK)
 
     def update_pads(self):
-        instrument_short_name = self.app.track_selection_mode.get_current_track_instrument_short_name() 
         track_color = self.app.track_selection_mode.get_current_track_color() 
-        color_matrix = []
-        for i in range(0, 8):
-            row_colors = []
-            for j in range(0, 8):
-                cell_color = track_color
-                preset_num, bank_num = self.pad_ij_to_bank_and_preset_num((i, j))
-                if not self.preset_num_in_favourites(preset_num, bank_num):
-                    cell_color = f'{cell_color}_darker2'  # If preset not in favourites, use a darker version of the track color
-                row_colors.append(cell_color)
-            color_matrix.append(row_colors)
-        self.push.pads.set_pads_color(color_matrix)
+        # Get favourites of the 64 presets of the current page (pad (i, j) shows preset i * 8 + j of the page)
+        first_preset_num, bank_num = self.pad_ij_to_bank_and_preset_num((0, 0))
+        favourites_mask = self.get_favourites_mask(bank_num, first_preset_num, 64).reshape(8, 8)
+        # If preset not in favourites, use a darker version of the track color
+        color_matrix = numpy.where(favourites_mask, track_color, definitions.get_darker_color(track_color, 2)).tolist()
+        self.app.leds.set_pads_color(color_matrix)
 
     def on_pad_pressed(self, pad_n, pad_ij, velocity):
         self.pad_pressing_states[pad_n] = time.time()  # Store time at which pad_n was pressed
-        self.push.pads.set_pad_color(pad_ij, color=definitions.GREEN)
+        self.app.leds.set_pad_color(pad_ij, color=definitions.GREEN, priority=LED_PRIORITY_PAD_FEEDBACK)
+        self.app.leds.flush()  # Send pad feedback right away
         return True  # Prevent other modes to get this event
 
     def on_pad_released(self, pad_n, pad_ij, velocity):
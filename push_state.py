@@ -0,0 +1,104 @@
+import definitions
+import time
+
+
+class PushDeviceState(object):
+    """Remembers the state established in the Push2 device (color palette, pads and touchstrip configuration, and LED
+    colors through the LEDShadow) so that it can be restored after reconnecting without re-activating all modes.
+
+    Pads and touchstrip configuration is set through this object (with the same method names as push2_python) which
+    only sends the configuration messages when the configuration changes. When the connection with Push2 is
+    established again, "restore" re-sends in a single burst only what the device may have lost: the color palette
+    (all entries followed by a single "reapply palette" message), the pads and touchstrip configuration, and the
+    colors of the pads and buttons that are not off or that were not off the last time they were sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.config = {}  # configuration name -> value established in the device
+        self.palette_hash = None  # Hash of the palette entries last uploaded to the device
+        self.n_restores = 0
+        self.last_restore_duration = None
+
+    @property
+    def push(self):
+        return self.app.push
+
+    def send_config(self, name, value):
+        if name == 'aftertouch_mode':
+            if value == 'polyphonic':
+                self.push.pads.set_polyphonic_aftertouch()
+            else:
+                self.push.pads.set_channel_aftertouch()
+        elif name == 'channel_aftertouch_range':
+            self.push.pads.set_channel_aftertouch_range(range_start=value[0], range_end=value[1])
+        elif name == 'velocity_curve':
+            self.push.pads.set_velocity_curve(velocities=list(value))
+        elif name == 'touchstrip_mode':
+            if value == 'modulation_wheel':
+                self.push.touchstrip.set_modulation_wheel_mode()
+            else:
+                self.push.touchstrip.set_pitch_bend_mode()
+
+    def set_config(self, name, value):
+        if self.config.get(name, None) != value:
+            self.config[name] = value
+            self.send_config(name, value)
+
+    def set_polyphonic_aftertouch(self):
+        self.set_config('aftertouch_mode', 'polyphonic')
+
+    def set_channel_aftertouch(self):
+        self.set_config('aftertouch_mode', 'channel')
+
+    def set_channel_aftertouch_range(self, range_start, range_end):
+        self.set_config('channel_aftertouch_range', (range_start, range_end))
+
+    def set_velocity_curve(self, velocities):
+        self.set_config('velocity_curve', tuple(velocities))
+
+    def set_touchstrip_modulation_wheel_mode(self):
+        self.set_config('touchstrip_mode', 'modulation_wheel')
+
+    def set_touchstrip_pitch_bend_mode(self):
+        self.set_config('touchstrip_mode', 'pitch_bend')
+
+    def get_palette_hash(self):
+        return hash(tuple([(color_name, tuple(definitions.get_color_rgb(color_name))) for color_name in definitions.COLORS_NAMES]))
+
+    def upload_palette(self):
+        # Uploads all palette entries (named colors and custom colors assigned an entry) followed by a single
+        # "reapply palette" message. The palette mapping of push2_python is only re-built if the named colors changed
+        palette_hash = self.get_palette_hash()
+        if palette_hash != self.palette_hash:
+            self.push.color_palette = {}
+            self.app.leds.palette.reset()
+        for count, color_name in enumerate(definitions.COLORS_NAMES):
+            self.push.set_color_palette_entry(count, [color_name, color_name], rgb=definitions.get_color_rgb_float(color_name), allow_overwrite=True)
+        self.app.leds.palette.invalidate()
+        self.app.leds.palette.upload_pending(reapply=False)
+        self.push.reapply_color_palette()
+        self.palette_hash = palette_hash
+
+    def restore(self, full=False):
+        # Restores the device state after (re-)connecting. If full=True, all pads and buttons are sent and active modes
+        # are re-activated (as if nothing had been established in the device before). First restore is always full
+        full = full or self.n_restores == 0
+        start_time = time.perf_counter()
+        self.push.configure_midi_out()
+        self.upload_palette()
+        for name, value in self.config.items():
+            self.send_config(name, value)
+        self.app.leds.invalidate(full=full)
+        if full:
+            self.app.leds.set_all_buttons_color(color=definitions.BLACK)
+            self.app.leds.set_all_pads_to_color(color=definitions.BLACK)
+            for mode in self.app.active_modes:
+                mode.activate()
+            self.app.update_push2_buttons()
+            self.app.update_push2_pads()
+        n_leds = self.app.leds.flush(ignore_budget=True)
+        self.last_restore_duration = time.perf_counter() - start_time
+        self.n_restores += 1
+        print('Push state restored in {0:.1f} ms ({1} LED messages{2})'.format(
+            1000 * self.last_restore_duration, n_leds, ', full restore' if full else ''))
@@ -6,15 +6,12 @@ import math
 import os
 import json
 
+from led_scheduler import LED_PRIORITY_PAD_FEEDBACK
+from output_scheduler import PacedOutputScheduler
 
-class PyramidTrackState(object):
 
-    track_num = 0
-    has_content = False
-    is_playing = False
-
-    def __init__(self, track_num=0):
-        self.track_num = track_num
+PYRAMID_PRIORITY_TRACK_STATE = 0  # Track mute/unmute messages (the only messages paced by the track messages scheduler)
+N_PYRAMID_PRIORITIES = 1
 
 
 class PyramidTrackTriggeringMode(definitions.PyshaMode):
@@ -34,7 +31,10 @@ class PyramidTrackTriggeringMode(definitions.PyshaMode):
 
     pyramidi_channel = 15
     
-    track_states = []
+    # Track state is stored in bitsets, bit n corresponds to track n
+    tracks_with_content = 0
+    tracks_playing = 0
+    track_messages_scheduler = None  # Paces the mute/unmute messages sent to Pyramid
     
     pad_pressing_states = {}
     pad_quick_press_time = 0.400
@@ -45,27 +45,54 @@ class PyramidTrackTriggeringMode(definitions.PyshaMode):
     def initialize(self, settings=None):
         self.pyramidi_channel = self.app.track_selection_mode.pyramidi_channel  # Note TrackSelectionMode needs to have been initialized before PyramidTrackTriggeringMode
         self.create_tracks()
+        self.track_messages_scheduler = PacedOutputScheduler(self.send_track_state_to_pyramid, n_priorities=N_PYRAMID_PRIORITIES, messages_per_ms=definitions.PYRAMID_MESSAGES_PER_MS, max_burst=definitions.PYRAMID_MAX_BURST)
 
     def create_tracks(self):
-        for i in range(0, 64):
-            self.track_states.append(PyramidTrackState(track_num=i))
+        self.tracks_with_content = 0
+        self.tracks_playing = 0
 
     def track_is_playing(self, track_num):
-        return self.track_states[track_num].is_playing
+        return bool(self.tracks_playing >> track_num & 1)
 
     def track_has_content(self, track_num):
-        return self.track_states[track_num].has_content
+        return bool(self.tracks_with_content >> track_num & 1)
+
+    def set_tracks_playing(self, tracks_playing, send_to_pyramid=True):
+        # Sets the playing state of all tracks from a bitset and only sends mute/unmute messages for the tracks whose
+        # state changes. Messages are paced (see send_pending_track_messages)
+        changed_tracks = self.tracks_playing ^ tracks_playing
+        self.tracks_playing = tracks_playing
+        if send_to_pyramid and changed_tracks:
+            track_num = 0
+            while changed_tracks:
+                if changed_tracks & 1:
+                    self.track_messages_scheduler.enqueue(track_num, bool(tracks_playing >> track_num & 1), PYRAMID_PRIORITY_TRACK_STATE)
+                changed_tracks >>= 1
+                track_num += 1
+            self.send_pending_track_messages()
 
     def set_track_is_playing(self, track_num, value, send_to_pyramid=True):
-        self.track_states[track_num].is_playing = value
-        if send_to_pyramid:
-            if value == True:
-                self.send_unmute_track_to_pyramid(track_num)
-            else:
-                self.send_mute_track_to_pyramid(track_num)
+        if value:
+            self.set_tracks_playing(self.tracks_playing | (1 << track_num), send_to_pyramid=send_to_pyramid)
+        else:
+            self.set_tracks_playing(self.tracks_playing & ~(1 << track_num), send_to_pyramid=send_to_pyramid)
 
     def set_track_has_content(self, track_num, value):
-        self.track_states[track_num].has_content = value
+        if value:
+            self.tracks_with_content |= 1 << track_num
+        else:
+            self.tracks_with_content &= ~(1 << track_num)
+
+    def send_track_state_to_pyramid(self, track_num, is_playing):
+        if is_playing:
+            self.send_unmute_track_to_pyramid(track_num)
+        else:
+            self.send_mute_track_to_pyramid(track_num)
+        return 1
+
+    def send_pending_track_messages(self):
+        # Called from the app main loop so queued messages are sent even if the mode is no longer active
+        self.track_messages_scheduler.run()
 
     def set_pyramidi_channel(self, channel, wrap=False):
         self.pyramidi_channel = channel
@@ -101,18 +128,18 @@ class PyramidTrackTriggeringMode(definitions.PyshaMode):
 
     def deactivate(self):
         for button_name in self.scene_trigger_buttons:
-            self.push.buttons.set_button_color(button_name, definitions.BLACK)
-        self.push.buttons.set_button_color(self.track_selection_modifier_button, definitions.BLACK)
-        self.app.push.pads.set_all_pads_to_color(color=definitions.BLACK)
+            self.app.leds.set_button_color(button_name, definitions.BLACK)
+        self.app.leds.set_button_color(self.track_selection_modifier_button, definitions.BLACK)
+        self.app.leds.set_all_pads_to_color(color=definitions.BLACK)
 
     def update_buttons(self):
         for button_name in self.scene_trigger_buttons:
-            self.push.buttons.set_button_color(button_name, definitions.WHITE)
+            self.app.leds.set_button_color(button_name, definitions.WHITE)
         if not self.track_selection_modifier_button_being_pressed:
-            self.push.buttons.set_button_color(self.track_selection_modifier_button, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(self.track_selection_modifier_button, definitions.OFF_BTN_COLOR)
         else:
-            self.push.buttons.set_button_color(self.track_selection_modifier_button, definitions.BLACK)
-            self.push.buttons.set_button_color(self.track_selection_modifier_button, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
+            self.app.leds.set_button_color(self.track_selection_modifier_button, definitions.BLACK)
+            self.app.leds.set_button_color(self.track_selection_modifier_button, definitions.WHITE, animation=definitions.DEFAULT_ANIMATION)
 
     def update_pads(self):
         # Update pads according to track state
@@ -122,30 +149,22 @@ class PyramidTrackTriggeringMode(definitions.PyshaMode):
             for j in range(0, 8):
                 track_num = self.pad_ij_to_track_num((i, j))
                 track_color = self.app.track_selection_mode.get_track_color(track_num)  # Track color
-                cell_color = track_color + '_darker2'  # Choose super darker version of track color
+                cell_color = definitions.get_darker_color(track_color, 2)  # Choose super darker version of track color
                 if self.track_has_content(track_num):
-                    cell_color = track_color + '_darker1'  # Choose darker version of track color
+                    cell_color = definitions.get_darker_color(track_color, 1)  # Choose darker version of track color
                 if self.track_is_playing(track_num):
                     cell_color = track_color
                 row_colors.append(cell_color)
             color_matrix.append(row_colors)
-        self.push.pads.set_pads_color(color_matrix)
+        self.app.leds.set_pads_color(color_matrix)
 
     def on_button_pressed(self, button_name):
         if button_name in self.scene_trigger_buttons:
             triggered_scene_row = self.scene_trigger_buttons.index(button_name)
             # Unmute all tracks in that row, mute all tracks from other rows (only tracks that have content)
-            for i in range(0, 8):
-                for j in range(0, 8):
-                    track_num = self.pad_ij_to_track_num((i, j))
-                    # If track in selected row  
-                    # # TODO: check that indexing is correct
-                    if i == triggered_scene_row:
-                        if self.track_has_content(track_num):
-                            self.set_track_is_playing(track_num, True)
-                    else:
-                        if self.track_has_content(track_num):
-                            self.set_track_is_playing(track_num, False)
+            # # TODO: check that indexing is correct
+            scene_row_tracks = 0xFF << self.pad_ij_to_track_num((triggered_scene_row, 0))
+            self.set_tracks_playing((self.tracks_playing & ~self.tracks_with_content) | (self.tracks_with_content & scene_row_tracks))
             self.app.pads_need_update = True
 
             return True  # Prevent other modes to get this event
@@ -162,7 +181,8 @@ class PyramidTrackTriggeringMode(definitions.PyshaMode):
     def on_pad_pressed(self, pad_n, pad_ij, velocity):
         if not self.track_selection_modifier_button_being_pressed:
             self.pad_pressing_states[pad_n] = time.time()  # Store time at which pad_n was pressed
-            self.push.pads.set_pad_color(pad_ij, color=definitions.GREEN)
+            self.app.leds.set_pad_color(pad_ij, color=definitions.GREEN, priority=LED_PRIORITY_PAD_FEEDBACK)
+            self.app.leds.flush()  # Send pad feedback right away
             return True  # Prevent other modes to get this event
         else:
             # If a pad is pressed while the modifier key is also pressed,
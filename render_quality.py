@@ -0,0 +1,62 @@
+import definitions
+
+
+class RenderQualityController(object):
+    """Chooses the render quality level of the display (see definitions.RENDER_QUALITY_*) so that rendering frames
+    does not take more CPU than what the hardware can afford without starving MIDI handling.
+
+    Render time of every frame is measured and averaged. If the average render time goes above
+    RENDER_TIME_HIGH_RATIO of the frame budget (the time between frames at the target frame rate), quality is lowered
+    one level. If it stays below RENDER_TIME_LOW_RATIO of the frame budget for long enough, quality is raised one
+    level. Raising quality requires more frames than lowering it so that levels don't keep flipping.
+    Quality level can also be set manually, in which case it is not changed automatically.
+    """
+
+    RENDER_TIME_HIGH_RATIO = 0.5
+    RENDER_TIME_LOW_RATIO = 0.15
+    N_FRAMES_BEFORE_LOWERING = 30
+    N_FRAMES_BEFORE_RAISING = 300
+    AVERAGING_FACTOR = 0.1
+
+    def __init__(self, settings=None):
+        if settings is None:
+            settings = {}
+        self.manual_level = settings.get('render_quality', None)  # None means quality level is chosen automatically
+        self.auto_level = definitions.RENDER_QUALITY_FULL
+        self.average_render_time = 0.0
+        self.n_frames_since_level_change = 0
+
+    @property
+    def level(self):
+        return self.manual_level if self.manual_level is not None else self.auto_level
+
+    def get_settings_to_save(self):
+        return {
+            'render_quality': self.manual_level,
+        }
+
+    def rotate_manual_level(self):
+        # Cycles through automatic and all the manual quality levels
+        if self.manual_level is None:
+            self.manual_level = definitions.RENDER_QUALITY_FULL
+        elif self.manual_level < definitions.RENDER_QUALITY_LABELS_ONLY:
+            self.manual_level += 1
+        else:
+            self.manual_level = None
+
+    def add_render_time(self, render_time, frame_budget):
+        # Called after every frame is rendered with the time it took and the time available for it
+        self.average_render_time += self.AVERAGING_FACTOR * (render_time - self.average_render_time)
+        self.n_frames_since_level_change += 1
+        if self.average_render_time > self.RENDER_TIME_HIGH_RATIO * frame_budget:
+            if self.n_frames_since_level_change >= self.N_FRAMES_BEFORE_LOWERING and \
+                    self.auto_level < definitions.RENDER_QUALITY_LABELS_ONLY:
+                self.auto_level += 1
+                self.n_frames_since_level_change = 0
+        elif self.average_render_time < self.RENDER_TIME_LOW_RATIO * frame_budget:
+            if self.n_frames_since_level_change >= self.N_FRAMES_BEFORE_RAISING and \
+                    self.auto_level > definitions.RENDER_QUALITY_FULL:
+                self.auto_level -= 1
+                self.n_frames_since_level_change = 0
+        else:
+            self.n_frames_since_level_change = 0
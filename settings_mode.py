@@ -7,13 +7,16 @@ import psutil
 import threading
 import subprocess
 
-from display_utils import show_title, show_value, draw_text_at
+from display_utils import show_title, show_value, draw_text_at, text_cache
+from widgets import WidgetGroup, TileWidget, CurveWidget
 
 
 class SettingsMode(definitions.PyshaMode):
 
     # Pad settings
     # - Root note
+    # - Scale and in-key/chromatic layout
+    # - Layout row interval
     # - Aftertouch mode
     # - Velocity curve
     # - Channel aftertouch range
@@ -31,11 +34,15 @@ class SettingsMode(definitions.PyshaMode):
     # - definitions.VERSION info
     # - Save current settings
     #  - FPS
+    #  - Render quality
 
     current_page = 0
     n_pages = 3
     encoders_state = {}
     is_running_sw_update = False
+    widgets = None
+    stats_parts = {}  # Contents of the About page parts showing stats (see get_stats_part_contents)
+    stats_parts_time = 0
 
     def move_to_next_page(self):
         self.app.buttons_need_update = True
@@ -51,6 +58,7 @@ class SettingsMode(definitions.PyshaMode):
             self.encoders_state[encoder_name] = {
                 'last_message_received': current_time,
             }
+        self.create_widgets()
 
     def activate(self):
         self.current_page = 0
@@ -81,216 +89,298 @@ class SettingsMode(definitions.PyshaMode):
                 self.app.notes_midi_in_tmp_device_idx = None
 
     def set_all_upper_row_buttons_off(self):
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_1, definitions.OFF_BTN_COLOR)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_2, definitions.OFF_BTN_COLOR)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.OFF_BTN_COLOR)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_4, definitions.OFF_BTN_COLOR)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_5, definitions.OFF_BTN_COLOR)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_6, definitions.OFF_BTN_COLOR)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.OFF_BTN_COLOR)
-        self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_8, definitions.OFF_BTN_COLOR)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_1, definitions.OFF_BTN_COLOR)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_2, definitions.OFF_BTN_COLOR)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.OFF_BTN_COLOR)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_4, definitions.OFF_BTN_COLOR)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_5, definitions.OFF_BTN_COLOR)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_6, definitions.OFF_BTN_COLOR)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.OFF_BTN_COLOR)
+        self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_8, definitions.OFF_BTN_COLOR)
 
     def update_buttons(self):
         if self.current_page == 0:  # Performance settings
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_1, definitions.WHITE)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_2, definitions.WHITE)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_4, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_5, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_6, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_8, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_1, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_2, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_4, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_5, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_6, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_8, definitions.WHITE)
 
         elif self.current_page == 1: # MIDI settings
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_1, definitions.WHITE)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_2, definitions.WHITE)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.WHITE)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_4, definitions.WHITE)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_5, definitions.WHITE)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_6, definitions.WHITE)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.BLACK)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.GREEN, animation=definitions.DEFAULT_ANIMATION)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_8, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_1, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_2, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_4, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_5, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_6, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.GREEN, animation=definitions.DEFAULT_ANIMATION)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_8, definitions.OFF_BTN_COLOR)
             
         elif self.current_page == 2:  # About
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_1, definitions.GREEN)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_2, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.BLACK)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.RED, animation=definitions.DEFAULT_ANIMATION)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_4, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_5, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_6, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.OFF_BTN_COLOR)
-            self.push.buttons.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_8, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_1, definitions.GREEN)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_2, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.BLACK)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_3, definitions.RED, animation=definitions.DEFAULT_ANIMATION)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_4, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_5, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_6, definitions.OFF_BTN_COLOR)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_7, definitions.WHITE)
+            self.app.leds.set_button_color(push2_python.constants.BUTTON_UPPER_ROW_8, definitions.OFF_BTN_COLOR)
         
-    def update_display(self, ctx, w, h):
-
-        # Divide display in 8 parts to show different settings
-        part_w = w // 8
-        part_h = h
-
-        # Draw labels and values
+    def create_widgets(self):
+        # Display is divided in 8 parts to show different settings (upper area), the lower area is used for
+        # extra information like the polyAT curve and latest AT/velocity values
+        parts_height = 90
+        lower_area_height = push2_python.constants.DISPLAY_N_LINES - parts_height
+        self.widgets = WidgetGroup()
         for i in range(0, 8):
-            part_x = i * part_w
-            part_y = 0
-
-            ctx.set_source_rgb(0, 0, 0)  # Draw black background
-            ctx.rectangle(part_x - 3, part_y, w, h)  # do x -3 to add some margin between parts
-            ctx.fill()
-
-            color = [1.0, 1.0, 1.0]
-
-            if self.current_page == 0:  # Performance settings
-                if i == 0:  # Root note
-                    if not self.app.is_mode_active(self.app.melodic_mode):
+            self.widgets.add(TileWidget(i, 0, parts_height, bind=lambda i=i: self.get_part_contents(i), draw_func=self.draw_part))
+        self.widgets.add(TileWidget(0, parts_height, lower_area_height, bind=self.get_latest_values_lines, draw_func=self.draw_latest_values, n_parts=4))
+        self.widgets.add(CurveWidget(4, parts_height, lower_area_height, bind=self.get_poly_at_curve_params, get_data=self.app.melodic_mode.get_poly_at_curve, max_value=127, color=[0.6, 0.6, 0.6], n_parts=4))
+
+    def get_part_contents(self, i):
+        # Returns (title, value, color, info_lines) to be shown in part i of the current page (or None if nothing is shown)
+        # This runs in the render thread while settings can be changed from other threads, so every setting that is
+        # used more than once is read once into a local variable
+        color = [1.0, 1.0, 1.0]
+        current_page = self.current_page
+
+        if current_page == 0:  # Performance settings
+            if i == 0:  # Root note
+                if not self.app.is_mode_active(self.app.melodic_mode):
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
+                root_midi_note = self.app.melodic_mode.root_midi_note
+                return ('ROOT NOTE', "{0} ({1})".format(self.app.melodic_mode.note_number_to_name(root_midi_note), root_midi_note), color, ())
+
+            elif i == 1:  # Poly AT/channel AT
+                return ('AFTERTOUCH', 'polyAT' if self.app.melodic_mode.use_poly_at else 'channel', color, ())
+
+            elif i == 2:  # Channel AT range start
+                if self.app.melodic_mode.last_time_at_params_edited is not None:
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
+                return ('cAT START', self.app.melodic_mode.channel_at_range_start, color, ())
+
+            elif i == 3:  # Channel AT range end
+                if self.app.melodic_mode.last_time_at_params_edited is not None:
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
+                return ('cAT END', self.app.melodic_mode.channel_at_range_end, color, ())
+
+            elif i == 4:  # Poly AT range
+                if self.app.melodic_mode.last_time_at_params_edited is not None:
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
+                return ('pAT RANGE', self.app.melodic_mode.poly_at_max_range, color, ())
+
+            elif i == 5:  # Poly AT curve
+                if self.app.melodic_mode.last_time_at_params_edited is not None:
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
+                return ('pAT CURVE', self.app.melodic_mode.poly_at_curve_bending, color, ())
+
+            elif i == 6:  # Scale
+                if not self.app.is_mode_active(self.app.melodic_mode):
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
+                return ('SCALE', self.app.melodic_mode.scale_name, color, ('In key' if self.app.melodic_mode.in_key else 'Chromatic', ))
+
+            elif i == 7:  # Layout row interval
+                if not self.app.is_mode_active(self.app.melodic_mode):
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
+                return ('ROWS', self.app.melodic_mode.row_interval.capitalize(), color, ())
+
+        elif current_page == 1:  # MIDI settings
+            if i == 0:  # MIDI in device
+                midi_in_tmp_device_idx = self.app.midi_in_tmp_device_idx
+                midi_in = self.app.midi_in
+                if midi_in_tmp_device_idx is not None:
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
+                    if midi_in_tmp_device_idx < 0:
+                        name = "None"
+                    else:
+                        name = "{0} {1}".format(midi_in_tmp_device_idx + 1, self.app.available_midi_in_device_names[midi_in_tmp_device_idx])
+                else:
+                    if midi_in is not None:
+                        name = "{0} {1}".format(self.app.available_midi_in_device_names.index(midi_in.name) + 1, midi_in.name)
+                    else:
                         color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
-                    show_title(ctx, part_x, h, 'ROOT NOTE')
-                    show_value(ctx, part_x, h, "{0} ({1})".format(self.app.melodic_mode.note_number_to_name(
-                        self.app.melodic_mode.root_midi_note), self.app.melodic_mode.root_midi_note), color)
-
-                elif i == 1:  # Poly AT/channel AT
-                    show_title(ctx, part_x, h, 'AFTERTOUCH')
-                    show_value(ctx, part_x, h, 'polyAT' if self.app.melodic_mode.use_poly_at else 'channel', color)
-
-                elif i == 2:  # Channel AT range start
-                    if self.app.melodic_mode.last_time_at_params_edited is not None:
-                        color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
-                    show_title(ctx, part_x, h, 'cAT START')
-                    show_value(ctx, part_x, h, self.app.melodic_mode.channel_at_range_start, color)
-
-                elif i == 3:  # Channel AT range end
-                    if self.app.melodic_mode.last_time_at_params_edited is not None:
-                        color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
-                    show_title(ctx, part_x, h, 'cAT END')
-                    show_value(ctx, part_x, h, self.app.melodic_mode.channel_at_range_end, color)
-
-                elif i == 4:  # Poly AT range
-                    if self.app.melodic_mode.last_time_at_params_edited is not None:
-                        color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
-                    show_title(ctx, part_x, h, 'pAT RANGE')
-                    show_value(ctx, part_x, h, self.app.melodic_mode.poly_at_max_range, color)
-
-                elif i == 5:  # Poly AT curve
-                    if self.app.melodic_mode.last_time_at_params_edited is not None:
-                        color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
-                    show_title(ctx, part_x, h, 'pAT CURVE')
-                    show_value(ctx, part_x, h, self.app.melodic_mode.poly_at_curve_bending, color)
-
-            elif self.current_page == 1:  # MIDI settings
-                if i == 0:  # MIDI in device
-                    if self.app.midi_in_tmp_device_idx is not None:
-                        color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
-                        if self.app.midi_in_tmp_device_idx < 0:
-                            name = "None"
-                        else:
-                            name = "{0} {1}".format(self.app.midi_in_tmp_device_idx + 1, self.app.available_midi_in_device_names[self.app.midi_in_tmp_device_idx])
+                        name = "None"
+                return ('IN DEVICE', name, color, ())
+
+            elif i == 1:  # MIDI in channel
+                if self.app.midi_in is None:
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
+                midi_in_channel = self.app.midi_in_channel
+                return ('IN CH', midi_in_channel + 1 if midi_in_channel > -1 else "All", color, ())
+
+            elif i == 2:  # MIDI out device
+                midi_out_tmp_device_idx = self.app.midi_out_tmp_device_idx
+                midi_out = self.app.midi_out
+                if midi_out_tmp_device_idx is not None:
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
+                    if midi_out_tmp_device_idx < 0:
+                        name = "None"
+                    else:
+                        name = "{0} {1}".format(midi_out_tmp_device_idx + 1, self.app.available_midi_out_device_names[midi_out_tmp_device_idx])
+                else:
+                    if midi_out is not None:
+                        name = "{0} {1}".format(self.app.available_midi_out_device_names.index(midi_out.name) + 1, midi_out.name)
                     else:
-                        if self.app.midi_in is not None:
-                            name = "{0} {1}".format(self.app.available_midi_in_device_names.index(self.app.midi_in.name) + 1, self.app.midi_in.name)
-                        else:
-                            color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
-                            name = "None"
-                    show_title(ctx, part_x, h, 'IN DEVICE')
-                    show_value(ctx, part_x, h, name, color)
-
-                elif i == 1:  # MIDI in channel
-                    if self.app.midi_in is None:
                         color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
-                    show_title(ctx, part_x, h, 'IN CH')
-                    show_value(ctx, part_x, h, self.app.midi_in_channel + 1 if self.app.midi_in_channel > -1 else "All", color)
-
-                elif i == 2:  # MIDI out device
-                    if self.app.midi_out_tmp_device_idx is not None:
-                        color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
-                        if self.app.midi_out_tmp_device_idx < 0:
-                            name = "None"
-                        else:
-                            name = "{0} {1}".format(self.app.midi_out_tmp_device_idx + 1, self.app.available_midi_out_device_names[self.app.midi_out_tmp_device_idx])
+                        name = "None"
+                return ('OUT DEVICE', name, color, ())
+
+            elif i == 3:  # MIDI out channel
+                if self.app.midi_out is None:
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
+                midi_out_channel = self.app.midi_out_channel
+                return ('OUT CH', midi_out_channel + 1 if midi_out_channel >= 0 else 'TR', color, ())
+
+            elif i == 4:  # Pyramidi out channel
+                return ('PYRAMIDI CH', self.app.track_selection_mode.pyramidi_channel + 1, color, ())
+
+            elif i == 5:  # Notes MIDI in device
+                notes_midi_in_tmp_device_idx = self.app.notes_midi_in_tmp_device_idx
+                notes_midi_in = self.app.notes_midi_in
+                if notes_midi_in_tmp_device_idx is not None:
+                    color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
+                    if notes_midi_in_tmp_device_idx < 0:
+                        name = "None"
+                    else:
+                        name = "{0} {1}".format(notes_midi_in_tmp_device_idx + 1, self.app.available_midi_in_device_names[notes_midi_in_tmp_device_idx])
+                else:
+                    if notes_midi_in is not None:
+                        name = "{0} {1}".format(self.app.available_midi_in_device_names.index(notes_midi_in.name) + 1, notes_midi_in.name)
                     else:
-                        if self.app.midi_out is not None:
-                            name = "{0} {1}".format(self.app.available_midi_out_device_names.index(self.app.midi_out.name) + 1, self.app.midi_out.name)
-                        else:
-                            color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
-                            name = "None"
-                    show_title(ctx, part_x, h, 'OUT DEVICE')
-                    show_value(ctx, part_x, h, name, color)
-
-                elif i == 3:  # MIDI out channel
-                    if self.app.midi_out is None:
                         color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
-                    show_title(ctx, part_x, h, 'OUT CH')
-                    show_value(ctx, part_x, h, self.app.midi_out_channel + 1 if self.app.midi_out_channel >= 0 else 'TR', color)
+                        name = "None"
+                return ('NOTES IN', name, color, ())
+
+            elif i == 6:  # Re-send MIDI connection established (to push, not MIDI in/out device)
+                return ('RESET MIDI', None, color, ())
+
+        elif current_page == 2:  # About
+            if i == 0:  # Save button
+                return ('SAVE', None, color, ())
+
+            elif i ==1: # definitions.VERSION info
+                return ('VERSION', 'Pysha ' + definitions.VERSION, color, ())
+
+            elif i == 2:  # Software update
+                return ('SW UPDATE', 'Running... ' if self.is_running_sw_update else None, color, ())
+
+            else:  # Stats
+                return self.get_stats_part_contents(i, color)
+
+        return None
+
+    def get_stats_part_contents(self, i, color):
+        # Stats shown in the About page change continuously (e.g. number of frames sent). They are only updated every
+        # ABOUT_PAGE_STATS_UPDATE_INTERVAL seconds so that About page frames are identical (and not sent) in between
+        now = time.time()
+        if now - self.stats_parts_time >= definitions.ABOUT_PAGE_STATS_UPDATE_INTERVAL:
+            self.stats_parts = {j: self.compute_stats_part_contents(j, color) for j in range(3, 8)}
+            self.stats_parts_time = now
+        return self.stats_parts.get(i, None)
+
+    def compute_stats_part_contents(self, i, color):
+        if i == 3:  # FPS indicator
+            governor = self.app.frame_rate_governor
+            return ('FPS', self.app.actual_frame_rate, color, (
+                'Target: {0} ({1})'.format(governor.effective_frame_rate, 'idle' if governor.is_idle else 'active'),
+                'Sent: {0}'.format(self.app.display_pipeline.frames_sent),
+                'Skip: {0} Drop: {1}'.format(self.app.display_pipeline.frames_skipped, self.app.display_pipeline.frames_dropped),
+            ))
+
+        elif i == 4:  # Text cache stats
+            stats = text_cache.get_stats()
+            n_requests = stats['hits'] + stats['misses']
+            return ('TEXT CACHE', '{0}% hits'.format(int(100 * stats['hits'] / n_requests) if n_requests else 0), color, (
+                'Tiles: {0}'.format(stats['n_tiles']),
+                'Memory: {0} KB'.format(stats['n_bytes'] // 1024),
+            ))
+
+        elif i == 5:  # Frame lateness stats (time between the deadline of a frame and the moment it started)
+            stats = self.app.display_pipeline.render_scheduler.get_stats()
+            return ('LATENESS', '{0:.1f} ms'.format(stats['p95'] * 1000), color, (
+                'p50: {0:.1f} p99: {1:.1f}'.format(stats['p50'] * 1000, stats['p99'] * 1000),
+                'Max: {0:.1f} ms'.format(stats['max'] * 1000),
+                'Missed: {0}'.format(stats['missed']),
+            ))
+
+        elif i == 6:  # Render quality
+            controller = self.app.render_quality_controller
+            return ('QUALITY', definitions.RENDER_QUALITY_NAMES[controller.level], color, (
+                'Manual' if controller.manual_level is not None else 'Auto',
+                'Render: {0:.1f} ms'.format(controller.average_render_time * 1000),
+            ))
+
+        elif i == 7:  # LED output stats
+            stats = self.app.leds.scheduler.get_stats()
+            return ('LEDS', '{0} queued'.format(stats['queue_depth']), color, (
+                'Sent: {0}'.format(stats['sent']),
+                'Dropped: {0}'.format(stats['dropped']),
+                'Deferred: {0}'.format(stats['deferred']),
+            ))
+
+        return None
+
+    def draw_part(self, ctx, x_part, contents):
+        h = push2_python.constants.DISPLAY_N_LINES
+        part_x = x_part * (push2_python.constants.DISPLAY_LINE_PIXELS // 8)
+        title, value, color, info_lines = contents
+        show_title(ctx, part_x, h, title)
+        if value is not None:
+            show_value(ctx, part_x, h, value, color)
+        for count, line in enumerate(info_lines):
+            draw_text_at(ctx, part_x + 3, 62 + count * 13, line, font_size=12)
+
+    def get_latest_values_lines(self):
+        # Returns the latest AT/velocity values received in the last 3 seconds (only shown in performance settings page)
+        if self.current_page != 0:
+            return None
+        channel_at_line = None
+        velocity_line = None
+        current_time = time.time()
+        # Values are (time, value) tuples replaced by the MIDI thread, read each of them once
+        use_poly_at = self.app.melodic_mode.use_poly_at
+        latest_channel_at_time, latest_channel_at_value = self.app.melodic_mode.latest_channel_at_value
+        latest_poly_at_time, latest_poly_at_value = self.app.melodic_mode.latest_poly_at_value
+        latest_velocity_time, latest_velocity_value = self.app.melodic_mode.latest_velocity_value
+        if current_time - latest_channel_at_time < 3 and not use_poly_at:
+            # Lastest channel AT value received less than 3 seconds ago
+            channel_at_line = f'Latest cAT: {latest_channel_at_value}'
+        if current_time - latest_poly_at_time < 3 and use_poly_at:
+            # Lastest poly AT value received less than 3 seconds ago
+            channel_at_line = f'Latest pAT: {latest_poly_at_value}'
+        if current_time - latest_velocity_time < 3:
+            # Lastest note on velocity value received less than 3 seconds ago
+            velocity_line = f'Latest velocity: {latest_velocity_value}'
+        return (channel_at_line, velocity_line)
+
+    def draw_latest_values(self, ctx, x_part, lines):
+        h = push2_python.constants.DISPLAY_N_LINES
+        channel_at_line, velocity_line = lines
+        if channel_at_line is not None:
+            draw_text_at(ctx, 3, h - 3, channel_at_line, font_size=20)
+        if velocity_line is not None:
+            draw_text_at(ctx, 3, h - 26, velocity_line, font_size=20)
+
+    def get_poly_at_curve_params(self):
+        # polyAT velocity curve is only shown in performance settings page
+        if self.current_page != 0:
+            return None
+        return (self.app.melodic_mode.poly_at_max_range, self.app.melodic_mode.poly_at_curve_bending)
 
-                elif i == 4:  # Pyramidi out channel
-                    show_title(ctx, part_x, h, 'PYRAMIDI CH')
-                    show_value(ctx, part_x, h, self.app.track_selection_mode.pyramidi_channel + 1, color)
-                
-                elif i == 5:  # Notes MIDI in device
-                    if self.app.notes_midi_in_tmp_device_idx is not None:
-                        color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DELAYED_ACTIONS)
-                        if self.app.notes_midi_in_tmp_device_idx < 0:
-                            name = "None"
-                        else:
-                            name = "{0} {1}".format(self.app.notes_midi_in_tmp_device_idx + 1, self.app.available_midi_in_device_names[self.app.notes_midi_in_tmp_device_idx])
-                    else:
-                        if self.app.notes_midi_in is not None:
-                            name = "{0} {1}".format(self.app.available_midi_in_device_names.index(self.app.notes_midi_in.name) + 1, self.app.notes_midi_in.name)
-                        else:
-                            color = definitions.get_color_rgb_float(definitions.FONT_COLOR_DISABLED)
-                            name = "None"
-                    show_title(ctx, part_x, h, 'NOTES IN')
-                    show_value(ctx, part_x, h, name, color)
-
-                elif i == 6:  # Re-send MIDI connection established (to push, not MIDI in/out device)
-                    show_title(ctx, part_x, h, 'RESET MIDI')
-
-            elif self.current_page == 2:  # About
-                if i == 0:  # Save button
-                    show_title(ctx, part_x, h, 'SAVE')
-
-                elif i ==1: # definitions.VERSION info
-                    show_title(ctx, part_x, h, 'VERSION')
-                    show_value(ctx, part_x, h, 'Pysha ' + definitions.VERSION, color)
-
-                elif i == 2:  # Software update
-                    show_title(ctx, part_x, h, 'SW UPDATE')
-                    if self.is_running_sw_update:
-                        show_value(ctx, part_x, h, 'Running... ', color)
-                
-                elif i == 3:  # FPS indicator
-                    show_title(ctx, part_x, h, 'FPS')
-                    show_value(ctx, part_x, h, self.app.actual_frame_rate, color)
+    def update_display(self, ctx, w, h):
 
-        # After drawing all labels and values, draw other stuff if required
-        if self.current_page == 0:  # Performance settings
+        # Draw black background to cover anything drawn by other modes
+        ctx.set_source_rgb(0, 0, 0)
+        ctx.rectangle(0, 0, w, h)
+        ctx.fill()
 
-            # Draw polyAT velocity curve
-            ctx.set_source_rgb(0.6, 0.6, 0.6)
-            ctx.set_line_width(1)
-            data = self.app.melodic_mode.get_poly_at_curve()
-            n = len(data)
-            curve_x = 4 * part_w + 3  # Start x point of curve
-            curve_y = part_h - 10  # Start y point of curve
-            curve_height = 50
-            curve_length = part_w * 4 - 6
-            ctx.move_to(curve_x, curve_y)
-            for i, value in enumerate(data):
-                x = curve_x + i * curve_length/n
-                y = curve_y - curve_height * value/127
-                ctx.line_to(x, y)
-            ctx.line_to(x, curve_y)
-            ctx.fill()
-
-            current_time = time.time()
-            if current_time - self.app.melodic_mode.latest_channel_at_value[0] < 3 and not self.app.melodic_mode.use_poly_at:
-                # Lastest channel AT value received less than 3 seconds ago
-                draw_text_at(ctx, 3, part_h - 3, f'Latest cAT: {self.app.melodic_mode.latest_channel_at_value[1]}', font_size=20)
-            if current_time - self.app.melodic_mode.latest_poly_at_value[0] < 3 and self.app.melodic_mode.use_poly_at:
-                # Lastest channel AT value received less than 3 seconds ago
-                draw_text_at(ctx, 3, part_h - 3, f'Latest pAT: {self.app.melodic_mode.latest_poly_at_value[1]}', font_size=20)
-            if current_time - self.app.melodic_mode.latest_velocity_value[0] < 3:
-                # Lastest note on velocity value received less than 3 seconds ago
-                draw_text_at(ctx, 3, part_h - 26, f'Latest velocity: {self.app.melodic_mode.latest_velocity_value[1]}', font_size=20)
+        # Draw labels, values and other stuff (widgets are only re-rendered if their contents changed)
+        self.widgets.draw(ctx)
 
 
     def on_encoder_rotated(self, encoder_name, increment):
@@ -306,11 +396,11 @@ class SettingsMode(definitions.PyshaMode):
                 if increment >= 3:  # Only respond to "big" increments
                     if not self.app.melodic_mode.use_poly_at:
                         self.app.melodic_mode.use_poly_at = True
-                        self.app.push.pads.set_polyphonic_aftertouch()
+                        self.app.push_state.set_polyphonic_aftertouch()
                 elif increment <= -3:
                     if self.app.melodic_mode.use_poly_at:
                         self.app.melodic_mode.use_poly_at = False
-                        self.app.push.pads.set_channel_aftertouch()
+                        self.app.push_state.set_channel_aftertouch()
                 self.app.melodic_mode.set_lumi_pressure_mode()
 
             elif encoder_name == push2_python.constants.ENCODER_TRACK3_ENCODER:
@@ -325,6 +415,16 @@ class SettingsMode(definitions.PyshaMode):
             elif encoder_name == push2_python.constants.ENCODER_TRACK6_ENCODER:
                 self.app.melodic_mode.set_poly_at_curve_bending(self.app.melodic_mode.poly_at_curve_bending + increment)
 
+            elif encoder_name == push2_python.constants.ENCODER_TRACK7_ENCODER:
+                if abs(increment) >= 3:  # Only respond to "big" increments
+                    self.app.melodic_mode.rotate_scale(1 if increment > 0 else -1)
+                    self.app.pads_need_update = True
+
+            elif encoder_name == push2_python.constants.ENCODER_TRACK8_ENCODER:
+                if abs(increment) >= 3:  # Only respond to "big" increments
+                    self.app.melodic_mode.rotate_row_interval(1 if increment > 0 else -1)
+                    self.app.pads_need_update = True
+
         elif self.current_page == 1:  # MIDI settings
             if encoder_name == push2_python.constants.ENCODER_TRACK1_ENCODER:
                 if self.app.midi_in_tmp_device_idx is None:
@@ -387,12 +487,22 @@ class SettingsMode(definitions.PyshaMode):
             elif button_name == push2_python.constants.BUTTON_UPPER_ROW_2:
                 self.app.melodic_mode.use_poly_at = not self.app.melodic_mode.use_poly_at
                 if self.app.melodic_mode.use_poly_at:
-                    self.app.push.pads.set_polyphonic_aftertouch()
+                    self.app.push_state.set_polyphonic_aftertouch()
                 else:
-                    self.app.push.pads.set_channel_aftertouch()
+                    self.app.push_state.set_channel_aftertouch()
                 self.app.melodic_mode.set_lumi_pressure_mode()
                 return True
 
+            elif button_name == push2_python.constants.BUTTON_UPPER_ROW_7:
+                self.app.melodic_mode.in_key = not self.app.melodic_mode.in_key
+                self.app.pads_need_update = True
+                return True
+
+            elif button_name == push2_python.constants.BUTTON_UPPER_ROW_8:
+                self.app.melodic_mode.rotate_row_interval()
+                self.app.pads_need_update = True
+                return True
+
         elif self.current_page == 1:  # MIDI settings
             if button_name == push2_python.constants.BUTTON_UPPER_ROW_1:
                 if self.app.midi_in_tmp_device_idx is None:
@@ -449,7 +559,7 @@ class SettingsMode(definitions.PyshaMode):
                 return True
 
             elif button_name == push2_python.constants.BUTTON_UPPER_ROW_7:
-                self.app.on_midi_push_connection_established()
+                self.app.on_midi_push_connection_established(full_restore=True)
                 return True
 
         elif self.current_page == 2:  # About
@@ -464,6 +574,11 @@ class SettingsMode(definitions.PyshaMode):
                 run_sw_update()
                 return True
 
+            elif button_name == push2_python.constants.BUTTON_UPPER_ROW_7:
+                # Rotate render quality between automatic and manual levels
+                self.app.render_quality_controller.rotate_manual_level()
+                return True
+
 
 def restart_program():
     """Restarts the current program, with file objects and descriptors cleanup
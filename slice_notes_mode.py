@@ -1,4 +1,5 @@
 import definitions
+import pad_layouts
 import push2_python.constants
 
 from melodic_mode import MelodicMode
@@ -24,24 +25,19 @@ class SliceNotesMode(MelodicMode):
     def pad_ij_to_midi_note(self, pad_ij):
         return self.start_note + 8 * (7 - pad_ij[0]) + pad_ij[1]
 
-    def update_pads(self):
-        color_matrix = []
-        for i in range(0, 8):
-            row_colors = []
-            for j in range(0, 8):
-                corresponding_midi_note = self.pad_ij_to_midi_note([i, j])
-                midi_16_note_groups_idx = corresponding_midi_note // 16
-                #cell_color = self.color_groups[midi_16_note_groups_idx]
-                if midi_16_note_groups_idx % 2 == 0:
-                    cell_color = self.app.track_selection_mode.get_current_track_color()
-                else:
-                    cell_color = definitions.WHITE
-                if self.is_midi_note_being_played(corresponding_midi_note):
-                    cell_color = definitions.NOTE_ON_COLOR
-                row_colors.append(cell_color)
-            color_matrix.append(row_colors)
+    def get_layout_key(self):
+        return (self.start_note, )
 
-        self.push.pads.set_pads_color(color_matrix)
+    def compile_layout_tables(self):
+        return pad_layouts.compile_layout_tables(self.pad_ij_to_midi_note, self.get_pad_class)
+
+    def get_pad_class(self, pad_ij, midi_note):
+        # Notes are shown in groups of 16 with alternating colors
+        midi_16_note_groups_idx = midi_note // 16
+        return midi_16_note_groups_idx % 2
+
+    def get_pad_class_colors(self):
+        return [self.app.track_selection_mode.get_current_track_color(), definitions.WHITE]
 
     def on_button_pressed(self, button_name):
 
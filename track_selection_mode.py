@@ -6,7 +6,7 @@ import math
 import os
 import json
 
-from display_utils import show_text
+from widgets import WidgetGroup, LabelWidget
 
 
 class TrackSelectionMode(definitions.PyshaMode):
@@ -37,12 +37,31 @@ class TrackSelectionMode(definitions.PyshaMode):
     selected_track = 0
     track_selection_quick_press_time = 0.400
     pyramidi_channel = 15
+    widgets = None
 
     def initialize(self, settings=None):
         if settings is not None:
             self.pyramidi_channel = settings.get('pyramidi_channel', self.pyramidi_channel)
         
         self.create_tracks()
+        self.create_widgets()
+
+    def create_widgets(self):
+        height = 20
+        self.widgets = WidgetGroup()
+        for i in range(0, 8):
+            self.widgets.add(LabelWidget(i, push2_python.constants.DISPLAY_N_LINES - height, height, bind=lambda i=i: self.get_track_label_state(i)))
+
+    def get_track_label_state(self, i):
+        track_info = self.tracks_info[i]
+        track_color = track_info['color']
+        if self.selected_track % 8 == i:
+            background_color = track_color
+            font_color = definitions.BLACK
+        else:
+            background_color = definitions.BLACK
+            font_color = track_color
+        return (track_info['instrument_short_name'], font_color, background_color)
 
     def create_tracks(self):
         """This method creates 64 tracks corresponding to the Pyramid tracks that I use in my live setup.
@@ -65,6 +84,9 @@ class TrackSelectionMode(definitions.PyshaMode):
                 else:
                     instrument_data = tmp_instruments_data[instrument_short_name]
                 color = instrument_data.get('color', None)
+                if isinstance(color, list):
+                    # Color given as [R, G, B] values
+                    color = definitions.rgb_to_custom_color_name(color)
                 if color is None:
                     if instrument_short_name != '-':
                         color = definitions.COLORS_NAMES[i % 8]
@@ -94,6 +116,7 @@ class TrackSelectionMode(definitions.PyshaMode):
                         'default_layout': definitions.LAYOUT_MELODIC,
                         'illuminate_local_notes': True,
                     })
+        self.app.invalidate_midi_out_channel()  # Track MIDI channels might have changed
 
     def get_settings_to_save(self):
         return {
@@ -134,10 +157,9 @@ class TrackSelectionMode(definitions.PyshaMode):
             self.app.set_slice_notes_mode()
 
     def clean_currently_notes_being_played(self):
-        if self.app.is_mode_active(self.app.melodic_mode):
-            self.app.melodic_mode.remove_all_notes_being_played()
-        elif self.app.is_mode_active(self.app.rhyhtmic_mode):
-            self.app.rhyhtmic_mode.remove_all_notes_being_played()
+        # Each of these modes stores its own notes being played, clear all of them (not only the active one)
+        for mode in [self.app.melodic_mode, self.app.rhyhtmic_mode, self.app.slice_notes_mode]:
+            mode.remove_all_notes_being_played()
 
     def send_select_track_to_pyramid(self, track_idx):
         # Follows pyramidi specification (Pyramid configured to receive on ch 16)
@@ -149,6 +171,7 @@ class TrackSelectionMode(definitions.PyshaMode):
         # Note that if this is called from a mode form the same xor group with melodic/rhythmic modes,
         # that other mode will be deactivated.
         self.selected_track = track_idx
+        self.app.invalidate_midi_out_channel()
         self.send_select_track_to_pyramid(self.selected_track)
         self.load_current_default_layout()
         self.clean_currently_notes_being_played()
@@ -166,47 +189,36 @@ class TrackSelectionMode(definitions.PyshaMode):
 
     def deactivate(self):
         for button_name in self.track_button_names_a + self.track_button_names_b:
-            self.push.buttons.set_button_color(button_name, definitions.BLACK)
+            self.app.leds.set_button_color(button_name, definitions.BLACK)
 
     def update_buttons(self):
         for count, name in enumerate(self.track_button_names_a):
             color = self.tracks_info[count]['color']
-            self.push.buttons.set_button_color(name, color)
+            self.app.leds.set_button_color(name, color)
 
         for count, name in enumerate(self.track_button_names_b):
             if self.track_selection_button_a:
                 color = self.tracks_info[self.track_button_names_a.index(self.track_selection_button_a)]['color']
                 equivalent_track_num = self.track_button_names_a.index(self.track_selection_button_a) + count * 8
                 if self.selected_track == equivalent_track_num:
-                    self.push.buttons.set_button_color(name, definitions.WHITE)
-                    self.push.buttons.set_button_color(name, color, animation=definitions.DEFAULT_ANIMATION)
+                    self.app.leds.set_button_color(name, definitions.WHITE)
+                    self.app.leds.set_button_color(name, color, animation=definitions.DEFAULT_ANIMATION)
                 else:
-                    self.push.buttons.set_button_color(name, color)
+                    self.app.leds.set_button_color(name, color)
             else:
                 color = self.get_current_track_color()
                 equivalent_track_num = (self.selected_track % 8) + count * 8
                 if self.selected_track == equivalent_track_num:
-                    self.push.buttons.set_button_color(name, definitions.WHITE)
-                    self.push.buttons.set_button_color(name, color, animation=definitions.DEFAULT_ANIMATION)
+                    self.app.leds.set_button_color(name, definitions.WHITE)
+                    self.app.leds.set_button_color(name, color, animation=definitions.DEFAULT_ANIMATION)
                 else:
-                    self.push.buttons.set_button_color(name, color)
+                    self.app.leds.set_button_color(name, color)
 
     def update_display(self, ctx, w, h):
 
-        # Draw track selector labels
-        height = 20
-        for i in range(0, 8):
-            track_color = self.tracks_info[i]['color']
-            if self.selected_track % 8 == i:
-                background_color = track_color
-                font_color = definitions.BLACK
-            else:
-                background_color = definitions.BLACK
-                font_color = track_color
-            instrument_short_name = self.tracks_info[i]['instrument_short_name']
-            show_text(ctx, i, h - height, instrument_short_name, height=height,
-                      font_color=font_color, background_color=background_color)
- 
+        # Draw track selector labels (widgets are only re-rendered if their contents changed)
+        self.widgets.draw(ctx)
+
     def on_button_pressed(self, button_name):
         if button_name in self.track_button_names_a:
             self.track_selection_button_a = button_name
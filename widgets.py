@@ -0,0 +1,166 @@
+import definitions
+import push2_python
+
+from display_utils import show_text, RecordingContext, apply_render_quality, get_render_quality, create_surface, set_source_color
+
+
+class Widget(object):
+    """Retained-mode display element placed in the 8-column grid of the Push2 display. A widget is bound to
+    a function that returns its current state (any hashable/comparable value). Widgets keep their rasterized
+    pixels in a small cached tile, and the tile is only redrawn when the bound state changes. If bound state
+    is None, the widget is not drawn at all.
+    Widget subclasses implement "draw_contents", which draws the widget using absolute display coordinates (the
+    tile context is translated so that existing drawing helpers like "show_text" can be used unchanged).
+    """
+
+    def __init__(self, x_part, y, height, bind, n_parts=1):
+        assert 0 <= x_part < 8
+        assert 0 < n_parts <= 8 - x_part
+        part_w = push2_python.constants.DISPLAY_LINE_PIXELS // 8
+        self.x_part = x_part
+        self.x = part_w * x_part
+        self.y = y
+        self.width = part_w * n_parts
+        self.height = height
+        self.bind = bind
+        self.state = None
+        self.render_quality = None
+        self.is_valid = False
+        self.tile, self.tile_ctx = create_surface(self.width, self.height)
+
+    def invalidate(self):
+        self.is_valid = False
+
+    def draw_contents(self, ctx, state):
+        pass
+
+    def render_tile(self, state):
+        ctx = self.tile_ctx
+        ctx.save()
+        apply_render_quality(ctx, self.render_quality)
+        set_source_color(ctx, definitions.BLACK)
+        ctx.paint()
+        ctx.translate(-self.x, -self.y)
+        self.draw_contents(ctx, state)
+        ctx.restore()
+        self.tile.flush()
+
+    def draw(self, ctx):
+        state = self.bind()
+        if isinstance(ctx, RecordingContext):
+            # When recording drawing operations (see display_renderer), cached tiles can't be used
+            if state is not None:
+                ctx.save()
+                ctx.rectangle(self.x, self.y, self.width, self.height)
+                ctx.clip()
+                set_source_color(ctx, definitions.BLACK)
+                ctx.paint()
+                self.draw_contents(ctx, state)
+                ctx.restore()
+            return
+        render_quality = get_render_quality()
+        if not self.is_valid or state != self.state or render_quality != self.render_quality:
+            self.state = state
+            self.render_quality = render_quality
+            self.is_valid = True
+            if state is not None:
+                self.render_tile(state)
+        if state is not None:
+            # Blit cached tile
+            ctx.save()
+            ctx.set_source_surface(self.tile, self.x, self.y)
+            ctx.rectangle(self.x, self.y, self.width, self.height)
+            ctx.fill()
+            ctx.restore()
+
+
+class TileWidget(Widget):
+    """Generic widget drawn by a custom function with signature "draw_func(ctx, x_part, state)"."""
+
+    def __init__(self, x_part, y, height, bind, draw_func, n_parts=1):
+        super().__init__(x_part, y, height, bind, n_parts=n_parts)
+        self.draw_func = draw_func
+
+    def draw_contents(self, ctx, state):
+        self.draw_func(ctx, self.x_part, state)
+
+
+class LabelWidget(Widget):
+    """Text label drawn with "show_text". Bound function must return a (text, font_color, background_color)
+    tuple. Any other "show_text" parameters can be passed as keyword arguments.
+    """
+
+    def __init__(self, x_part, y, height, bind, **show_text_kwargs):
+        super().__init__(x_part, y, height, bind)
+        self.show_text_kwargs = show_text_kwargs
+
+    def draw_contents(self, ctx, state):
+        text, font_color, background_color = state
+        show_text(ctx, self.x_part, self.y, text, height=self.height, font_color=font_color, background_color=background_color, **self.show_text_kwargs)
+
+
+class KnobWidget(Widget):
+    """Knob of a MIDI CC control. Bound function must return a (control, value, color) tuple, control being an
+    object with a "draw(ctx, x_part)" method.
+    """
+
+    def draw_contents(self, ctx, state):
+        control, _, _ = state
+        control.draw(ctx, self.x_part)
+
+
+class CurveWidget(Widget):
+    """Filled curve spanning the widget area. Curve data is obtained by calling "get_data", which should return a
+    list of values in the [0, max_value] range. Bound function should return the parameters the curve depends on,
+    so curve data is only re-computed when these change.
+    """
+
+    margin_x = 3
+    margin_bottom = 10
+    margin_top = 10
+
+    def __init__(self, x_part, y, height, bind, get_data, max_value=127, color=[1, 1, 1], n_parts=1):
+        super().__init__(x_part, y, height, bind, n_parts=n_parts)
+        self.get_data = get_data
+        self.max_value = max_value
+        self.color = color
+
+    def draw_contents(self, ctx, state):
+        if get_render_quality() >= definitions.RENDER_QUALITY_LABELS_ONLY:
+            return
+        data = self.get_data()
+        n = len(data)
+        if n == 0:
+            return
+        ctx.set_source_rgb(*self.color)
+        ctx.set_line_width(1)
+        curve_x = self.x + self.margin_x
+        curve_y = self.y + self.height - self.margin_bottom
+        curve_height = self.height - self.margin_bottom - self.margin_top
+        curve_length = self.width - 2 * self.margin_x
+        ctx.move_to(curve_x, curve_y)
+        for i, value in enumerate(data):
+            x = curve_x + i * curve_length/n
+            y = curve_y - curve_height * value/self.max_value
+            ctx.line_to(x, y)
+        ctx.line_to(x, curve_y)
+        ctx.fill()
+
+
+class WidgetGroup(object):
+    """Collection of widgets that are composited together in the order they were added."""
+
+    def __init__(self, widgets=None):
+        self.widgets = list(widgets) if widgets is not None else []
+
+    def add(self, widget):
+        self.widgets.append(widget)
+        return widget
+
+    def invalidate(self):
+        for widget in self.widgets:
+            widget.invalidate()
+
+    def draw(self, ctx):
+        for widget in self.widgets:
+            widget.draw(ctx)